@@ -7,6 +7,8 @@ from layouts.index import *
 # ------------------------------------------------------------------------
 app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 app.title = "Databricks Excel Uploader"
+# WSGI entry point for the production server (gunicorn app:server)
+server = app.server
 
 
 # ------------------------------------------------------------------------
@@ -21,7 +23,11 @@ app.layout = dbc.Container(
         action_preview_card,
         toast_notifications,
         uploaded_dataframe,
-        uploaded_file_path,
+        upload_meta,
+        upload_artifacts,
+        write_job,
+        preview_source,
+        page_location,
     ],
     fluid=True,
     className="p-4",
@@ -29,13 +35,18 @@ app.layout = dbc.Container(
 )
 
 from callbacks.uploader_callbacks import register_callbacks
+from metrics import register_metrics_route
+from upload_routes import register_upload_routes
 
 register_callbacks(app)
+register_upload_routes(app.server)
+register_metrics_route(app.server)
 
 
 
 # ------------------------------------------------------------------------
-# Run app
+# Run app — the Flask dev server, for local development only. In production
+# it runs under gunicorn with several workers (see gunicorn.conf.py).
 # ------------------------------------------------------------------------
 if __name__ == "__main__":
     app.run(debug=True, port=8050)
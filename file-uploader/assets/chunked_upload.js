@@ -0,0 +1,156 @@
+// ------------------------------------------------------------------------
+// Chunked, resumable uploads for the "upload-input" file picker.
+// Slices each selected file and PUTs each chunk to /api/uploads/<id>,
+// reporting progress to Dash through dash_clientside.set_props.
+// ------------------------------------------------------------------------
+(function () {
+    const MAX_RETRIES = 5;
+    // Files uploaded at the same time when several are selected
+    const PARALLEL_FILES = 3;
+
+    // One temp-storage session per browser tab; the server keeps its files together
+    function sessionId() {
+        let id = window.sessionStorage.getItem("upload-session-id");
+        if (!id) {
+            id = Array.from(window.crypto.getRandomValues(new Uint8Array(16)),
+                (b) => b.toString(16).padStart(2, "0")).join("");
+            window.sessionStorage.setItem("upload-session-id", id);
+        }
+        return id;
+    }
+
+    function setProps(id, props) {
+        if (window.dash_clientside && window.dash_clientside.set_props) {
+            window.dash_clientside.set_props(id, props);
+        }
+    }
+
+    function reportProgress(label, received, size) {
+        const pct = size ? Math.floor((100 * received) / size) : 100;
+        setProps("upload-progress", { value: pct, label: `${pct}%` });
+        setProps("upload-status", { children: `Uploading ${label} — ${pct}%` });
+    }
+
+    async function json(response) {
+        const body = await response.json().catch(() => ({}));
+        return { ok: response.ok, status: response.status, body };
+    }
+
+    async function sendChunk(uploadId, file, offset, chunkSize) {
+        const chunk = file.slice(offset, offset + chunkSize);
+        const res = await fetch(`/api/uploads/${uploadId}?offset=${offset}`, {
+            method: "PUT",
+            headers: { "Content-Type": "application/octet-stream" },
+            body: chunk,
+        });
+        return json(res);
+    }
+
+    async function uploadFile(file, onProgress) {
+        const created = await json(await fetch("/api/uploads", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ filename: file.name, size: file.size, session_id: sessionId() }),
+        }));
+        if (!created.ok) {
+            throw new Error(created.body.error || `Upload rejected (${created.status})`);
+        }
+
+        const { upload_id: uploadId, chunk_size: chunkSize } = created.body;
+        let received = 0;
+        let retries = 0;
+
+        while (received < file.size) {
+            let result;
+            try {
+                result = await sendChunk(uploadId, file, received, chunkSize);
+            } catch (err) {
+                result = { ok: false, status: 0, body: {} };
+            }
+
+            if (result.ok || result.status === 409) {
+                // 409 means the server already has more (or less) than we thought — resume from its offset
+                received = result.body.received;
+                retries = result.ok ? 0 : retries;
+            } else {
+                retries += 1;
+                if (retries > MAX_RETRIES) {
+                    throw new Error(result.body.error || "Upload failed after repeated retries");
+                }
+                // Ask the server where to resume before retrying
+                const status = await json(await fetch(`/api/uploads/${uploadId}`));
+                if (status.ok) {
+                    received = status.body.received;
+                }
+                await new Promise((r) => setTimeout(r, 500 * retries));
+            }
+            onProgress(received);
+        }
+
+        return { upload_id: uploadId, filename: file.name, size: file.size };
+    }
+
+    async function handleFiles(fileList) {
+        const files = Array.from(fileList || []);
+        if (!files.length) {
+            return;
+        }
+        const label = files.length === 1 ? `'${files[0].name}'` : `${files.length} files`;
+        const totalBytes = files.reduce((sum, f) => sum + f.size, 0);
+        const receivedByFile = new Array(files.length).fill(0);
+        const uploaded = [];
+        const failed = [];
+
+        setProps("upload-progress", { value: 0, label: "0%" });
+
+        // Small worker pool so a batch of files uploads a few at a time
+        let next = 0;
+        async function worker() {
+            while (next < files.length) {
+                const index = next++;
+                const file = files[index];
+                try {
+                    const meta = await uploadFile(file, (received) => {
+                        receivedByFile[index] = received;
+                        const total = receivedByFile.reduce((a, b) => a + b, 0);
+                        reportProgress(label, total, totalBytes);
+                    });
+                    uploaded.push({ index, meta });
+                } catch (err) {
+                    failed.push({ filename: file.name, error: err.message });
+                }
+            }
+        }
+        await Promise.all(Array.from({ length: Math.min(PARALLEL_FILES, files.length) }, worker));
+
+        // Keep the user's selection order
+        uploaded.sort((a, b) => a.index - b.index);
+        const summary = failed.length
+            ? `Uploaded ${uploaded.length} of ${files.length} file(s); ❌ failed: ${failed.map((f) => f.filename).join(", ")}`
+            : `Uploaded ${label}`;
+        setProps("upload-status", { children: summary });
+        if (uploaded.length) {
+            setProps("upload-meta", { data: { files: uploaded.map((u) => u.meta), failed } });
+        }
+    }
+
+    document.addEventListener("change", (event) => {
+        if (event.target && event.target.id === "upload-input") {
+            handleFiles(event.target.files);
+            event.target.value = "";
+        }
+    });
+
+    document.addEventListener("dragover", (event) => {
+        if (event.target.closest && event.target.closest("#upload-dropzone")) {
+            event.preventDefault();
+        }
+    });
+
+    document.addEventListener("drop", (event) => {
+        if (event.target.closest && event.target.closest("#upload-dropzone")) {
+            event.preventDefault();
+            handleFiles(event.dataTransfer.files);
+        }
+    });
+})();
@@ -0,0 +1,359 @@
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import ContextManager, Protocol, runtime_checkable
+
+from connection_pool import ConnectionPool
+
+
+# ------------------------------------------------------------------------
+# SQL backends.
+# databricks_funcs only needs ``cursor()`` (a context manager yielding a
+# DB-API style cursor with fetchall_arrow/fetchone), ``stats()`` and ``close()``.
+# ConnectionPool provides that against a real SQL warehouse; LocalBackend
+# provides it against an embedded DuckDB so the pipeline can be exercised and
+# benchmarked offline. UPLOADER_BACKEND picks one.
+# ------------------------------------------------------------------------
+BACKENDS = ("databricks", "local")
+BACKEND = os.getenv("UPLOADER_BACKEND", "databricks").lower()
+
+
+@runtime_checkable
+class SQLBackend(Protocol):
+    """What databricks_funcs needs from a backend; ConnectionPool and LocalBackend both match it."""
+
+    def cursor(self) -> ContextManager:
+        """Context manager yielding a DB-API style cursor."""
+
+    def stats(self) -> dict:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+# ------------------------------------------------------------------------
+# Databricks SQL -> DuckDB translation for the statements this app issues
+# ------------------------------------------------------------------------
+_SHOW_CATALOGS = re.compile(r"^\s*show\s+catalogs\s*;?\s*$", re.I)
+_SHOW_SCHEMAS = re.compile(r"^\s*show\s+schemas\s+in\s+(\w+)\s*;?\s*$", re.I)
+_SHOW_TABLES = re.compile(r"^\s*show\s+tables\s+in\s+(\w+)\.(\w+)\s*;?\s*$", re.I)
+_SHOW_COLUMNS = re.compile(r"^\s*show\s+columns\s+in\s+(\w+)\.(\w+)\.(\w+)\s*;?\s*$", re.I)
+_DESCRIBE = re.compile(r"^\s*describe\s+table\s+(\w+)\.(\w+)\.(\w+)\s*;?\s*$", re.I)
+_PUT = re.compile(r"^\s*put\s+'([^']+)'\s+into\s+'([^']+)'(\s+overwrite)?\s*;?\s*$", re.I)
+_LIST = re.compile(r"^\s*list\s+'([^']+)'\s*;?\s*$", re.I)
+_REMOVE = re.compile(r"^\s*remove\s+'([^']+)'\s*;?\s*$", re.I)
+_BRACES = re.compile(r"\{([^{}]*)\}")
+_TRUNCATE = re.compile(r"^\s*truncate\s+table\s+([\w.]+)\s*;?\s*$", re.I)
+_INSERT_OVERWRITE = re.compile(r"^\s*INSERT\s+OVERWRITE\s+(?:TABLE\s+)?(?P<target>[\w.]+)\s+(?P<query>SELECT\b.*)$", re.I | re.S)
+_REPLACE_WHERE = re.compile(
+    r"^\s*INSERT\s+INTO\s+(?P<target>[\w.]+)\s+REPLACE\s+WHERE\s+(?P<predicate>.*?)\s+(?P<query>SELECT\b.*)$",
+    re.I | re.S,
+)
+_READ_FILES = re.compile(r"read_files\('([^']+)',\s*format\s*=>\s*'(\w+)'(?:,\s*header\s*=>\s*true)?\)", re.I)
+_INFO_SCHEMA = re.compile(r"\b(\w+)\.information_schema\.", re.I)
+# Databricks' inline table (FROM VALUES ... AS v(cols)) and named parameter markers (:name)
+_INLINE_VALUES = re.compile(r"\bFROM\s+VALUES\s+(.*?)\s+AS\s+v\(", re.I | re.S)
+_PARAMETER = re.compile(r"(?<![:\w]):(p\d+_\d+)\b")
+# Both MERGE shapes write_planner.plan_merge emits: UPDATE SET * / INSERT *, and the
+# delete-marker form, whose source rows flagged by a boolean column delete their match
+_MERGE = re.compile(
+    r"^\s*MERGE\s+INTO\s+(?P<target>[\w.]+)\s+AS\s+t\s+USING\s+\((?P<source>.*)\)\s+AS\s+s\s+ON\s+(?P<on>.*?)\s+"
+    r"(?:WHEN\s+MATCHED\s+THEN\s+UPDATE\s+SET\s+\*\s+WHEN\s+NOT\s+MATCHED\s+THEN\s+INSERT\s+\*"
+    r"|WHEN\s+MATCHED\s+AND\s+(?P<flag>s\.`(?:[^`]|``)*`)\s+THEN\s+DELETE\s+"
+    r"WHEN\s+MATCHED\s+THEN\s+UPDATE\s+SET\s+.*?\s+"
+    r"WHEN\s+NOT\s+MATCHED\s+AND\s+NOT\s+(?P=flag)\s+THEN\s+INSERT\s+\((?P<columns>.*?)\)\s+VALUES\s+\((?P<values>.*)\))"
+    r"\s*;?\s*$",
+    re.I | re.S,
+)
+
+
+class _LocalCursor:
+    """Cursor wrapper that rewrites Databricks SQL into DuckDB and injects latency."""
+
+    def __init__(self, backend, raw):
+        self._backend = backend
+        self._raw = raw
+        self._result = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._raw.close()
+
+    def execute(self, query: str, parameters=None):
+        kind = query.split(None, 1)[0].lower() if query.strip() else "empty"
+        self._backend._record(kind)
+        latency = self._backend.latency_s
+
+        put = _PUT.match(query)
+        if put:
+            latency += self._backend._put_latency(put.group(1))
+            time.sleep(latency)
+            self._backend.put(put.group(1), put.group(2))
+            self._result = None
+            return self
+
+        time.sleep(latency)
+        listing = _LIST.match(query)
+        if listing:
+            self._result = None
+            self._raw.execute(self._backend.list_sql(listing.group(1)))
+            return self
+        remove = _REMOVE.match(query)
+        if remove:
+            self._backend.remove(remove.group(1))
+            self._result = []
+            return self
+
+        merge = _MERGE.match(query)
+        if merge:
+            self._merge(merge, parameters)
+            return self
+        replace = _INSERT_OVERWRITE.match(query) or _REPLACE_WHERE.match(query)
+        if replace:
+            self._replace(replace, parameters)
+            return self
+
+        self._raw.execute(self._translate(query), parameters)
+        return self
+
+    def _source(self, sql: str):
+        sql = _INLINE_VALUES.sub(lambda m: f"FROM (VALUES {m.group(1)}) AS v(", sql)
+        return _quote_identifiers(_PARAMETER.sub(r"$\1", self._backend.translate_read_files(sql)))
+
+    def _merge(self, match, parameters=None):
+        # DELETE every matched row, then INSERT the rows that survive the MERGE: for a
+        # key-unique source that is the same as UPDATE on match / INSERT otherwise
+        source = self._source(match.group("source"))
+        on = _quote_identifiers(match.group("on"))
+        target = match.group("target")
+        flag = match.group("flag")
+        self._raw.execute("BEGIN TRANSACTION")
+        try:
+            # Whether each source row matches has to be known before the DELETE removes its match
+            self._raw.execute(
+                f"CREATE OR REPLACE TEMP TABLE __merge_source AS SELECT s.*, "
+                f"EXISTS (SELECT 1 FROM {target} AS t WHERE {on}) AS __matched FROM ({source}) AS s",
+                parameters,
+            )
+            self._raw.execute(f"DELETE FROM {target} AS t WHERE EXISTS (SELECT 1 FROM __merge_source AS s WHERE {on})")
+            if flag is None:
+                self._raw.execute(f"INSERT INTO {target} SELECT * EXCLUDE (__matched) FROM __merge_source")
+                self._raw.execute("SELECT count(*) FROM __merge_source")
+            else:
+                flag = _quote_identifiers(flag)
+                # Matched rows not flagged are updated; unmatched rows are inserted only when the flag is false
+                survives = f"(s.__matched AND {flag} IS NOT TRUE) OR (NOT s.__matched AND NOT {flag})"
+                self._raw.execute(
+                    f"INSERT INTO {target} ({_quote_identifiers(match.group('columns'))}) "
+                    f"SELECT {_quote_identifiers(match.group('values'))} FROM __merge_source AS s WHERE {survives}"
+                )
+                self._raw.execute(f"SELECT count(*) FROM __merge_source AS s WHERE s.__matched OR NOT {flag}")
+            self._result = self._raw.fetchall()
+            self._raw.execute("DROP TABLE __merge_source")
+            self._raw.execute("COMMIT")
+        except Exception:
+            self._raw.execute("ROLLBACK")
+            raise
+
+    def _replace(self, match, parameters=None):
+        # INSERT OVERWRITE / REPLACE WHERE == DELETE + INSERT in one transaction
+        target = match.group("target")
+        predicate = match.groupdict().get("predicate")
+        query = self._source(match.group("query"))
+        self._raw.execute("BEGIN TRANSACTION")
+        try:
+            where = f" WHERE {_quote_identifiers(predicate)}" if predicate else ""
+            self._raw.execute(f"DELETE FROM {target}{where}")
+            self._raw.execute(f"INSERT INTO {target} {query}", parameters)
+            self._result = self._raw.fetchall()
+            self._raw.execute("COMMIT")
+        except Exception:
+            self._raw.execute("ROLLBACK")
+            raise
+
+    def _translate(self, query: str):
+        self._result = None
+        if _SHOW_CATALOGS.match(query):
+            return "SELECT database_name AS catalog FROM duckdb_databases() WHERE NOT internal ORDER BY 1"
+        m = _SHOW_SCHEMAS.match(query)
+        if m:
+            return (f"SELECT schema_name AS databaseName FROM information_schema.schemata "
+                    f"WHERE catalog_name = '{m.group(1)}' ORDER BY 1")
+        m = _SHOW_TABLES.match(query)
+        if m:
+            return (f"SELECT table_name AS tableName FROM information_schema.tables "
+                    f"WHERE table_catalog = '{m.group(1)}' AND table_schema = '{m.group(2)}' ORDER BY 1")
+        m = _SHOW_COLUMNS.match(query)
+        if m:
+            return (f"SELECT column_name AS col_name FROM information_schema.columns "
+                    f"WHERE table_catalog = '{m.group(1)}' AND table_schema = '{m.group(2)}' "
+                    f"AND table_name = '{m.group(3)}' ORDER BY ordinal_position")
+        m = _DESCRIBE.match(query)
+        if m:
+            return (f"SELECT column_name AS col_name, lower(data_type) AS data_type, NULL AS comment "
+                    f"FROM information_schema.columns WHERE table_catalog = '{m.group(1)}' "
+                    f"AND table_schema = '{m.group(2)}' AND table_name = '{m.group(3)}' ORDER BY ordinal_position")
+        m = _TRUNCATE.match(query)
+        if m:
+            return f"DELETE FROM {m.group(1)}"
+        query = _INFO_SCHEMA.sub("information_schema.", query)
+        return self._source(query)
+
+    def fetchall_arrow(self):
+        return self._raw.fetch_arrow_table()
+
+    def fetchone(self):
+        if self._result is not None:
+            return self._result[0] if self._result else None
+        return self._raw.fetchone()
+
+    def fetchall(self):
+        if self._result is not None:
+            return self._result
+        return self._raw.fetchall()
+
+
+def _quote_identifiers(sql: str):
+    return sql.replace("`", '"')
+
+
+def _expand_braces(path: str):
+    """Expands a ``{a,b}`` glob alternation, which DuckDB doesn't support, into a list of paths."""
+    match = _BRACES.search(path)
+    if not match:
+        return [path]
+    expanded = []
+    for option in match.group(1).split(","):
+        expanded += _expand_braces(path[:match.start()] + option + path[match.end():])
+    return expanded
+
+
+class LocalBackend:
+    """
+    Embedded DuckDB stand-in for the SQL warehouse.
+
+    ``/Volumes/...`` paths map to ``volume_root`` on local disk, each statement
+    sleeps ``latency_s`` to mimic a warehouse round trip, and PUTs additionally
+    sleep for the bytes moved at ``put_mb_per_s``.
+    """
+
+    def __init__(self, database=":memory:", volume_root=None, latency_s=0.0, put_mb_per_s=None,
+                 catalogs=("sandbox",)):
+        import duckdb
+
+        self.volume_root = volume_root or os.path.join(os.getcwd(), ".local_volumes")
+        self.latency_s = latency_s
+        self.put_mb_per_s = put_mb_per_s
+        self._conn = duckdb.connect(database)
+        for catalog in catalogs:
+            if catalog not in {row[0] for row in self._conn.execute("SELECT database_name FROM duckdb_databases()").fetchall()}:
+                self._conn.execute(f"ATTACH ':memory:' AS {catalog}")
+        self._lock = threading.Lock()
+        self._statements = Counter()
+
+    @contextmanager
+    def cursor(self):
+        # DuckDB cursors are independent connections to the same database
+        with _LocalCursor(self, self._conn.cursor()) as cursor:
+            yield cursor
+
+    def local_path(self, volume_path: str):
+        if not volume_path.startswith("/Volumes/"):
+            return volume_path
+        return os.path.join(self.volume_root, volume_path[len("/Volumes/"):])
+
+    def translate_read_files(self, sql: str):
+        def replace(match):
+            paths = [self.local_path(p) for p in _expand_braces(match.group(1))]
+            paths = [os.path.join(p, "*") if os.path.isdir(p) else p for p in paths]
+            files = "[" + ", ".join(f"'{p}'" for p in paths) + "]"
+            if match.group(2).lower() == "parquet":
+                return f"read_parquet({files}, union_by_name = true)"
+            return f"read_csv({files}, header = true, union_by_name = true)"
+        return _READ_FILES.sub(replace, sql)
+
+    def list_sql(self, volume_path: str):
+        """A query returning LIST's columns (path, name, size, modification_time) for a local directory."""
+        directory = self.local_path(volume_path.rstrip("/"))
+        rows = []
+        if os.path.isdir(directory):
+            for entry in os.scandir(directory):
+                stat = entry.stat()
+                name = entry.name + ("/" if entry.is_dir() else "")
+                path = f"{volume_path.rstrip('/')}/{name}"
+                rows.append(f"('{path}', '{name}', {0 if entry.is_dir() else stat.st_size}, {int(stat.st_mtime * 1000)})")
+        if not rows:
+            return ("SELECT NULL::VARCHAR AS path, NULL::VARCHAR AS name, NULL::BIGINT AS size, "
+                    "NULL::BIGINT AS modification_time WHERE false")
+        return f"SELECT * FROM (VALUES {', '.join(rows)}) AS t(path, name, size, modification_time)"
+
+    def remove(self, volume_path: str):
+        target = self.local_path(volume_path)
+        if os.path.isdir(target):
+            shutil.rmtree(target, ignore_errors=True)
+        elif os.path.exists(target):
+            os.remove(target)
+
+    def put(self, local_path: str, volume_path: str):
+        target = self.local_path(volume_path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(local_path, target)
+
+    def _put_latency(self, local_path: str):
+        if not self.put_mb_per_s:
+            return 0.0
+        return os.path.getsize(local_path) / (self.put_mb_per_s * 1024 * 1024)
+
+    def _record(self, kind: str):
+        with self._lock:
+            self._statements[kind] += 1
+
+    def statement_counts(self):
+        with self._lock:
+            return dict(self._statements)
+
+    def reset_counts(self):
+        with self._lock:
+            self._statements.clear()
+
+    def stats(self):
+        counts = self.statement_counts()
+        return {"statements": sum(counts.values()), **{f"statements_{k}": v for k, v in counts.items()}}
+
+    def close(self):
+        self._conn.close()
+
+
+def make_backend(connect, name: str = None) -> SQLBackend:
+    """Builds the SQL backend selected by ``name`` (default: ``UPLOADER_BACKEND``)."""
+    name = (name or BACKEND).lower()
+    if name == "databricks":
+        # Every Dash request thread borrows a connection from here instead of sharing one.
+        # Connections are only opened on first use.
+        return ConnectionPool(
+            connect,
+            max_size=int(os.getenv("SQL_POOL_MAX_SIZE", "8")),
+            acquire_timeout=float(os.getenv("SQL_POOL_ACQUIRE_TIMEOUT", "30")),
+            max_idle=float(os.getenv("SQL_POOL_MAX_IDLE", "300")),
+        )
+    if name == "local":
+        put_rate = os.getenv("LOCAL_PUT_MB_PER_S")
+        print("🧪 Using the local DuckDB backend instead of a SQL warehouse")
+        return LocalBackend(
+            database=os.getenv("LOCAL_DUCKDB_PATH", ":memory:"),
+            volume_root=os.getenv("LOCAL_VOLUME_ROOT"),
+            latency_s=float(os.getenv("LOCAL_SQL_LATENCY_S", "0")),
+            put_mb_per_s=float(put_rate) if put_rate else None,
+            catalogs=tuple(os.getenv("LOCAL_CATALOGS", "sandbox").split(",")),
+        )
+    raise ValueError(f"Unsupported backend '{name}'. Use one of {BACKENDS}.")
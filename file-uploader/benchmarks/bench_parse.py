@@ -0,0 +1,104 @@
+"""
+CSV parse throughput across core counts.
+
+Generates a synthetic CSV (optionally re-encoded, e.g. as cp1252) and parses it
+with the app's block-parallel reader at each ``--cores`` setting. It also runs
+the single-threaded streaming reader the app used before, and with ``--pandas``
+a plain ``pd.read_csv``, for comparison. Each run is a fresh process with
+``READER_THREADS`` set, so Arrow's thread pool really has that many threads.
+
+    python benchmarks/bench_parse.py --size-mb 512
+    python benchmarks/bench_parse.py --size-mb 512 --cores 1,2,4,8 --encoding cp1252 --pandas
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+CHILD_SNIPPET = """
+import json, sys, time
+reader, path, encoding = sys.argv[1:4]
+t0 = time.perf_counter()
+rows = 0
+if reader == "pandas":
+    import pandas as pd
+    rows = len(pd.read_csv(path, encoding=encoding))
+else:
+    import readers
+    if reader == "streaming":
+        _, batches = readers._read_csv_streaming(path, "utf8" if encoding == "utf-8" else encoding)
+    else:
+        _, batches = readers.open_batches(path, "bench.csv")
+    for batch in batches:
+        rows += batch.num_rows
+print(json.dumps({"seconds": time.perf_counter() - t0, "rows": rows}))
+"""
+
+
+def run_parse(reader, path, encoding, threads):
+    env = {**os.environ, "READER_THREADS": str(threads)}
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD_SNIPPET, reader, path, encoding],
+        cwd=APP_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def reencode(path, encoding):
+    """Rewrites the file in ``encoding``, adding an accent so it is no longer valid UTF-8."""
+    encoded = f"{path}.{encoding}.csv"
+    with open(path, encoding="utf-8") as src, open(encoded, "w", encoding=encoding, newline="") as dst:
+        for line in src:
+            dst.write(line.replace("Employee", "Employé"))
+    return encoded
+
+
+def main():
+    from bench_pipeline import generate_csv
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=256)
+    parser.add_argument("--cores", default=None, help="comma-separated thread counts (default: 1, 2, 4... up to all cores)")
+    parser.add_argument("--encoding", default="utf-8", help="encoding of the generated file, e.g. cp1252")
+    parser.add_argument("--runs", type=int, default=3, help="runs per setting; the fastest is reported")
+    parser.add_argument("--pandas", action="store_true", help="also time pd.read_csv")
+    args = parser.parse_args()
+
+    if args.cores:
+        cores = [int(c) for c in args.cores.split(",")]
+    else:
+        cores, n = [], 1
+        while n < (os.cpu_count() or 1):
+            cores.append(n)
+            n *= 2
+        cores.append(os.cpu_count() or 1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.csv")
+        generate_csv(path, args.size_mb)
+        if args.encoding.lower() not in ("utf-8", "utf8"):
+            path = reencode(path, args.encoding)
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        print(f"Parsing {size_mb:.0f} MB ({args.encoding}), best of {args.runs} run(s)\n")
+
+        settings = [("streaming", 1)] + [("blocks", n) for n in cores]
+        if args.pandas:
+            settings.append(("pandas", 1))
+
+        print(f"{'reader':<10} {'threads':>7} {'seconds':>9} {'MB/s':>8} {'speedup':>8}")
+        baseline = None
+        for reader, threads in settings:
+            best = min((run_parse(reader, path, args.encoding, threads) for _ in range(args.runs)),
+                       key=lambda r: r["seconds"])
+            baseline = baseline or best["seconds"]
+            print(f"{reader:<10} {threads:>7} {best['seconds']:>9.2f} {size_mb / best['seconds']:>8.1f} "
+                  f"{baseline / best['seconds']:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Offline end-to-end benchmark of the upload pipeline.
+
+Runs against the local DuckDB backend (``UPLOADER_BACKEND=local``) so no
+workspace or warehouse is needed. For each file size it generates a synthetic
+CSV and drives the same steps as the app's callbacks:
+
+    load     — ``load_csv``: parse the upload into an artifact
+    preview  — ``preview_uploaded_csv``: read the first rows
+    <mode>   — ``execute_write``: validate, stage, PUT and write (append/overwrite/merge)
+
+and reports seconds, MB/s, peak RSS and the SQL statements issued. Each size
+runs in its own process so peak RSS is per size. ``--latency`` injects a
+per-statement round trip and ``--put-mbps`` a Volume upload rate.
+
+    python benchmarks/bench_pipeline.py --sizes 1,10,100,1024
+    python benchmarks/bench_pipeline.py --sizes 1,10,100 --latency 0.2 --save baseline.json
+    python benchmarks/bench_pipeline.py --sizes 1,10,100 --latency 0.2 --baseline baseline.json
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+TARGET_TABLE = "sandbox.bench.target"
+TARGET_DDL = """
+    CREATE TABLE IF NOT EXISTS sandbox.bench.target (
+        id BIGINT, name VARCHAR, department VARCHAR, salary INTEGER, start_date DATE, active BOOLEAN
+    )
+"""
+DEPARTMENTS = ["Engineering", "Finance", "Marketing", "Sales", "Operations", "HR"]
+MODES = ("append", "overwrite", "merge")
+
+
+def generate_csv(path, size_mb):
+    """Writes a CSV of roughly ``size_mb`` MB with the sample.csv columns."""
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.csv as pv
+
+    rng = np.random.default_rng(42)
+
+    def batch(start, rows):
+        ids = np.arange(start, start + rows, dtype=np.int64)
+        return pa.table({
+            "id": ids,
+            "name": pa.array([f"Employee {i}" for i in ids]),
+            "department": pa.array(np.array(DEPARTMENTS)[rng.integers(0, len(DEPARTMENTS), rows)]),
+            "salary": rng.integers(40_000, 200_000, rows, dtype=np.int32),
+            "start_date": pa.array(rng.integers(16_436, 20_088, rows, dtype=np.int32), pa.date32()),
+            "active": rng.random(rows) > 0.1,
+        })
+
+    target = int(size_mb * 1024 * 1024)
+    rows_per_batch = 100_000
+    written = 0
+    start = 1
+    with pv.CSVWriter(path, batch(0, 1).schema) as writer:
+        while written < target:
+            table = batch(start, rows_per_batch)
+            writer.write_table(table)
+            start += rows_per_batch
+            written = os.path.getsize(path)
+    return start - 1
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - t0
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_size(size_mb, modes):
+    """Runs every phase for one file size in this process; returns a list of result rows."""
+    import databricks_funcs as df
+    from upload_artifacts import build_artifact, read_head
+    from temp_store import UPLOAD_DIR
+    from validation import validate_artifact
+
+    with df.backend.cursor() as cursor:
+        cursor.execute("CREATE SCHEMA IF NOT EXISTS sandbox.bench")
+        cursor.execute(TARGET_DDL)
+
+    rows = []
+
+    def record(phase, seconds, bytes_):
+        counts = df.backend.statement_counts()
+        df.backend.reset_counts()
+        rows.append({
+            "size_mb": size_mb,
+            "phase": phase,
+            "seconds": round(seconds, 4),
+            "mb_per_s": round(bytes_ / (1024 * 1024) / seconds, 2) if seconds else None,
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "statements": sum(counts.values()),
+            "statement_kinds": counts,
+        })
+
+    with tempfile.TemporaryDirectory(dir=UPLOAD_DIR) as tmp:
+        source = os.path.join(tmp, "bench.csv")
+        generate_csv(source, size_mb)
+        size = os.path.getsize(source)
+        df.backend.reset_counts()
+
+        artifact, seconds = timed(lambda: build_artifact(source, "bench.csv"))
+        record("load", seconds, size)
+
+        _, seconds = timed(lambda: read_head(artifact.content_hash, 10))
+        record("preview", seconds, 0)
+
+        for mode in modes:
+            def write():
+                schema_map = df.get_table_schema(TARGET_TABLE)
+                not_null = df.get_not_null_columns(TARGET_TABLE)
+                report = validate_artifact(artifact, schema_map, not_null)
+                if not report["ok"]:
+                    raise RuntimeError(f"Benchmark upload failed validation: {report}")
+                return df.stage_and_write(artifact, TARGET_TABLE, mode, "csv",
+                                          ["id"] if mode == "merge" else None)
+
+            _, seconds = timed(write)
+            record(mode, seconds, size)
+
+    return rows
+
+
+def run_child(size_mb, args):
+    """Runs one size in a fresh interpreter wired to the local backend."""
+    env = dict(
+        os.environ,
+        UPLOADER_BACKEND="local",
+        LOCAL_SQL_LATENCY_S=str(args.latency),
+        LOCAL_VOLUME_ROOT=args.volume_root,
+    )
+    if args.put_mbps:
+        env["LOCAL_PUT_MB_PER_S"] = str(args.put_mbps)
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", str(size_mb), "--modes", ",".join(args.modes)],
+        cwd=APP_DIR, env=env, capture_output=True, text=True,
+    )
+    if out.returncode != 0:
+        sys.exit(f"Benchmark for {size_mb} MB failed:\n{out.stdout[-2000:]}\n{out.stderr[-2000:]}")
+    # The pipeline logs to stdout; the result is the last line
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def compare(rows, baseline_path, tolerance):
+    """Returns a list of regressions against a saved baseline."""
+    with open(baseline_path) as fh:
+        baseline = {(r["size_mb"], r["phase"]): r for r in json.load(fh)["rows"]}
+
+    regressions = []
+    for row in rows:
+        base = baseline.get((row["size_mb"], row["phase"]))
+        if base is None:
+            continue
+        key = f"{row['size_mb']}MB {row['phase']}"
+        if row["seconds"] > base["seconds"] * (1 + tolerance):
+            regressions.append(f"{key}: {row['seconds']:.3f}s vs baseline {base['seconds']:.3f}s")
+        if row["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{key}: peak RSS {row['peak_rss_mb']}MB vs baseline {base['peak_rss_mb']}MB")
+        if row["statements"] > base["statements"]:
+            regressions.append(f"{key}: {row['statements']} statements vs baseline {base['statements']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,10,100", help="comma separated file sizes in MB")
+    parser.add_argument("--modes", default=",".join(MODES), help="comma separated write modes")
+    parser.add_argument("--latency", type=float, default=0.0, help="injected seconds per SQL statement")
+    parser.add_argument("--put-mbps", type=float, help="simulated Volume upload rate in MB/s")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="fail if results regress against this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs the baseline")
+    parser.add_argument("--child", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.modes = [m for m in args.modes.split(",") if m]
+
+    if args.child is not None:
+        print(json.dumps(run_size(args.child, args.modes)))
+        return
+
+    rows = []
+    with tempfile.TemporaryDirectory() as volume_root:
+        args.volume_root = volume_root
+        for size in args.sizes.split(","):
+            rows += run_child(float(size), args)
+
+    print(f"{'size MB':>8}  {'phase':<10}{'seconds':>10}{'MB/s':>10}{'peak RSS MB':>13}{'statements':>12}")
+    for row in rows:
+        mbps = f"{row['mb_per_s']:.1f}" if row["mb_per_s"] else "-"
+        print(f"{row['size_mb']:>8g}  {row['phase']:<10}{row['seconds']:>10.3f}{mbps:>10}"
+              f"{row['peak_rss_mb']:>13.1f}{row['statements']:>12}")
+
+    if args.save:
+        with open(args.save, "w") as fh:
+            json.dump({"latency": args.latency, "put_mbps": args.put_mbps, "rows": rows}, fh, indent=2)
+        print(f"💾 Saved results to {args.save}")
+
+    if args.baseline:
+        regressions = compare(rows, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"❌ {line}")
+        if regressions:
+            sys.exit(1)
+        print("✅ No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Compares CSV and Parquet staging for the same upload.
+
+Generates a synthetic CSV, parses it into an upload artifact and stages it in
+both formats, reporting bytes that would be moved to the Volume and the local
+conversion time. With ``--table`` it also PUTs each staged file and appends it
+into that (existing, compatible) table to measure end-to-end time.
+
+    python benchmarks/bench_staging_format.py --rows 1000000
+    python benchmarks/bench_staging_format.py --rows 1000000 --table main.chynoweth.bench_target
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from staging import stage_locally  # noqa: E402
+from upload_artifacts import build_artifact  # noqa: E402
+from temp_store import UPLOAD_DIR  # noqa: E402
+
+# Matches the columns of sample.csv
+BENCH_SCHEMA = {
+    "id": "bigint",
+    "name": "string",
+    "department": "string",
+    "salary": "int",
+    "start_date": "date",
+    "active": "boolean",
+}
+DEPARTMENTS = ["Engineering", "Finance", "Marketing", "Sales", "Operations", "HR"]
+
+
+def generate_csv(path, rows):
+    start = date(2015, 1, 1)
+    with open(path, "w", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(BENCH_SCHEMA.keys())
+        for i in range(1, rows + 1):
+            writer.writerow([
+                i,
+                f"Employee {i}",
+                random.choice(DEPARTMENTS),
+                random.randint(40_000, 200_000),
+                (start + timedelta(days=random.randint(0, 3650))).isoformat(),
+                random.random() > 0.1,
+            ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--table", help="fully qualified target table for the end-to-end run")
+    args = parser.parse_args()
+
+    # Generate under UPLOAD_DIR so the connector is allowed to PUT from it
+    with tempfile.TemporaryDirectory(dir=UPLOAD_DIR) as tmp:
+        source = os.path.join(tmp, "bench.csv")
+        generate_csv(source, args.rows)
+        artifact = build_artifact(source, "bench.csv")
+
+        if args.table:
+            import databricks_funcs as df
+            schema_map = df.get_table_schema(args.table)
+        else:
+            schema_map = BENCH_SCHEMA
+
+        print(f"{'format':<10}{'bytes':>16}{'local s':>10}{'end-to-end s':>15}")
+        for staging_format in ("csv", "parquet"):
+            t0 = time.perf_counter()
+            local_path, file_format = stage_locally(artifact, schema_map, staging_format)
+            local_s = time.perf_counter() - t0
+            size = os.path.getsize(local_path)
+
+            e2e = "-"
+            if args.table:
+                t0 = time.perf_counter()
+                volume_path, _ = df.stage_artifact(artifact, args.table, staging_format)
+                df.append_file(volume_path, args.table, file_format=file_format)
+                e2e = f"{time.perf_counter() - t0:.2f}"
+
+            print(f"{staging_format:<10}{size:>16,}{local_s:>10.2f}{e2e:>15}")
+
+
+if __name__ == "__main__":
+    main()
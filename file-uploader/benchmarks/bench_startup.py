@@ -0,0 +1,66 @@
+"""
+Cold-start benchmark for the file uploader app.
+
+Each run starts a fresh interpreter and times how long it takes to import ``app``
+(layout + callbacks). With ``--eager`` the run also resolves the catalog list
+right after import, which is what the old import-time layout did, so the two
+numbers show what lazy startup saves.
+
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --runs 5 --eager
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAZY_SNIPPET = """
+import time
+t0 = time.perf_counter()
+import app
+print(time.perf_counter() - t0)
+"""
+
+EAGER_SNIPPET = """
+import time
+t0 = time.perf_counter()
+import app
+import databricks_funcs as df
+df.get_catalogs()
+print(time.perf_counter() - t0)
+"""
+
+
+def time_startup(snippet):
+    out = subprocess.run(
+        [sys.executable, "-c", snippet],
+        cwd=APP_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--eager", action="store_true", help="also fetch catalogs, as the old layout did at import")
+    args = parser.parse_args()
+
+    snippet = EAGER_SNIPPET if args.eager else LAZY_SNIPPET
+    timings = [time_startup(snippet) for _ in range(args.runs)]
+
+    mode = "eager (import + get_catalogs)" if args.eager else "lazy (import only)"
+    print(f"Startup mode: {mode}")
+    print(f"  runs:   {args.runs}")
+    print(f"  median: {statistics.median(timings):.3f}s")
+    print(f"  min:    {min(timings):.3f}s")
+    print(f"  max:    {max(timings):.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,75 @@
-from dash import dash_table, no_update
-import pandas as pd
-import base64
-import io
+from dash import ctx, html, no_update
 from dash import Input, Output, State
 import databricks_funcs as df
+from jobs import QUEUED, RUNNING, SUCCEEDED, job_executor
+from metrics import new_trace_id, span
+from preview import read_page
+from upload_artifacts import build_artifact, get_artifact
+from upload_routes import get_upload
+from validation import summarize, validate_artifact
+from write_planner import WRITE_MODES
+
+
+
+
+def _name_options(names, current=None):
+    """Dropdown options for ``names``, keeping the current selection even when it isn't a match."""
+    if current and current not in names:
+        names = [current, *names]
+    return [{"label": name, "value": name} for name in names]
+
+
+def _profile_rows(artifact):
+    """Column profile records for the profile table."""
+    rows = []
+    for record in artifact.get_profile().to_records():
+        distinct = record["distinct"]
+        rows.append({
+            **record,
+            "distinct": distinct if record["distinct_exact"] else f"≈{distinct}",
+            # Past the exact-count limit uniqueness is only an estimate
+            "key_candidate": ("✅" if record["distinct_exact"] else "≈") if record["unique"] else "",
+        })
+    return rows
+
+
+def _key_candidates(upload_artifacts, target_columns):
+    """
+    ``{column: exact}`` for target columns that are fully populated and unique in every
+    uploaded file; ``exact`` is False when some file's distinct count is only estimated.
+    """
+    artifacts = [get_artifact(a["content_hash"]) for a in upload_artifacts or []]
+    artifacts = [a for a in artifacts if a is not None]
+    if not artifacts:
+        return {}
+    candidates = {}
+    for col in target_columns:
+        profiles = [artifact.get_profile().get(col) for artifact in artifacts]
+        if all(profile is not None and profile.unique for profile in profiles):
+            candidates[col] = all(profile.distinct_is_exact for profile in profiles)
+    return candidates
 
 
+def register_callbacks(app):
 
+    # ------------------------------------------------------------------------
+    # Catalog dropdown (loaded on page load, not at import time).
+    # All three dropdowns search the server-side name index as the user types
+    # and only receive the top matches.
+    # ------------------------------------------------------------------------
+    @app.callback(
+        Output("catalog-dd", "options"),
+        Input("url", "pathname"),
+        Input("catalog-dd", "search_value"),
+        State("catalog-dd", "value"),
+    )
+    def load_catalogs_dd(_pathname, search_value, current):
+        try:
+            return _name_options(df.search_catalogs(search_value), current)
+        except Exception as e:
+            print(f"⚠️ Error loading catalogs: {e}")
+            return []
 
-def register_callbacks(app):
 
     # ------------------------------------------------------------------------
     # Dependent dropdowns
@@ -17,13 +78,19 @@ def register_callbacks(app):
         Output("schema-dd", "options"),
         Output("schema-dd", "value"),
         Input("catalog-dd", "value"),
+        Input("schema-dd", "search_value"),
+        State("schema-dd", "value"),
     )
-    def update_schemas_dd(catalog):
+    def update_schemas_dd(catalog, search_value, current):
         if not catalog:
             return [], None
+        # A new catalog clears the schema; typing leaves the value alone
+        value = no_update
+        if ctx.triggered_id == "catalog-dd":
+            current, search_value, value = None, None, None
         try:
-            schemas = df.get_schemas(catalog)
-            return ([{"label": s, "value": s} for s in schemas], None)
+            schemas = df.search_schemas(catalog, search_value)
+            return _name_options(schemas, current), value
         except Exception as e:
             print(f"⚠️ Error loading schemas: {e}")
             return [], None
@@ -34,13 +101,18 @@ def register_callbacks(app):
         Output("table-dd", "value"),
         Input("catalog-dd", "value"),
         Input("schema-dd", "value"),
+        Input("table-dd", "search_value"),
+        State("table-dd", "value"),
     )
-    def update_tables_dd(catalog, schema):
+    def update_tables_dd(catalog, schema, search_value, current):
         if not (catalog and schema):
             return [], None
+        value = no_update
+        if ctx.triggered_id in ("catalog-dd", "schema-dd"):
+            current, search_value, value = None, None, None
         try:
-            tables = df.get_tables(catalog, schema)
-            return ([{"label": t, "value": t} for t in tables], None)
+            tables = df.search_tables(catalog, schema, search_value)
+            return _name_options(tables, current), value
         except Exception as e:
             print(f"⚠️ Error loading tables: {e}")
             return [], None
@@ -52,161 +124,267 @@ def register_callbacks(app):
     @app.callback(
         Output("merge-id-dd", "options"),
         Output("merge-help", "children"),
+        Output("replace-cols-dd", "options"),
         Input("table-dd", "value"),
+        Input("upload-artifacts", "data"),
         State("catalog-dd", "value"),
         State("schema-dd", "value"),
     )
-    def update_merge_columns(table, catalog, schema):
+    def update_merge_columns(table, upload_artifacts, catalog, schema):
         if not (catalog and schema and table):
-            return [], "Select a table to load available columns."
+            return [], "Select a table to load available columns.", []
         try:
             cols = df.get_columns(catalog, schema, table)
-            options = [{"label": c, "value": c} for c in cols]
-            msg = f"Found {len(cols)} columns in {catalog}.{schema}.{table}."
-            return options, msg
         except Exception as e:
-            return [], f"Error loading columns: {e}"
+            return [], f"Error loading columns: {e}", []
+
+        # Columns that are populated and unique in every uploaded file are listed first,
+        # but only an exact distinct count makes one a suggested key
+        candidates = _key_candidates(upload_artifacts, cols)
+        options = [
+            {"label": f"{c} — {'unique' if candidates[c] else '≈ unique'} in upload", "value": c}
+            for c in cols if c in candidates
+        ]
+        options += [{"label": c, "value": c} for c in cols if c not in candidates]
+        msg = f"Found {len(cols)} columns in {catalog}.{schema}.{table}."
+        suggested = [c for c in cols if candidates.get(c)]
+        if suggested:
+            msg += f" Suggested merge key: {', '.join(suggested)}."
+        return options, msg, [{"label": c, "value": c} for c in cols]
 
 
     # ------------------------------------------------------------------------
     # Toggle merge section
     # ------------------------------------------------------------------------
-    @app.callback(Output("merge-section", "style"), Input("write-mode", "value"))
+    @app.callback(
+        Output("merge-section", "style"),
+        Output("replace-section", "style"),
+        Input("write-mode", "value"),
+    )
     def toggle_merge_section(write_mode):
-        return {"display": "block"} if write_mode == "merge" else {"display": "none"}
+        show = lambda mode: {"display": "block"} if write_mode == mode else {"display": "none"}
+        return show("merge"), show("replace")
 
 
 
     # -------------------------------------------------------------------
-    # Callback: load CSV into a pandas DataFrame
+    # Callback: parse completed chunked uploads (one or many files)
     # -------------------------------------------------------------------
     @app.callback(
         Output("file-info", "children"),
-        Output("uploaded-file-path", "data"),  # ✅ second output to store file path
-        Input("upload-data", "contents"),
-        State("upload-data", "filename"),
+        Output("upload-artifacts", "data"),
+        Input("upload-meta", "data"),
     )
-    def load_csv(contents, filename):
-        if contents is None:
+    def load_csv(upload_meta):
+        if not upload_meta or not upload_meta.get("files"):
             return "No file uploaded yet.", None
 
-        try:
-            # Decode uploaded CSV
-            content_type, content_string = contents.split(',')
-            decoded = base64.b64decode(content_string)
-            pdf = pd.read_csv(io.StringIO(decoded.decode('utf-8')))
-
-            # Save locally and upload to volume
-            pdf.to_csv(filename, index=False)
-            df.put_file(
-                filename=filename,
-                localfile_path=filename,
-                volume_path="/Volumes/main/chynoweth/demovolume/stg"
-            )
-
-            # Construct full path for later use
-            uploaded_path = f"/Volumes/main/chynoweth/demovolume/stg/{filename}"
-            print(f"✅ Uploaded file to: {uploaded_path}")
-
-            msg = f"📄 File '{filename}' loaded successfully — {pdf.shape[0]} rows, {pdf.shape[1]} columns."
-            return msg, uploaded_path
-
-        except Exception as e:
-            return f"❌ Error loading file: {e}", None
+        trace_id = new_trace_id()
+        # Parse each file once into a cached artifact reused by preview and write;
+        # a bad file is reported without dropping the rest of the batch
+        artifacts, lines = [], []
+        for meta in upload_meta["files"]:
+            filename = meta["filename"]
+            try:
+                upload = get_upload(meta["upload_id"])
+                if upload is None or not upload.complete:
+                    raise FileNotFoundError(f"Upload for '{filename}' is missing or incomplete.")
+                artifact = build_artifact(upload.path, filename)
+                artifacts.append(artifact.to_dict())
+                lines.append(f"📄 File '{filename}' loaded successfully — {artifact.num_rows} rows, {artifact.num_columns} columns.")
+            except Exception as e:
+                lines.append(f"❌ Error loading file '{filename}': {e}")
+        for failed in upload_meta.get("failed", []):
+            lines.append(f"❌ Error uploading file '{failed['filename']}': {failed['error']}")
+
+        if len(artifacts) > 1:
+            total_rows = sum(a["num_rows"] for a in artifacts)
+            lines.insert(0, f"📚 Batch of {len(artifacts)} files ready — {total_rows} rows in total.")
+        lines.append(html.Small(f"Trace {trace_id}", className="text-muted"))
+        return [html.Div(line) for line in lines], artifacts or None
 
 
 
     # ------------------------------------------------------------------------
-    # Execute COPY INTO
+    # Execute write (submitted as a background job)
     # ------------------------------------------------------------------------
     @app.callback(
         Output("toast-msg", "is_open"),
         Output("toast-msg", "header"),
         Output("toast-msg", "children"),
         Output("toast-msg", "icon"),
+        Output("write-job", "data"),
+        Output("job-poll", "disabled"),
+        Output("validation-report", "children"),
         Input("execute-btn", "n_clicks"),
-        State("uploaded-file-path", "data"),  
+        State("upload-artifacts", "data"),
         State("catalog-dd", "value"),
         State("schema-dd", "value"),
         State("table-dd", "value"),
         State("write-mode", "value"),
         State("merge-id-dd", "value"),
+        State("staging-format", "value"),
+        State("merge-options", "value"),
+        State("replace-cols-dd", "value"),
         prevent_initial_call=True,
     )
-    def execute_write(n_clicks, uploaded_file_path, catalog, schema, table, write_mode, merge_key=None):
-        if not uploaded_file_path:
-            return True, "Error", "No uploaded file found. Please upload a CSV first.", "danger"
+    def execute_write(n_clicks, upload_artifacts, catalog, schema, table, write_mode, merge_keys=None, staging_format="csv",
+                      merge_options=None, replace_columns=None):
+        artifacts = [get_artifact(a["content_hash"]) for a in upload_artifacts or []]
+        artifacts = [a for a in artifacts if a is not None]
+        if not artifacts:
+            return True, "Error", "No uploaded file found. Please upload a CSV first.", "danger", no_update, no_update, no_update
         if not (catalog and schema and table):
-            return True, "Error", "Please select a catalog, schema, and table.", "danger"
-
-        print(f"📂 Using uploaded file: {uploaded_file_path}")
-
-
-
-        if write_mode in ("append", "overwrite"):
-            if write_mode == "overwrite":
-                df.truncate_table(table_name=f"{catalog}.{schema}.{table}")
-        
-            df.append_file(
-                file_path=uploaded_file_path,
-                target_table=f"{catalog}.{schema}.{table}"
-            )
-            msg = f"✅ Wrote file into {catalog}.{schema}.{table}"
-            return True, "Success", msg, "success"
-        
-        elif write_mode == 'merge' and merge_key is not None:
-            df.merge_file(
-                file_path=uploaded_file_path, 
-                target_table=f"{catalog}.{schema}.{table}", 
-                merge_key=merge_key
-                )
-            
-            msg = f"✅ Wrote file into {catalog}.{schema}.{table}"
-            return True, "Success", msg, "success"
+            return True, "Error", "Please select a catalog, schema, and table.", "danger", no_update, no_update, no_update
+
+        target_table = f"{catalog}.{schema}.{table}"
+        if write_mode not in WRITE_MODES or (write_mode == "merge" and not merge_keys):
+            return True, "Error", "Unsupported write mode operation.", "danger", no_update, no_update, no_update
 
+        trace_id = new_trace_id()
+
+        # Validate every file locally before anything is staged or sent to the warehouse
+        try:
+            schema_map = df.get_table_schema(target_table)
+            not_null = df.get_not_null_columns(target_table)
+            problems, valid = [], []
+            for artifact in artifacts:
+                with span("validate", rows=artifact.num_rows):
+                    report = validate_artifact(artifact, schema_map, not_null)
+                if report["ok"]:
+                    valid.append(artifact)
+                else:
+                    problems.extend(summarize(report, artifact.filename))
+        except Exception as e:
+            return True, "Error", f"Error validating upload: {e}", "danger", no_update, no_update, no_update
+
+        report_items = html.Ul([html.Li(line) for line in problems], className="text-danger mb-0") if problems else "✅ Upload passed validation."
+        if not valid:
+            msg = f"❌ Upload does not match {target_table}: {len(problems)} problem(s) found. Nothing was written. (trace {trace_id})"
+            return True, "Validation failed", msg, "danger", no_update, no_update, report_items
+        # In a batch, files that fail validation are skipped and the rest are loaded
+        skipped = len(artifacts) - len(valid)
+        artifacts = valid
+
+        # Deletes are computed against the row index, so they only apply to incremental merges
+        merge_options = merge_options or []
+        incremental = write_mode == "merge" and "incremental" in merge_options
+        deletes = incremental and "deletes" in merge_options
+
+        if len(artifacts) == 1:
+            artifact = artifacts[0]
+            label = f"'{artifact.filename}'"
+            run = lambda: df.stage_and_write(artifact, target_table, write_mode, staging_format, merge_keys,
+                                             incremental, deletes, replace_columns)
         else:
-            return True, "Error", "Unsupported write mode operation.", "danger"
+            label = f"{len(artifacts)} files"
+            run = lambda: df.stage_batch_and_write(artifacts, target_table, write_mode, staging_format, merge_keys,
+                                                   incremental, deletes, replace_columns)
+
+        job_id = job_executor.submit(target_table, f"{write_mode} {label} into {target_table}", run)
+        msg = f"🚀 Submitted {write_mode} of {label} into {target_table} (job {job_id}, trace {trace_id})."
+        if skipped:
+            msg += f" ⚠️ Skipped {skipped} file(s) that failed validation."
+        return True, "Submitted", msg, "primary", {"job_id": job_id}, False, report_items
+
+
+    @app.callback(
+        Output("toast-msg", "is_open", allow_duplicate=True),
+        Output("toast-msg", "header", allow_duplicate=True),
+        Output("toast-msg", "children", allow_duplicate=True),
+        Output("toast-msg", "icon", allow_duplicate=True),
+        Output("job-poll", "disabled", allow_duplicate=True),
+        Output("job-status", "children"),
+        Input("job-poll", "n_intervals"),
+        State("write-job", "data"),
+        prevent_initial_call=True,
+    )
+    def poll_write_job(n_intervals, write_job):
+        job = job_executor.get(write_job["job_id"]) if write_job else None
+        if job is None:
+            return no_update, no_update, no_update, no_update, True, ""
+
+        if job["status"] in (QUEUED, RUNNING):
+            elapsed = job["run_s"] if job["status"] == RUNNING else job["queued_s"]
+            status = f"⏳ Job {job['job_id']} {job['status']} ({elapsed:.0f}s) — {job['description']}"
+            return no_update, no_update, no_update, no_update, False, status
+
+        if job["status"] == SUCCEEDED:
+            rows = f" — {job['rows_affected']} rows affected" if job["rows_affected"] is not None else ""
+            msg = f"✅ Wrote file into {job['target_table']}{rows} in {job['run_s']:.1f}s (trace {job['trace_id']})."
+            if (job["result"] or {}).get("direct"):
+                msg += " ⚡ Sent inline, without staging."
+            deduplicated = (job["result"] or {}).get("deduplicated_rows")
+            if deduplicated:
+                msg += f" 🧹 {deduplicated} duplicate-key source row(s) removed (last occurrence kept)."
+            changes = (job["result"] or {}).get("changes")
+            if changes:
+                msg += (f" 🔍 {changes['changed']} changed row(s) sent ({changes['new']} new, {changes['updated']} updated),"
+                        f" {changes['unchanged']} unchanged skipped")
+                msg += f", {changes['deleted']} deleted." if changes["deleted"] else "."
+            failed = (job["result"] or {}).get("files_failed")
+            if failed:
+                names = ", ".join(f["filename"] for f in failed)
+                msg += f" ⚠️ {len(failed)} file(s) failed to stage: {names}"
+                return True, "Partial success", msg, "warning", True, msg
+            return True, "Success", msg, "success", True, msg
+
+        msg = f"❌ Write to {job['target_table']} failed: {job['error']} (trace {job['trace_id']})"
+        return True, "Error", msg, "danger", True, msg
 
 
 
     # ------------------------------------------------------------------------
-    # Callback: Preview uploaded CSV (first 10 rows)
+    # Callback: Preview uploaded file (paged on the server)
     # ------------------------------------------------------------------------
     @app.callback(
         Output("preview-alert", "children"),
-        Output("preview-table", "children"),
+        Output("preview-source", "data"),
+        Output("preview-table", "columns"),
+        Output("preview-table", "page_current"),
+        Output("preview-table", "sort_by"),
+        Output("preview-table", "filter_query"),
+        Output("profile-table", "data"),
         Input("preview-btn", "n_clicks"),
-        State("upload-data", "contents"),
-        State("upload-data", "filename"),
+        State("upload-artifacts", "data"),
         prevent_initial_call=True,
     )
-    def preview_uploaded_csv(n_clicks, contents, filename):
-        if not contents:
-            return "Please upload a CSV file first.", no_update
-
-        try:
-            # Decode uploaded file
-            content_type, content_string = contents.split(",")
-            decoded = base64.b64decode(content_string)
-            df_preview = pd.read_csv(io.StringIO(decoded.decode("utf-8")))
-
-            # Take top 10 rows for preview
-            preview_df = df_preview.head(10)
+    def preview_uploaded_csv(n_clicks, upload_artifacts):
+        if not upload_artifacts:
+            return "Please upload a CSV file first.", no_update, no_update, no_update, no_update, no_update, no_update
 
-            # Convert to a Dash DataTable
-            table = dash_table.DataTable(
-                data=preview_df.to_dict("records"),
-                columns=[{"name": i, "id": i} for i in preview_df.columns],
-                style_table={"overflowX": "auto"},
-                style_cell={"textAlign": "left", "padding": "5px", "fontFamily": "sans-serif"},
-                style_header={"backgroundColor": "#f1f3f4", "fontWeight": "bold"},
-                page_action="none",
-            )
+        # Batches preview their first file
+        upload_artifact = upload_artifacts[0]
+        filename = upload_artifact["filename"]
+        artifact = get_artifact(upload_artifact["content_hash"])
+        if artifact is None:
+            return f"Error previewing file: '{filename}' is no longer available; upload it again.", \
+                no_update, no_update, no_update, no_update, no_update, no_update
 
-            msg = f"✅ Previewing '{filename}' — showing first 10 rows.",
+        columns = [{"name": name, "id": name} for name in artifact.column_names]
+        batch_note = f" (file 1 of {len(upload_artifacts)})" if len(upload_artifacts) > 1 else ""
+        msg = f"✅ Previewing '{filename}'{batch_note} — {artifact.num_rows} rows. Sort or filter by column to explore."
+        return msg, {"content_hash": artifact.content_hash}, columns, 0, [], "", _profile_rows(artifact)
 
-            return msg, table
 
+    @app.callback(
+        Output("preview-table", "data"),
+        Output("preview-table", "page_count"),
+        Output("preview-alert", "children", allow_duplicate=True),
+        Input("preview-source", "data"),
+        Input("preview-table", "page_current"),
+        Input("preview-table", "page_size"),
+        Input("preview-table", "sort_by"),
+        Input("preview-table", "filter_query"),
+        prevent_initial_call=True,
+    )
+    def page_preview(preview_source, page_current, page_size, sort_by, filter_query):
+        if not preview_source:
+            return [], 1, no_update
+        try:
+            records, page_count, matching = read_page(
+                preview_source["content_hash"], page_current or 0, page_size, sort_by, filter_query)
         except Exception as e:
-            error_msg = f"Error previewing file: {e}"
-            return error_msg, no_update
+            return [], 1, f"Error previewing file: {e}"
+        note = f"🔎 {matching} matching rows." if filter_query else no_update
+        return records, page_count, note
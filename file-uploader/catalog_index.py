@@ -0,0 +1,193 @@
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+
+from metrics import span
+
+
+# ------------------------------------------------------------------------
+# In-memory index of catalog.schema.table names.
+# One bulk information_schema query loads every name in the metastore; the
+# dropdowns then search it server-side (prefix matches first, then substring
+# matches) and only the top N names are sent to the browser. The index is
+# refreshed in the background once it is older than CATALOG_INDEX_TTL_S, and
+# lookups keep using the previous copy meanwhile.
+# ------------------------------------------------------------------------
+CATALOG_INDEX_TTL_S = float(os.getenv("CATALOG_INDEX_TTL_S", "300"))
+DROPDOWN_LIMIT = int(os.getenv("DROPDOWN_LIMIT", "50"))
+
+# One row per schema (table_name NULL) and per table, so empty schemas are listed too
+BULK_QUERY = """
+    SELECT catalog_name AS table_catalog, schema_name AS table_schema, NULL AS table_name
+    FROM system.information_schema.schemata
+    WHERE schema_name <> 'information_schema'
+    UNION ALL
+    SELECT table_catalog, table_schema, table_name
+    FROM system.information_schema.tables
+    WHERE table_schema <> 'information_schema'
+"""
+
+
+class NameIndex:
+    """Sorted names for prefix search, plus one lowercase blob scanned for substring matches."""
+
+    def __init__(self, names):
+        self.names = sorted(set(names), key=str.lower)
+        self.lower = [name.lower() for name in self.names]
+        self.blob = "\n".join(self.lower)
+        # Start offset of each name in the blob
+        self.offsets = []
+        position = 0
+        for name in self.lower:
+            self.offsets.append(position)
+            position += len(name) + 1
+
+    def __len__(self):
+        return len(self.names)
+
+    def search(self, query: str = "", limit: int = DROPDOWN_LIMIT):
+        """Up to ``limit`` names matching ``query``: prefix matches first, then the rest containing it."""
+        query = (query or "").strip().lower()
+        if not query:
+            return self.names[:limit]
+
+        matches, seen = [], set()
+        i = bisect_left(self.lower, query)
+        while i < len(self.lower) and self.lower[i].startswith(query) and len(matches) < limit:
+            matches.append(self.names[i])
+            seen.add(i)
+            i += 1
+
+        position = self.blob.find(query)
+        while position != -1 and len(matches) < limit:
+            i = bisect_right(self.offsets, position) - 1
+            if i not in seen:
+                matches.append(self.names[i])
+                seen.add(i)
+            # Resume at the next name so each name is considered once
+            next_start = self.offsets[i + 1] if i + 1 < len(self.offsets) else len(self.blob)
+            position = self.blob.find(query, next_start)
+        return matches
+
+
+class CatalogIndex:
+    """Catalogs, schemas and tables of the whole metastore, loaded by ``loader()`` in one query."""
+
+    def __init__(self, loader, ttl_s: float = CATALOG_INDEX_TTL_S):
+        self._loader = loader
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._catalogs = None
+        self._schemas = {}
+        self._tables = {}
+        self._loaded_at = None
+        self._stale = False
+        self._refreshing = False
+        self._loads = 0
+        self._failures = 0
+        self._searches = 0
+
+    # --------------------------------------------------------------------
+    # Loading
+    # --------------------------------------------------------------------
+    def _build(self, rows):
+        catalogs, schemas, tables = set(), {}, {}
+        for catalog, schema, table in rows:
+            catalogs.add(catalog)
+            schemas.setdefault(catalog.lower(), set()).add(schema)
+            if table is not None:
+                tables.setdefault((catalog.lower(), schema.lower()), set()).add(table)
+        return (
+            NameIndex(catalogs),
+            {key: NameIndex(names) for key, names in schemas.items()},
+            {key: NameIndex(names) for key, names in tables.items()},
+        )
+
+    def refresh(self):
+        """Reloads every name; the previous index stays in use until the new one is built."""
+        self._load(force=True)
+
+    def _load(self, force: bool):
+        with self._load_lock:
+            if not force and self._catalogs is not None:
+                # Another request loaded it while this one waited
+                return
+            try:
+                with span("catalog_index_load"):
+                    catalogs, schemas, tables = self._build(self._loader())
+            except Exception:
+                with self._lock:
+                    self._failures += 1
+                raise
+            finally:
+                with self._lock:
+                    self._refreshing = False
+            with self._lock:
+                self._catalogs, self._schemas, self._tables = catalogs, schemas, tables
+                self._loaded_at = time.monotonic()
+                self._stale = False
+                self._loads += 1
+        print(f"🗂️ Indexed {len(catalogs)} catalogs, {sum(len(s) for s in schemas.values())} schemas "
+              f"and {sum(len(t) for t in tables.values())} tables")
+
+    def _ensure_loaded(self):
+        with self._lock:
+            loaded = self._catalogs is not None
+            expired = loaded and (self._stale or time.monotonic() - self._loaded_at > self.ttl_s)
+            refresh = expired and not self._refreshing
+            if refresh:
+                self._refreshing = True
+        if not loaded:
+            # First use: concurrent requests wait for the one load
+            self._load(force=False)
+        elif refresh:
+            threading.Thread(target=self._refresh_quietly, name="catalog-index", daemon=True).start()
+
+    def _refresh_quietly(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"⚠️ Catalog index refresh failed, keeping the previous one: {e}")
+
+    def invalidate(self):
+        """Marks the index stale so the next lookup refreshes it in the background."""
+        with self._lock:
+            self._stale = True
+
+    # --------------------------------------------------------------------
+    # Lookups
+    # --------------------------------------------------------------------
+    def _names(self, level: str, key=()):
+        self._ensure_loaded()
+        with self._lock:
+            self._searches += 1
+            if level == "catalogs":
+                return self._catalogs
+            if level == "schemas":
+                return self._schemas.get(key[0].lower())
+            return self._tables.get((key[0].lower(), key[1].lower()))
+
+    def search_catalogs(self, query: str = "", limit: int = DROPDOWN_LIMIT):
+        return self._names("catalogs").search(query, limit)
+
+    def search_schemas(self, catalog: str, query: str = "", limit: int = DROPDOWN_LIMIT):
+        names = self._names("schemas", (catalog,))
+        return names.search(query, limit) if names is not None else []
+
+    def search_tables(self, catalog: str, schema: str, query: str = "", limit: int = DROPDOWN_LIMIT):
+        names = self._names("tables", (catalog, schema))
+        return names.search(query, limit) if names is not None else []
+
+    def stats(self):
+        with self._lock:
+            return {
+                "catalogs": len(self._catalogs) if self._catalogs is not None else 0,
+                "schemas": sum(len(s) for s in self._schemas.values()),
+                "tables": sum(len(t) for t in self._tables.values()),
+                "age_s": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at is not None else 0.0,
+                "loads": self._loads,
+                "failures": self._failures,
+                "searches": self._searches,
+            }
@@ -0,0 +1,189 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class PoolTimeoutError(TimeoutError):
+    """Raised when no connection becomes available within the acquire timeout."""
+
+
+class _PooledConnection:
+    def __init__(self, raw):
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.last_checked = self.created_at
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of SQL warehouse connections.
+
+    Connections are created on demand up to ``max_size``, health-checked before
+    reuse once they have been idle for ``health_check_after`` seconds, reaped after
+    ``max_idle`` seconds without use, and replaced when they fail.
+    """
+
+    def __init__(self, connect, max_size=8, acquire_timeout=30.0,
+                 max_idle=300.0, health_check_after=60.0, health_query="SELECT 1"):
+        self._connect = connect
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_idle = max_idle
+        self.health_check_after = health_check_after
+        self.health_query = health_query
+
+        self._idle = deque()
+        self._open = 0
+        self._cond = threading.Condition()
+
+        # Wait-time statistics (seconds)
+        self._waits = deque(maxlen=1000)
+        self._acquired = 0
+        self._timeouts = 0
+        self._reconnects = 0
+        self._reaped = 0
+
+    # --------------------------------------------------------------------
+    # Borrowing
+    # --------------------------------------------------------------------
+    @contextmanager
+    def connection(self):
+        """Borrows a connection for the duration of the ``with`` block."""
+        pooled = self._acquire()
+        failed = False
+        try:
+            yield pooled.raw
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._release(pooled, check=failed)
+
+    @contextmanager
+    def cursor(self):
+        """Borrows a connection and yields a cursor on it."""
+        with self.connection() as conn:
+            with conn.cursor() as cursor:
+                yield cursor
+
+    def _acquire(self):
+        started = time.monotonic()
+        deadline = started + self.acquire_timeout
+        pooled = None
+        create = False
+
+        with self._cond:
+            self._reap_locked()
+            while pooled is None and not create:
+                if self._idle:
+                    pooled = self._idle.pop()
+                elif self._open < self.max_size:
+                    self._open += 1
+                    create = True
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            f"No SQL connection available after {self.acquire_timeout}s "
+                            f"(max_size={self.max_size})"
+                        )
+                    self._cond.wait(remaining)
+
+        try:
+            if create:
+                pooled = _PooledConnection(self._connect())
+            elif time.monotonic() - pooled.last_used > self.health_check_after and not self._is_healthy(pooled):
+                self._close_quietly(pooled)
+                pooled = _PooledConnection(self._connect())
+                with self._cond:
+                    self._reconnects += 1
+        except Exception:
+            # The slot was reserved for us — give it back before surfacing the error
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._acquired += 1
+            self._waits.append(time.monotonic() - started)
+        return pooled
+
+    def _release(self, pooled, check=False):
+        if check and not self._is_healthy(pooled):
+            self._close_quietly(pooled)
+            with self._cond:
+                self._open -= 1
+                self._reconnects += 1
+                self._cond.notify()
+            return
+
+        pooled.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    # --------------------------------------------------------------------
+    # Health and reaping
+    # --------------------------------------------------------------------
+    def _is_healthy(self, pooled):
+        try:
+            with pooled.raw.cursor() as cursor:
+                cursor.execute(self.health_query)
+                cursor.fetchall()
+            pooled.last_checked = time.monotonic()
+            return True
+        except Exception as e:
+            print(f"⚠️ Discarding unhealthy SQL connection: {type(e).__name__}: {e}")
+            return False
+
+    def _reap_locked(self):
+        """Closes connections idle longer than ``max_idle``. Caller holds the lock."""
+        now = time.monotonic()
+        # Idle connections are appended on release, so the oldest sit at the left
+        while self._idle and now - self._idle[0].last_used > self.max_idle:
+            self._close_quietly(self._idle.popleft())
+            self._open -= 1
+            self._reaped += 1
+
+    def reap_idle(self):
+        with self._cond:
+            self._reap_locked()
+            self._cond.notify_all()
+
+    @staticmethod
+    def _close_quietly(pooled):
+        try:
+            pooled.raw.close()
+        except Exception:
+            pass
+
+    def close(self):
+        with self._cond:
+            while self._idle:
+                self._close_quietly(self._idle.popleft())
+                self._open -= 1
+            self._cond.notify_all()
+
+    # --------------------------------------------------------------------
+    # Stats
+    # --------------------------------------------------------------------
+    def stats(self):
+        with self._cond:
+            waits = sorted(self._waits)
+            return {
+                "max_size": self.max_size,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._open - len(self._idle),
+                "acquired": self._acquired,
+                "timeouts": self._timeouts,
+                "reconnects": self._reconnects,
+                "reaped": self._reaped,
+                "wait_avg_ms": round(1000 * sum(waits) / len(waits), 2) if waits else 0.0,
+                "wait_p95_ms": round(1000 * waits[int(0.95 * (len(waits) - 1))], 2) if waits else 0.0,
+                "wait_max_ms": round(1000 * waits[-1], 2) if waits else 0.0,
+            }
@@ -1,67 +1,255 @@
+import contextvars
 import os
+import time
+import threading
 import uuid
-import pandas as pd
+import pyarrow as pa
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack, contextmanager
 import dotenv
-from databricks import sql
-from databricks.sdk.core import Config
+from backends import make_backend
+from catalog_index import BULK_QUERY, DROPDOWN_LIMIT, CatalogIndex, NameIndex
+from metadata_cache import MetadataCache
+from metrics import register_gauges, span
+from row_index import DELETE_COLUMN, commit_index, diff_against_index, drop_indexes
+from shared_store import shared_store
+from staging import PARQUET_COMPRESSION, STAGED_DIR, stage_shards
+from temp_store import UPLOAD_DIR, temp_store
+from volume_store import SUCCESS_MARKER, VolumeStore, staging_key
+from upload_artifacts import (column_bounds, combine_artifacts, dedupe_artifact, distinct_values, resolve_columns,
+                              with_text_columns)
+from write_planner import WriteStats, plan_write, pruning_predicates, replace_predicate, values_parameters, values_source
 
-from databricks.sdk import WorkspaceClient
+dotenv.load_dotenv()
 
-w = WorkspaceClient()
 
-cfg = Config()
+# ------------------------------------------------------------------------
+# Lazily created clients — nothing here talks to Databricks at import time,
+# so the app can start even while the SQL warehouse is asleep.
+# ------------------------------------------------------------------------
+_client_lock = threading.Lock()
+_cfg = None
+_workspace_client = None
 
-conn = sql.connect(
-    server_hostname=cfg.host,
-    http_path="/sql/1.0/warehouses/def405ae360efab4",
-    credentials_provider=lambda: cfg.authenticate,
-    staging_allowed_local_path=["."],
 
-)
+def get_config():
+    global _cfg
+    with _client_lock:
+        if _cfg is None:
+            from databricks.sdk.core import Config
+            _cfg = Config()
+        return _cfg
 
 
-dotenv.load_dotenv()
+def get_workspace_client():
+    global _workspace_client
+    cfg = get_config()
+    with _client_lock:
+        if _workspace_client is None:
+            from databricks.sdk import WorkspaceClient
+            _workspace_client = WorkspaceClient(config=cfg)
+        return _workspace_client
+
+
+def _connect():
+    from databricks import sql
+
+    cfg = get_config()
+    return sql.connect(
+        server_hostname=cfg.host,
+        http_path="/sql/1.0/warehouses/def405ae360efab4",
+        credentials_provider=lambda: cfg.authenticate,
+        staging_allowed_local_path=[".", UPLOAD_DIR],
+    )
+
+
+# A pool of warehouse connections, or the local DuckDB stand-in (UPLOADER_BACKEND=local)
+backend = make_backend(_connect)
+
 
 client_id = os.getenv('DATABRICKS_CLIENT_ID')
 client_secret = os.getenv('DATABRICKS_CLIENT_SECRET')
 
 
+STAGING_VOLUME = os.getenv("STAGING_VOLUME_PATH", "/Volumes/main/chynoweth/demovolume/stg")
+BATCH_PUT_WORKERS = int(os.getenv("BATCH_PUT_WORKERS", "4"))
+# Each staged file or shard PUT is retried this many times before the write fails
+PUT_RETRIES = int(os.getenv("PUT_RETRIES", "3"))
+# Partition columns with more distinct values than this in one upload are not pruned on
+MAX_PRUNE_VALUES = int(os.getenv("MERGE_MAX_PRUNE_VALUES", "1000"))
+# Replace columns with more distinct values than this are replaced by their min/max range instead
+MAX_REPLACE_VALUES = int(os.getenv("REPLACE_MAX_VALUES", "1000"))
+# Uploads up to this many rows and bytes skip the Volume and are sent as parameterized VALUES
+DIRECT_WRITE_MAX_ROWS = int(os.getenv("DIRECT_WRITE_MAX_ROWS", "500"))
+DIRECT_WRITE_MAX_BYTES = int(os.getenv("DIRECT_WRITE_MAX_BYTES", str(256 * 1024)))
+# Parameter markers per statement; an upload needing more is staged, so every write stays one statement
+DIRECT_WRITE_MAX_PARAMS = int(os.getenv("DIRECT_WRITE_MAX_PARAMS", "256"))
+
+
 # ------------------------------------------------------------------------
-# Sample catalog/schema/table data
+# Metadata cache shared by every Dash request thread, and through the
+# shared store by every server worker process
 # ------------------------------------------------------------------------
-def get_catalogs():
-    query = "show catalogs"
+metadata_cache = MetadataCache(store=shared_store)
 
-    with conn.cursor() as cursor:
-        cursor.execute(query)
-        df = cursor.fetchall_arrow().to_pandas()
-    return df['catalog'].tolist()
+# Statement counts and warehouse latency per write mode
+write_stats = WriteStats()
 
-def get_schemas(catalog: str):
-    query = f"SHOW SCHEMAS IN {catalog};"
+register_gauges("metadata_cache", metadata_cache.stats)
+# Content-addressed staging directories under the Volume, with background GC
+volume_store = VolumeStore(backend, f"{STAGING_VOLUME.rstrip('/')}/cas", store=shared_store)
 
-    with conn.cursor() as cursor:
-        cursor.execute(query)
-        df = cursor.fetchall_arrow().to_pandas()
-    return df['databaseName'].tolist()
+register_gauges("sql_pool", backend.stats)
+register_gauges("staging_volume", volume_store.stats)
+register_gauges("writes", lambda: {
+    f"{mode}_{key}": value
+    for mode, stats in write_stats.summary().items()
+    for key, value in stats.items()
+})
 
-def get_tables(catalog: str, schema: str):
-    query = f"SHOW tables IN {catalog}.{schema};"
 
-    with conn.cursor() as cursor:
+def invalidate_table(table_name: str):
+    """Drops cached metadata for a fully qualified table after it has been written to."""
+    catalog, schema, table = table_name.split(".")
+    metadata_cache.invalidate("columns", (catalog, schema, table))
+    metadata_cache.invalidate("describe", (table_name,))
+    metadata_cache.invalidate("not_null", (table_name,))
+    metadata_cache.invalidate("tables", (catalog, schema))
+
+
+# ------------------------------------------------------------------------
+# Sample catalog/schema/table data
+# ------------------------------------------------------------------------
+def _fetch_column(query: str, column: str):
+    """Runs ``query`` and returns one column of the Arrow result as a list (no pandas round trip)."""
+    with span("metadata_query"), backend.cursor() as cursor:
         cursor.execute(query)
-        df = cursor.fetchall_arrow().to_pandas()
-    return df['tableName'].tolist()
+        return cursor.fetchall_arrow().column(column).to_pylist()
+
 
+def get_catalogs():
+    return metadata_cache.get_or_load(
+        "catalogs", (),
+        lambda: _fetch_column("show catalogs", "catalog"),
+    )
 
+def get_schemas(catalog: str):
+    return metadata_cache.get_or_load(
+        "schemas", (catalog,),
+        lambda: _fetch_column(f"SHOW SCHEMAS IN {catalog};", "databaseName"),
+    )
+
+def get_tables(catalog: str, schema: str):
+    return metadata_cache.get_or_load(
+        "tables", (catalog, schema),
+        lambda: _fetch_column(f"SHOW tables IN {catalog}.{schema};", "tableName"),
+    )
 
 def get_columns(catalog: str, schema: str, table: str):
-    query = f"SHOW columns IN {catalog}.{schema}.{table};"
+    return metadata_cache.get_or_load(
+        "columns", (catalog, schema, table),
+        lambda: _fetch_column(f"SHOW columns IN {catalog}.{schema}.{table};", "col_name"),
+    )
+
+
+def _describe_table(table_name: str):
+    with span("describe"), backend.cursor() as cursor:
+        cursor.execute(f"DESCRIBE TABLE {table_name}")
+        result = cursor.fetchall_arrow()
+
+    columns, partitions = {}, []
+    in_partitions = False
+    for col_name, data_type in zip(result.column("col_name").to_pylist(), result.column("data_type").to_pylist()):
+        if not col_name:
+            continue
+        # DESCRIBE appends a "# Partition Information" section listing the partition columns
+        if col_name.startswith("#"):
+            in_partitions = col_name.strip() == "# Partition Information" or (in_partitions and col_name.strip() == "# col_name")
+            continue
+        if in_partitions:
+            partitions.append(col_name)
+        else:
+            columns[col_name] = data_type
+    return {"columns": columns, "partitions": partitions}
 
-    with conn.cursor() as cursor:
-        cursor.execute(query)
-        df = cursor.fetchall_arrow().to_pandas()
-    return df['col_name'].tolist()
+
+# ------------------------------------------------------------------------
+# Searchable catalog/schema/table names for the dropdowns
+# ------------------------------------------------------------------------
+def _load_catalog_names():
+    with span("metadata_query"), backend.cursor() as cursor:
+        cursor.execute(BULK_QUERY)
+        rows = cursor.fetchall_arrow().to_pylist()
+    return [(row["table_catalog"], row["table_schema"], row["table_name"]) for row in rows]
+
+
+# Every name in the metastore, loaded with one information_schema query
+catalog_index = CatalogIndex(_load_catalog_names)
+register_gauges("catalog_index", catalog_index.stats)
+
+
+def _search_with_fallback(search, list_names, query: str, limit: int):
+    """Searches the bulk index, falling back to the per-level SHOW lookup if it can't be loaded."""
+    try:
+        return search()
+    except Exception as e:
+        print(f"⚠️ Catalog index unavailable, using SHOW instead: {e}")
+        return NameIndex(list_names()).search(query, limit)
+
+
+def search_catalogs(query: str = "", limit: int = DROPDOWN_LIMIT):
+    return _search_with_fallback(lambda: catalog_index.search_catalogs(query, limit), get_catalogs, query, limit)
+
+
+def search_schemas(catalog: str, query: str = "", limit: int = DROPDOWN_LIMIT):
+    return _search_with_fallback(lambda: catalog_index.search_schemas(catalog, query, limit),
+                                 lambda: get_schemas(catalog), query, limit)
+
+
+def search_tables(catalog: str, schema: str, query: str = "", limit: int = DROPDOWN_LIMIT):
+    return _search_with_fallback(lambda: catalog_index.search_tables(catalog, schema, query, limit),
+                                 lambda: get_tables(catalog, schema), query, limit)
+
+
+def get_table_schema(table_name: str):
+    """Returns ``{column: data_type}`` for a fully qualified table (cached)."""
+    return metadata_cache.get_or_load(
+        "describe", (table_name,),
+        lambda: _describe_table(table_name),
+    )["columns"]
+
+
+def get_partition_columns(table_name: str):
+    """Returns the partition columns of a fully qualified table (cached)."""
+    return metadata_cache.get_or_load(
+        "describe", (table_name,),
+        lambda: _describe_table(table_name),
+    )["partitions"]
+
+
+def _not_null_columns(table_name: str):
+    catalog, schema, table = table_name.split(".")
+    query = f"""
+        SELECT column_name FROM {catalog}.information_schema.columns
+        WHERE table_schema = '{schema}' AND table_name = '{table}' AND is_nullable = 'NO'
+    """
+    return _fetch_column(query, "column_name")
+
+
+def get_not_null_columns(table_name: str):
+    """Returns the NOT NULL columns of a fully qualified table (cached)."""
+    return metadata_cache.get_or_load(
+        "not_null", (table_name,),
+        lambda: _not_null_columns(table_name),
+    )
+
+
+def read_files_sql(file_path: str, file_format: str = "csv"):
+    """Builds the ``read_files(...)`` table function call for a staged file."""
+    file_format = file_format.lower()
+    if file_format == "csv":
+        return f"read_files('{file_path}', format => 'csv', header => true)"
+    return f"read_files('{file_path}', format => '{file_format}')"
 
 
 
@@ -72,7 +260,7 @@ def put_file(filename: str, localfile_path: str, volume_path: str):
     query = f"PUT '{localfile_path}' INTO '{target_path}' OVERWRITE"
 
     try:
-        with conn.cursor() as cursor:
+        with span("put", bytes_=os.path.getsize(localfile_path)), backend.cursor() as cursor:
             cursor.execute(query)
             print(f"Successfully uploaded {localfile_path} → {target_path}")
     except Exception as e:
@@ -80,145 +268,476 @@ def put_file(filename: str, localfile_path: str, volume_path: str):
         print(f"Query: {query}")
         print(f"Error type: {type(e).__name__}")
         print(f"Message: {str(e)}")
+        raise
+    return target_path
 
 
-def truncate_table(table_name):
-    """Truncates a table in Databricks"""
-    query = f"truncate table {table_name}"
+def put_with_retries(filename: str, localfile_path: str, volume_path: str, retries: int = PUT_RETRIES):
+    """put_file() with exponential backoff, so one failed shard doesn't restart the upload."""
+    for attempt in range(retries + 1):
+        try:
+            return put_file(filename, localfile_path, volume_path)
+        except Exception:
+            if attempt == retries:
+                raise
+            delay = 2 ** attempt
+            print(f"🔁 Retrying PUT of {filename} in {delay}s ({attempt + 1}/{retries})")
+            time.sleep(delay)
+
+
+def _put_parallel(files: list, volume_dir: str):
+    """PUTs ``(local_path, name)`` pairs concurrently into ``volume_dir``; returns the failures."""
+    failures = []
+    with ThreadPoolExecutor(max_workers=BATCH_PUT_WORKERS) as executor:
+        # Carry the caller's trace id into the worker threads
+        futures = {
+            executor.submit(contextvars.copy_context().run, put_with_retries, name, path, volume_dir): name
+            for path, name in files
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                failures.append({"filename": futures[future], "error": f"{type(e).__name__}: {e}"})
+    return failures
+
+
+@contextmanager
+def _success_marker():
+    """An empty local file to PUT as the marker — one per staging, so concurrent jobs don't share it."""
+    path = os.path.join(STAGED_DIR, f"{uuid.uuid4().hex}{SUCCESS_MARKER}")
+    open(path, "wb").close()
+    try:
+        yield path
+    finally:
+        os.remove(path)
+
+
+def _remove_local_staging(artifact, local_paths):
+    for path in local_paths:
+        if path == artifact.source_path:
+            continue
+        temp_store.remove(path)
+        directory = os.path.dirname(path)
+        if directory != STAGED_DIR:
+            try:
+                # A sharded upload's part directory, once its last part is gone
+                os.rmdir(directory)
+            except OSError:
+                pass
+
 
+def _volume_key(artifact, schema_map: dict, staging_format: str):
+    """The content-addressed staging key for ``artifact`` staged as ``staging_format``."""
+    staging_format = (staging_format or "csv").lower()
+    options = (PARQUET_COMPRESSION,) if staging_format == "parquet" else ()
+    return staging_key(artifact.content_hash, staging_format,
+                       schema_map if staging_format == "parquet" else None, options)
+
+
+def _stage_to_volume(artifact, key: str, schema_map: dict, staging_format: str):
+    """
+    Makes sure ``artifact`` is staged under the directory for ``key`` and returns
+    the file format. If a LIST shows the directory already complete, nothing is
+    written or PUT at all. Callers hold ``volume_store.reading(key)`` from before
+    this call until the write is done, so the directory can't be collected in between.
+    """
+    staging_format = (staging_format or "csv").lower()
+    volume_dir = volume_store.path(key)
+    if volume_store.lookup(key):
+        print(f"♻️ {artifact.filename} is already staged at {volume_dir}; skipping PUT")
+        return staging_format
+
+    local_paths, file_format = stage_shards(artifact, schema_map, staging_format)
+    files = [(path, f"part-{i:05d}.{file_format}") for i, path in enumerate(local_paths)]
+    size = sum(os.path.getsize(path) for path in local_paths)
     try:
-        with conn.cursor() as cursor:
-            cursor.execute(query)
-            print(f"Successfully truncated table -> {table_name}")
-    except Exception as e:
-        print(f"Error executing PUT command:")
-        print(f"Query: {query}")
-        print(f"Error type: {type(e).__name__}")
-        print(f"Message: {str(e)}")
+        with temp_store.hold(*local_paths):
+            failures = _put_parallel(files, volume_dir)
+        if failures:
+            raise RuntimeError(
+                f"{len(failures)} of {len(files)} file(s) of {artifact.filename} failed to upload: {failures}")
+
+        # Written last: its presence is what marks the directory as complete
+        with _success_marker() as marker:
+            put_with_retries(SUCCESS_MARKER, marker, volume_dir)
+    finally:
+        # Every staging writes files of its own; once PUT (or failed) they aren't read again
+        _remove_local_staging(artifact, local_paths)
+    volume_store.record(key, size)
+    print(f"📦 Staged {len(files)} file(s) of {artifact.filename} into {volume_dir}")
+    return file_format
 
 
-def append_file(file_path: str, target_table: str, file_format='CSV'):
+def _source_path(keys: list, file_format: str):
+    """The read_files path for one or more staged directories (a glob over their part files)."""
+    directories = keys[0] if len(keys) == 1 else "{" + ",".join(keys) + "}"
+    return f"{volume_store.root}/{directories}/*.{file_format}"
+
+
+def stage_artifact(artifact, target_table: str, staging_format: str = "csv"):
     """
-    Dynamically appends data from a CSV file into an existing table while 
-    aligning to the table's schema (no schema drift).
+    Stages a parsed upload (typed to ``target_table`` when staging as Parquet) into
+    its content-addressed directory of the staging Volume, skipping the PUT when
+    the same bytes are already there. Large uploads are PUT as concurrent shards.
+    Returns ``(volume_path, file_format)`` where the path is a glob for read_files.
+    """
+    schema_map = get_table_schema(target_table) if staging_format == "parquet" else {}
+    # Typing string columns from inferred numbers would drop leading zeros
+    artifact = with_text_columns(artifact, schema_map)
+    key = _volume_key(artifact, schema_map, staging_format)
+    with volume_store.reading(key), temp_store.hold(*artifact.files()):
+        file_format = _stage_to_volume(artifact, key, schema_map, staging_format)
+    return _source_path([key], file_format), file_format
+
+
+def stage_batch(artifacts: list, target_table: str, staging_format: str, holds: ExitStack):
+    """
+    Stages many parsed uploads in parallel, each into its own content-addressed
+    directory. A failed file is reported, not fatal to the batch. The directories
+    are protected from collection until ``holds`` is closed.
+    Returns ``(volume_path, file_format, staged_filenames, failures, keys)`` where
+    the path is one glob over every staged directory.
+    """
+    schema_map = get_table_schema(target_table) if staging_format == "parquet" else {}
+    artifact_keys = [(artifact, _volume_key(artifact, schema_map, staging_format)) for artifact in artifacts]
+    holds.enter_context(volume_store.reading(*{key for _, key in artifact_keys}))
+
+    staged, failures, keys = [], [], []
+    file_format = (staging_format or "csv").lower()
+    with ThreadPoolExecutor(max_workers=BATCH_PUT_WORKERS) as executor:
+        # Carry the caller's trace id into the worker threads
+        futures = {
+            executor.submit(contextvars.copy_context().run, _stage_to_volume, artifact, key, schema_map,
+                            staging_format): (artifact, key)
+            for artifact, key in artifact_keys
+        }
+        for future in as_completed(futures):
+            artifact, key = futures[future]
+            try:
+                file_format = future.result()
+                keys.append(key)
+                staged.append(artifact.filename)
+            except Exception as e:
+                failures.append({"filename": artifact.filename, "error": f"{type(e).__name__}: {e}"})
+
+    print(f"📦 Staged {len(staged)} of {len(artifacts)} file(s) under {volume_store.root}")
+    volume_path = _source_path(sorted(set(keys)), file_format) if keys else None
+    return volume_path, file_format, staged, failures, keys
+
+
+def write_file(write_mode: str, file_path: str, target_table: str, file_format='CSV', merge_keys=None,
+               prune_predicates=(), delete_column=None, replace_where=None):
+    """
+    Writes a staged file into ``target_table`` using the fewest possible statements:
+    ``read_files(...)`` is inlined into a single INSERT (OVERWRITE / REPLACE WHERE)
+    or MERGE aligned to the table's cached schema (no schema drift, no temp view).
+    Returns ``{"statements": n, "rows_affected": n}`` and re-raises on failure.
     """
+    schema_map = get_table_schema(target_table)
+    statements = plan_write(
+        write_mode, target_table, read_files_sql(file_path, file_format), schema_map,
+        merge_keys=merge_keys, prune_predicates=prune_predicates, delete_column=delete_column,
+        replace_where=replace_where,
+    )
 
+    return _execute_statements(write_mode, target_table, [(statement, None) for statement in statements],
+                               source=file_path)
 
-    staging_view = f"tmp_staging_{uuid.uuid4().hex[:8]}"
 
+def write_rows(write_mode: str, artifact, target_table: str, merge_keys=None, prune_predicates=(),
+               delete_column=None, replace_where=None):
+    """
+    Writes a small upload straight from its rows: the write's statement carries every
+    row as named parameters in an inline VALUES table, so nothing is staged or PUT.
+    Same plans and return value as write_file().
+    """
+    schema_map = get_table_schema(target_table)
+    artifact = with_text_columns(artifact, schema_map)
+    columns = [*schema_map, *([delete_column] if delete_column else [])]
+    names = resolve_columns(artifact, columns)
+    table = artifact.read_table(columns=names)
+    rows = list(zip(*[table.column(name).to_pylist() for name in names]))
+
+    plan = plan_write(
+        write_mode, target_table, values_source(columns, len(rows)), schema_map,
+        merge_keys=merge_keys, prune_predicates=prune_predicates, delete_column=delete_column,
+        replace_where=replace_where,
+    )
+    statements = [(statement, values_parameters(rows)) for statement in plan]
+    return _execute_statements(write_mode, target_table, statements, source=f"{len(rows)} inline rows")
+
+
+def _execute_statements(write_mode: str, target_table: str, statements: list, source: str):
+    """Runs ``[(sql, parameters)]`` on one connection; returns statement and affected row counts."""
+    executed = 0
+    rows_affected = None
+    started = time.perf_counter()
+    failed = False
     try:
-        with conn.cursor() as cursor:
-            # 1️Get target table schema
-            cursor.execute(f"DESCRIBE TABLE {target_table}")
-            df_schema = cursor.fetchall_arrow().to_pandas()
-            df_schema = df_schema[df_schema["col_name"].notnull()]
-            schema_map = dict(zip(df_schema["col_name"], df_schema["data_type"]))
-            print(f"📘 Retrieved schema for {target_table}: {schema_map}")
-
-            # Create a temp view from CSV file
-            create_view_sql = f"""
-                CREATE OR REPLACE TEMP VIEW {staging_view} AS
-                SELECT * FROM read_files('{file_path}', format => 'csv', header => true);
-            """
-            cursor.execute(create_view_sql)
-            print(f"✅ Created staging view {staging_view} from {file_path}")
-
-            # Build dynamic cast SELECT
-            cast_exprs = []
-            for col, dtype in schema_map.items():
-                cast_exprs.append(f"CAST({col} AS {dtype}) AS {col}")
-            cast_sql = ", ".join(cast_exprs)
-
-            insert_sql = f"""
-                INSERT INTO {target_table}
-                SELECT {cast_sql}
-                FROM {staging_view};
-            """
-
-            # 4️⃣ Execute insert
-            cursor.execute(insert_sql)
-            print(f"✅ Data written to {target_table} with schema alignment")
+        with backend.cursor() as cursor:
+            for statement, parameters in statements:
+                print(f"🧠 Executing SQL:\n{statement}")
+                with span(f"sql_{statement.split(None, 1)[0].lower()}") as sp:
+                    cursor.execute(statement, parameters)
+                    executed += 1
+                    # INSERT and MERGE return num_affected_rows as the first column
+                    result = cursor.fetchone()
+                    if result:
+                        sp.rows = int(result[0])
+                        rows_affected = (rows_affected or 0) + sp.rows
+        print(f"✅ Data written to {target_table} ({write_mode}, {executed} statement(s), {rows_affected} rows)")
 
     except Exception as e:
-        print(f"Error appending file:")
-        print(f"File path: {file_path}")
+        failed = True
+        print(f"❌ Error writing file:")
+        print(f"Source: {source}")
         print(f"Target table: {target_table}")
+        print(f"Write mode: {write_mode}")
         print(f"Error type: {type(e).__name__}")
         print(f"Message: {str(e)}")
+        raise
 
     finally:
-        # Drop the temp view to clean up
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute(f"DROP VIEW IF EXISTS {staging_view}")
-                print(f"🧹 Dropped temp view {staging_view}")
-        except Exception as drop_err:
-            print(f"⚠️ Warning: Could not drop temp view {staging_view}: {drop_err}")
+        write_stats.record(write_mode, executed, time.perf_counter() - started, failed=failed)
 
+    return {"statements": executed, "rows_affected": rows_affected}
 
 
+def append_file(file_path: str, target_table: str, file_format='CSV'):
+    """
+    Dynamically appends data from a staged file into an existing table while 
+    aligning to the table's schema (no schema drift).
+    """
+    return write_file("append", file_path, target_table, file_format)
 
-def merge_file(file_path: str, target_table: str, merge_key: str, file_format='CSV'):
+
+def merge_file(file_path: str, target_table: str, merge_key, file_format='CSV', prune_predicates=()):
     """
-    Dynamically merges (upserts) data from a CSV file into an existing Databricks table
-    while aligning to the table's schema (no schema drift).
+    Dynamically merges (upserts) data from a staged file into an existing Databricks table
+    while aligning to the table's schema (no schema drift). ``merge_key`` may be a
+    single column or a list of columns for a composite key.
     """
+    return write_file("merge", file_path, target_table, file_format,
+                      merge_keys=merge_key, prune_predicates=prune_predicates)
 
-    staging_view = f"tmp_merge_{uuid.uuid4().hex[:8]}"
 
-    try:
-        with conn.cursor() as cursor:
-            # 1️⃣ Get target table schema
-            cursor.execute(f"DESCRIBE TABLE {target_table}")
-            df_schema = cursor.fetchall_arrow().to_pandas()
-            df_schema = df_schema[df_schema["col_name"].notnull()]
-            schema_map = dict(zip(df_schema["col_name"], df_schema["data_type"]))
-            print(f"📘 Retrieved schema for {target_table}: {schema_map}")
-
-            # 2️⃣ Create a temp view from CSV file
-            create_view_sql = f"""
-                CREATE OR REPLACE TEMP VIEW {staging_view} AS
-                SELECT * FROM read_files('{file_path}', format => '{file_format.lower()}', header => true);
-            """
-            cursor.execute(create_view_sql)
-            print(f"✅ Created staging view {staging_view} from {file_path}")
-
-            # 3️⃣ Build dynamic cast SELECT
-            cast_exprs = []
-            for col, dtype in schema_map.items():
-                cast_exprs.append(f"CAST(s.{col} AS {dtype}) AS {col}")
-            cast_sql = ", ".join(cast_exprs)
-
-            # 4️⃣ Build dynamic MERGE SQL
-            merge_sql = f"""
-                MERGE INTO {target_table} AS t
-                USING (
-                    SELECT {cast_sql}
-                    FROM {staging_view} AS s
-                ) AS s
-                ON t.{merge_key} = s.{merge_key}
-                WHEN MATCHED THEN UPDATE SET *
-                WHEN NOT MATCHED THEN INSERT *;
-            """
-            print(f"🧠 Executing MERGE SQL:\n{merge_sql}")
-
-            # 5️⃣ Execute the merge
-            cursor.execute(merge_sql)
-            print(f"✅ Data merged into {target_table} using key '{merge_key}'")
+def _is_orderable(arrow_type, dtype: str):
+    """True when min/max in the upload orders the same way as in the target column."""
+    text_target = dtype.lower() == "string" or dtype.lower().startswith(("varchar", "char"))
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return text_target
+    return not text_target and (
+        pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type)
+        or pa.types.is_decimal(arrow_type) or pa.types.is_temporal(arrow_type)
+    )
 
-    except Exception as e:
-        print(f"❌ Error merging file:")
-        print(f"File path: {file_path}")
-        print(f"Target table: {target_table}")
-        print(f"Merge key: {merge_key}")
-        print(f"Error type: {type(e).__name__}")
-        print(f"Message: {str(e)}")
 
-    finally:
-        # 6️⃣ Drop the temp view to clean up
+def prepare_merge(artifact, target_table: str, merge_keys: list, incremental: bool = False, deletes: bool = False):
+    """
+    Deduplicates the upload on ``merge_keys`` (last occurrence wins), reduces it to
+    new or changed rows when ``incremental`` is set, and builds pruning predicates
+    from the key ranges and partition values it contains.
+
+    The partition predicate assumes a key never moves between partitions, which
+    is what partitioning on a stable attribute (e.g. event date) gives you.
+    Returns ``(artifact, deduplicated_rows, prune_predicates, changes, pending_index)``.
+    """
+    artifact, removed = dedupe_artifact(artifact, merge_keys)
+    changes, pending_index = None, None
+    if incremental:
+        artifact, changes, pending_index = diff_against_index(artifact, target_table, merge_keys, deletes)
+    schema_map = get_table_schema(target_table)
+    arrow_schema = artifact.parquet_file().schema_arrow
+
+    orderable = [
+        key for key, name in zip(merge_keys, resolve_columns(artifact, merge_keys))
+        if _is_orderable(arrow_schema.field(name).type, schema_map[key])
+    ]
+    key_bounds = column_bounds(artifact, orderable) if orderable else {}
+
+    upload_columns = {name.lower() for name in artifact.column_names}
+    partition_values, null_columns = {}, []
+    # Delete markers carry only key values, so they'd fall outside any partition filter
+    partition_columns = [] if DELETE_COLUMN in artifact.column_names else get_partition_columns(target_table)
+    for col in partition_columns:
+        if col.lower() in upload_columns and col not in merge_keys:
+            values = distinct_values(artifact, col, MAX_PRUNE_VALUES)
+            if values is not None:
+                partition_values[col] = values
+                # distinct_values() skips NULL, but those rows must still match NULL-partition targets
+                if artifact.get_profile().get(col).nulls:
+                    null_columns.append(col)
+
+    predicates = pruning_predicates(schema_map, key_bounds, partition_values, null_columns=null_columns)
+    return artifact, removed, predicates, changes, pending_index
+
+
+def prepare_replace(artifacts: list, target_table: str, replace_columns=None):
+    """
+    Builds the REPLACE WHERE predicate covering every value of ``replace_columns``
+    (default: the table's partition columns) present in the uploads, so only
+    those partitions are rewritten. Columns with too many distinct values are
+    covered by their min/max range instead.
+    """
+    schema_map = get_table_schema(target_table)
+    by_lower = {col.lower(): col for col in schema_map}
+    columns = list(replace_columns or get_partition_columns(target_table))
+    if not columns:
+        raise ValueError(f"{target_table} is not partitioned; choose the column(s) to replace by.")
+    unknown = [col for col in columns if col.lower() not in by_lower]
+    if unknown:
+        raise KeyError(f"Column(s) not found in {target_table}: {', '.join(unknown)}")
+    columns = [by_lower[col.lower()] for col in columns]
+
+    column_values, bounds, null_columns = {}, {}, []
+    for col in columns:
+        values, low, high, nulls = set(), None, None, 0
+        for artifact in artifacts:
+            # Every inserted row must satisfy the predicate, so each upload needs the column
+            resolve_columns(artifact, [col])
+            nulls += artifact.get_profile().get(col).nulls
+            if values is not None:
+                found = distinct_values(artifact, col, MAX_REPLACE_VALUES)
+                values = None if found is None else values | set(found)
+                if values is not None and len(values) > MAX_REPLACE_VALUES:
+                    values = None
+        if values is None:
+            name = resolve_columns(artifacts[0], [col])[0]
+            if not _is_orderable(artifacts[0].parquet_file().schema_arrow.field(name).type, schema_map[col]):
+                raise ValueError(f"'{col}' has more than {MAX_REPLACE_VALUES} values and no usable range to replace by.")
+            for artifact in artifacts:
+                a_low, a_high = column_bounds(artifact, [col])[col]
+                if a_low is not None:
+                    low = a_low if low is None else min(low, a_low)
+                    high = a_high if high is None else max(high, a_high)
+            bounds[col] = (low, high)
+        else:
+            column_values[col] = sorted(values, key=str)
+        if nulls:
+            null_columns.append(col)
+    return replace_predicate(schema_map, column_values, bounds, null_columns)
+
+
+def stage_and_write(artifact, target_table: str, write_mode: str, staging_format: str = "csv", merge_keys=None,
+                    incremental: bool = False, deletes: bool = False, replace_columns=None):
+    """
+    Stages a parsed upload to the Volume and writes it into ``target_table``.
+    ``incremental`` merges send only rows that changed since the last incremental
+    merge on the same keys; ``deletes`` also removes keys missing from the upload.
+    ``replace`` writes rewrite only the values of ``replace_columns`` (default: the
+    partition columns) that the upload contains.
+    """
+    # Keep the upload's local files from being evicted while the job runs
+    with temp_store.hold(*artifact.files()):
+        # String columns must reach the table as the text that was uploaded (leading zeros and all)
+        artifact = with_text_columns(artifact, get_table_schema(target_table))
+        with temp_store.hold(*artifact.files()):
+            return _stage_and_write(artifact, target_table, write_mode, staging_format, merge_keys,
+                                    incremental, deletes, replace_columns)
+
+
+def _fits_one_statement(artifacts: list, target_table: str, extra_columns: int = 0):
+    """
+    True if ``artifacts`` are small enough to skip staging. Every write mode must stay
+    one atomic statement, so the rows only qualify when all of them fit in one.
+    """
+    if DIRECT_WRITE_MAX_ROWS <= 0:
+        return False
+    rows = sum(a.num_rows for a in artifacts)
+    size = sum(os.path.getsize(a.source_path) for a in artifacts)
+    if not rows or rows > DIRECT_WRITE_MAX_ROWS or size > DIRECT_WRITE_MAX_BYTES:
+        return False
+    return rows * (len(get_table_schema(target_table)) + extra_columns) <= DIRECT_WRITE_MAX_PARAMS
+
+
+def _stage_and_write(artifact, target_table: str, write_mode: str, staging_format: str, merge_keys,
+                     incremental: bool, deletes: bool, replace_columns=None):
+    removed, predicates, changes, pending_index, replace_where = 0, [], None, None, None
+    if write_mode == "replace":
+        if artifact.num_rows == 0:
+            print(f"⏭️ '{artifact.filename}' is empty; no partitions of {target_table} to replace")
+            return {"statements": 0, "rows_affected": 0, "deduplicated_rows": 0, "changes": None}
+        replace_where = prepare_replace([artifact], target_table, replace_columns)
+    if write_mode == "merge":
+        merge_keys = [merge_keys] if isinstance(merge_keys, str) else list(merge_keys or [])
+        artifact, removed, predicates, changes, pending_index = prepare_merge(
+            artifact, target_table, merge_keys, incremental, deletes)
+    if changes is None:
+        # Any other write makes the stored row hashes stale
+        drop_indexes(target_table)
+
+    if changes is not None and artifact.num_rows == 0:
+        print(f"⏭️ Nothing changed since the last incremental merge into {target_table}")
+        commit_index(pending_index)
+        return {"statements": 0, "rows_affected": 0, "deduplicated_rows": removed, "changes": changes}
+
+    delete_column = DELETE_COLUMN if DELETE_COLUMN in artifact.column_names else None
+    if _fits_one_statement([artifact], target_table, int(bool(delete_column))):
+        print(f"⚡ {artifact.num_rows} row(s) are sent inline; skipping the Volume")
+        try:
+            result = write_rows(write_mode, artifact, target_table, merge_keys=merge_keys, prune_predicates=predicates,
+                                delete_column=delete_column, replace_where=replace_where)
+        finally:
+            invalidate_table(target_table)
+        if pending_index is not None:
+            commit_index(pending_index)
+        return {**result, "deduplicated_rows": removed, "changes": changes, "direct": True}
+
+    schema_map = get_table_schema(target_table) if staging_format == "parquet" else {}
+    key = _volume_key(artifact, schema_map, staging_format)
+    with volume_store.reading(key):
+        file_format = _stage_to_volume(artifact, key, schema_map, staging_format)
+        volume_file_path = _source_path([key], file_format)
+        print(f"📂 Using uploaded file: {volume_file_path}")
+
+        try:
+            result = write_file(write_mode, volume_file_path, target_table, file_format,
+                                merge_keys=merge_keys, prune_predicates=predicates, delete_column=delete_column,
+                                replace_where=replace_where)
+        finally:
+            invalidate_table(target_table)
+    if pending_index is not None:
+        commit_index(pending_index)
+    return {**result, "deduplicated_rows": removed, "changes": changes}
+
+
+def stage_batch_and_write(artifacts: list, target_table: str, write_mode: str, staging_format: str = "csv",
+                          merge_keys=None, incremental: bool = False, deletes: bool = False, replace_columns=None):
+    """
+    Stages a batch of uploads in parallel and loads every file that staged
+    successfully with one set-based statement over their staged directories.
+    Merges combine the batch first so duplicate keys across files are resolved,
+    and so do batches small enough to be sent inline without staging.
+    """
+    # Closed only after the write, so no staged directory is collected before it is read
+    with ExitStack() as volume_holds:
+        with temp_store.hold(*[path for artifact in artifacts for path in artifact.files()]):
+            artifacts = [with_text_columns(artifact, get_table_schema(target_table)) for artifact in artifacts]
+            volume_holds.enter_context(temp_store.hold(*[path for artifact in artifacts for path in artifact.files()]))
+            if write_mode == "merge" or _fits_one_statement(artifacts, target_table):
+                combined = combine_artifacts(artifacts, get_table_schema(target_table))
+                result = stage_and_write(combined, target_table, write_mode, staging_format,
+                                         merge_keys, incremental, deletes, replace_columns)
+                return {**result, "files_loaded": [a.filename for a in artifacts], "files_failed": []}
+
+            volume_path, file_format, staged, failures, keys = stage_batch(artifacts, target_table, staging_format,
+                                                                           volume_holds)
+            # The predicate covers only the files that staged, so a failed file's partitions are left alone
+            replace_where = None
+            if write_mode == "replace" and staged:
+                staged_artifacts = [a for a in artifacts if a.filename in staged and a.num_rows]
+                replace_where = (prepare_replace(staged_artifacts, target_table, replace_columns)
+                                 if staged_artifacts else None)
+        drop_indexes(target_table)
+        if not staged:
+            raise RuntimeError(f"No files in the batch could be staged: {failures}")
+        if write_mode == "replace" and replace_where is None:
+            print(f"⏭️ Every staged file is empty; no partitions of {target_table} to replace")
+            return {"statements": 0, "rows_affected": 0, "files_loaded": staged, "files_failed": failures}
+
         try:
-            with conn.cursor() as cursor:
-                cursor.execute(f"DROP VIEW IF EXISTS {staging_view}")
-                print(f"🧹 Dropped temp view {staging_view}")
-        except Exception as drop_err:
-            print(f"⚠️ Warning: Could not drop temp view {staging_view}: {drop_err}")
+            result = write_file(write_mode, volume_path, target_table, file_format, replace_where=replace_where)
+        finally:
+            invalidate_table(target_table)
+    return {**result, "files_loaded": staged, "files_failed": failures}
@@ -0,0 +1,41 @@
+import os
+
+
+# ------------------------------------------------------------------------
+# Production server: gunicorn with several worker processes, each running
+# a pool of request threads.
+#
+#     gunicorn -c gunicorn.conf.py app:server
+#
+# Workers share upload sessions, artifact records, write-job status and
+# metadata through the shared store (shared_store.py), so any worker can
+# serve any request. Parsing and validation are CPU-bound and hold the GIL,
+# which is why the app scales across processes rather than threads.
+# ------------------------------------------------------------------------
+bind = f"0.0.0.0:{os.getenv('DATABRICKS_APP_PORT', os.getenv('PORT', '8000'))}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(os.cpu_count() or 1, 4))))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+worker_class = "gthread"
+# Parsing a multi-GB upload runs inside one request
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "600"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "120"))
+keepalive = 5
+# Workers import the app themselves: pools, caches and background threads
+# must not be created before the fork
+preload_app = False
+
+if os.getenv("UPLOADER_BACKEND", "databricks").lower() == "local":
+    # The local DuckDB database can only be opened by one process
+    workers = 1
+
+
+def on_starting(server):
+    """Runs once in the master before any worker starts: begins from a clean shared state."""
+    from shared_store import shared_store
+    from temp_store import temp_store
+
+    shared_store.reset()
+    shared_store.close()
+    # Nothing in the fresh store refers to files left by the previous run
+    temp_store.purge()
+    print(f"🚀 Starting {server.cfg.workers} worker(s) x {server.cfg.threads} thread(s) on {', '.join(server.cfg.bind)}")
@@ -0,0 +1,265 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import current_trace_id, register_gauges, traced
+from shared_store import pid_alive, shared_store
+
+
+# ------------------------------------------------------------------------
+# Background write jobs.
+# Writes run on a bounded worker pool instead of inside the Dash callback.
+# Jobs against the same target table run one at a time, in submission order;
+# jobs against different tables run in parallel. Every state change is
+# published to the shared store, so the job can be polled from any server
+# worker, and a shared per-table lock keeps writes from different workers
+# to the same table one at a time as well. A job whose table is locked by
+# another worker stays queued — no pool thread waits on it; one dispatcher
+# thread retries those locks and hands the job to the pool once it is free.
+# ------------------------------------------------------------------------
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED_STATES = (SUCCEEDED, FAILED)
+
+MAX_WORKERS = int(os.getenv("WRITE_JOB_WORKERS", "4"))
+MAX_FINISHED_JOBS = int(os.getenv("WRITE_JOB_HISTORY", "500"))
+# How long job records stay pollable from other workers
+JOB_RECORD_TTL_S = float(os.getenv("WRITE_JOB_RECORD_TTL_S", str(24 * 3600)))
+# How often jobs blocked by another worker's write retry the table lock
+BLOCKED_POLL_S = float(os.getenv("WRITE_JOB_BLOCKED_POLL_S", "0.5"))
+
+
+class WriteJob:
+    def __init__(self, target_table: str, description: str, trace_id: str = None):
+        self.job_id = uuid.uuid4().hex[:12]
+        # Worker process running the job; its exit means the job can't finish
+        self.pid = os.getpid()
+        self.trace_id = trace_id
+        self.target_table = target_table
+        self.description = description
+        self.status = QUEUED
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.rows_affected = None
+        self.result = None
+        self.error = None
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    def to_record(self):
+        return {
+            "job_id": self.job_id,
+            "pid": self.pid,
+            "trace_id": self.trace_id,
+            "target_table": self.target_table,
+            "description": self.description,
+            "status": self.status,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "rows_affected": self.rows_affected,
+            "result": self.result,
+            "error": self.error,
+        }
+
+    @classmethod
+    def from_record(cls, record):
+        job = cls.__new__(cls)
+        job.__dict__.update(record)
+        return job
+
+    def to_dict(self):
+        now = time.time()
+        record = self.to_record()
+        del record["pid"]
+        return {
+            **record,
+            "queued_s": round((self.started_at or now) - self.submitted_at, 3),
+            "run_s": round((self.finished_at or now) - self.started_at, 3) if self.started_at else None,
+        }
+
+
+class JobExecutor:
+    """Bounded background executor with per-target-table serialization and a job table."""
+
+    def __init__(self, max_workers=MAX_WORKERS, max_finished=MAX_FINISHED_JOBS, store=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="write-job")
+        self.store = store
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._max_finished = max_finished
+        # target_table -> deque of (job, fn) waiting behind the running job
+        self._waiting = {}
+        # target_table -> (job, fn) next in line, but the table is locked by another worker
+        self._blocked = {}
+        self._dispatcher = None
+
+    def submit(self, target_table: str, description: str, fn, trace_id: str = None):
+        """
+        Queues ``fn()`` to run against ``target_table`` and returns the job id.
+        ``fn`` may return a dict; its ``rows_affected`` key is copied onto the job.
+        The job runs under ``trace_id`` (default: the caller's current trace).
+        """
+        trace_id = trace_id or current_trace_id()
+        job = WriteJob(target_table, description, trace_id)
+        fn = traced(trace_id, fn)
+        self._publish(job)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            if target_table in self._waiting:
+                # Another job owns this table — run after it
+                self._waiting[target_table].append((job, fn))
+                print(f"⏳ Job {job.job_id} queued behind running write to {target_table}")
+                return job.job_id
+            self._waiting[target_table] = deque()
+
+        self._dispatch(job, fn)
+        return job.job_id
+
+    def _dispatch(self, job, fn):
+        """Runs the job at the head of its table's queue, or parks it while another worker holds the table."""
+        try:
+            owner = self._try_table_lock(job)
+        except Exception as e:
+            # The shared store is unreachable; fail the job rather than write unserialized
+            self._fail(job, e)
+            self._start_next(job.target_table)
+            return
+        if owner is None:
+            with self._lock:
+                self._blocked[job.target_table] = (job, fn)
+                self._start_dispatcher_locked()
+            print(f"⏳ Job {job.job_id} waiting for another worker's write to {job.target_table}")
+            return
+        self._executor.submit(self._run, job, fn, owner)
+
+    def _try_table_lock(self, job):
+        """Owner token of the shared per-table lock, or None if another worker process holds it."""
+        if self.store is None:
+            return "local"
+        return self.store.try_acquire(f"write:{job.target_table}")
+
+    def _start_dispatcher_locked(self):
+        if self._dispatcher is None:
+            self._dispatcher = threading.Thread(target=self._dispatch_blocked, name="write-job-dispatch", daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch_blocked(self):
+        while True:
+            time.sleep(BLOCKED_POLL_S)
+            with self._lock:
+                blocked = list(self._blocked.values())
+            for job, fn in blocked:
+                try:
+                    owner = self._try_table_lock(job)
+                except Exception as e:
+                    print(f"⚠️ Job {job.job_id}: could not check the table lock: {e}")
+                    continue
+                if owner is None:
+                    continue
+                with self._lock:
+                    del self._blocked[job.target_table]
+                self._executor.submit(self._run, job, fn, owner)
+
+    def _run(self, job, fn, owner):
+        job.status = RUNNING
+        job.started_at = time.time()
+        self._publish(job)
+        print(f"🏃 Job {job.job_id} started: {job.description}")
+        try:
+            result = fn() or {}
+            job.result = result
+            job.rows_affected = result.get("rows_affected")
+            job.status = SUCCEEDED
+            print(f"✅ Job {job.job_id} succeeded")
+        except Exception as e:
+            self._fail(job, e)
+        finally:
+            job.finished_at = time.time()
+            self._publish(job)
+            if self.store is not None:
+                try:
+                    self.store.release(f"write:{job.target_table}", owner)
+                except Exception as e:
+                    # The lock is freed anyway once this worker exits
+                    print(f"⚠️ Job {job.job_id}: could not release the table lock: {e}")
+            self._start_next(job.target_table)
+
+    def _fail(self, job, error):
+        job.error = f"{type(error).__name__}: {error}"
+        job.status = FAILED
+        job.finished_at = job.finished_at or time.time()
+        print(f"❌ Job {job.job_id} failed: {job.error}")
+        self._publish(job)
+
+    def _publish(self, job):
+        if self.store is None:
+            return
+        try:
+            self.store.set("jobs", job.job_id, job.to_record(), ttl_s=JOB_RECORD_TTL_S)
+        except Exception as e:
+            print(f"⚠️ Could not publish job {job.job_id}: {e}")
+
+    def _start_next(self, target_table):
+        with self._lock:
+            waiting = self._waiting.get(target_table)
+            if waiting:
+                next_job, next_fn = waiting.popleft()
+            else:
+                self._waiting.pop(target_table, None)
+                next_job = None
+            self._trim_locked()
+        if next_job is not None:
+            self._dispatch(next_job, next_fn)
+
+    def _trim_locked(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self._max_finished)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str):
+        """Returns the job as a dict, or None if unknown — wherever it was submitted."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return job.to_dict()
+        if self.store is None:
+            return None
+        record = self.store.get("jobs", job_id)
+        return _shared_job(record).to_dict() if record else None
+
+    def list_jobs(self):
+        if self.store is None:
+            with self._lock:
+                return [job.to_dict() for job in self._jobs.values()]
+        jobs = [_shared_job(record) for _, record in self.store.items("jobs")]
+        return [job.to_dict() for job in sorted(jobs, key=lambda job: job.submitted_at)]
+
+    def stats(self):
+        with self._lock:
+            counts = {state: 0 for state in (QUEUED, RUNNING, SUCCEEDED, FAILED)}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+
+def _shared_job(record):
+    """Rebuilds a job another worker published, failing it if that worker is gone."""
+    job = WriteJob.from_record(record)
+    if not job.finished and not pid_alive(job.pid):
+        job.status = FAILED
+        job.error = "The server worker running this job exited before it finished."
+        job.finished_at = job.finished_at or time.time()
+    return job
+
+
+job_executor = JobExecutor(store=shared_store)
+register_gauges("write_jobs", job_executor.stats)
@@ -1,6 +1,8 @@
-from dash import dcc, html
+from dash import dash_table, dcc, html
 import dash_bootstrap_components as dbc
-import databricks_funcs as df
+
+from preview import PAGE_SIZE
+from readers import supported_extensions
 
 
 # Header
@@ -40,19 +42,19 @@ table_selection_card = dbc.Card([
                         html.Label("📁 Catalog", className="fw-semibold"),
                         dcc.Dropdown(
                             id="catalog-dd",
-                            options=[{"label": c, "value": c} for c in df.get_catalogs()],
-                            placeholder="Select a catalog",
+                            options=[],  # loaded on first page load by load_catalogs_dd
+                            placeholder="Select or search a catalog",
                             searchable=True,
                             clearable=True,
                         ),
                     ], md=4),
                     dbc.Col([
                         html.Label("📂 Schema", className="fw-semibold"),
-                        dcc.Dropdown(id="schema-dd", placeholder="Select a schema", searchable=True, clearable=True),
+                        dcc.Dropdown(id="schema-dd", placeholder="Select or search a schema", searchable=True, clearable=True),
                     ], md=4),
                     dbc.Col([
                         html.Label("🧱 Table", className="fw-semibold"),
-                        dcc.Dropdown(id="table-dd", placeholder="Select a table", searchable=True, clearable=True),
+                        dcc.Dropdown(id="table-dd", placeholder="Type to search tables", searchable=True, clearable=True),
                     ], md=4),
                 ], className="g-3"),
             ])
@@ -64,12 +66,15 @@ table_selection_card = dbc.Card([
 upload_file_card = dbc.Card([
             dbc.CardHeader("Step 2: Upload Your File"),
             dbc.CardBody([
-                html.Label("Upload File (.csv)", className="fw-semibold"),
-                dcc.Upload(
-                    id="upload-data",
-                    children=html.Div([
-                        "Drag and drop or ", html.A("browse for a file", className="text-decoration-underline fw-semibold")
-                    ]),
+                html.Label("Upload File(s) (.csv, .xlsx, .parquet, .json)", className="fw-semibold"),
+                # Files are streamed in chunks to /api/uploads by assets/chunked_upload.js
+                html.Label(
+                    id="upload-dropzone",
+                    htmlFor="upload-input",
+                    children=[
+                        "Drag and drop or ", html.Span("browse for files", className="text-decoration-underline fw-semibold"),
+                        html.Div(html.Input(id="upload-input", type="file", accept=",".join(supported_extensions()), multiple=True), style={"display": "none"}),
+                    ],
                     style={
                         'width': '100%',
                         'height': '80px',
@@ -78,12 +83,13 @@ upload_file_card = dbc.Card([
                         'borderStyle': 'dashed',
                         'borderRadius': '8px',
                         'textAlign': 'center',
-                        'backgroundColor': '#fafafa'
+                        'backgroundColor': '#fafafa',
+                        'cursor': 'pointer',
                     },
-                    multiple=False,
                 ),
+                dbc.Progress(id="upload-progress", value=0, className="mt-2", style={"height": "18px"}),
+                html.Div(id="upload-status", className="text-muted mt-1", style={"fontSize": "0.85rem"}),
                 html.Div(id="file-info", style={"marginTop": "20px"}),
-                html.Small("💡 Note: CSV files only for now.", className="text-muted")
             ])
         ], className="mb-4 shadow-sm")
 
@@ -98,6 +104,7 @@ write_options_card = dbc.Card([
                             id="write-mode",
                             options=[
                                 {"label": " Overwrite table", "value": "overwrite"},
+                                {"label": " Replace partitions present in upload", "value": "replace"},
                                 {"label": " Append to table", "value": "append"},
                                 {"label": " Merge into table (UPSERT)", "value": "merge"},
                             ],
@@ -106,16 +113,47 @@ write_options_card = dbc.Card([
                         ),
                         dbc.Tooltip("Select how data should be written to the table.",
                                     target="write-mode", placement="right"),
+                        html.Label("Staging Format", className="fw-semibold mt-3"),
+                        dcc.RadioItems(
+                            id="staging-format",
+                            options=[
+                                {"label": " CSV (as uploaded)", "value": "csv"},
+                                {"label": " Parquet (typed, compressed)", "value": "parquet"},
+                            ],
+                            value="csv",
+                            labelStyle={'display': 'block', 'marginTop': '0.25rem'}
+                        ),
                     ], md=4),
                     dbc.Col([
                         html.Div(id="merge-section", children=[
-                            html.Label("Merge Key (ID column)", className="fw-semibold"),
+                            html.Label("Merge Key (one or more ID columns)", className="fw-semibold"),
                             dcc.Dropdown(id="merge-id-dd",
-                                         placeholder="Select ID column for MERGE",
+                                         placeholder="Select ID column(s) for MERGE",
+                                         multi=True,
                                          clearable=True),
+                            dcc.Checklist(
+                                id="merge-options",
+                                options=[
+                                    {"label": " Incremental: only send rows that changed since the last load", "value": "incremental"},
+                                    {"label": " Delete rows whose keys are missing from this upload", "value": "deletes"},
+                                ],
+                                value=[],
+                                className="mt-2",
+                                labelStyle={'display': 'block', 'marginTop': '0.25rem'}
+                            ),
                             html.Div(id="merge-help", className="text-muted mt-2",
                                      style={"fontSize": "0.85rem"})
-                        ])
+                        ]),
+                        html.Div(id="replace-section", style={"display": "none"}, children=[
+                            html.Label("Replace By (defaults to the table's partition columns)", className="fw-semibold"),
+                            dcc.Dropdown(id="replace-cols-dd",
+                                         placeholder="Partition columns",
+                                         multi=True,
+                                         clearable=True),
+                            html.Div("Only rows whose values in these columns appear in the upload are replaced; "
+                                     "the rest of the table is left untouched.",
+                                     className="text-muted mt-2", style={"fontSize": "0.85rem"}),
+                        ]),
                     ], md=8),
                 ])
             ])
@@ -131,10 +169,54 @@ action_preview_card = dbc.Card([
                         dbc.Button("🚀 Execute Write", id="execute-btn", color="primary", className="mt-2 ms-2"),
                     ], md=12),
                 ]),
+                html.Div(id="validation-report", className="mt-3", style={"fontSize": "0.85rem"}),
+                html.Div(id="job-status", className="text-muted mt-3", style={"fontSize": "0.85rem"}),
+                dcc.Interval(id="job-poll", interval=2000, disabled=True),
                 html.Div(id="preview-alert", className="mt-3"),
                 html.Hr(),
-                html.H5("Preview (first 10 rows)", className="fw-semibold"),
-                html.Div(id="preview-table", style={'overflowX': 'auto'}),
+                html.H5("Preview", className="fw-semibold"),
+                dbc.Tabs([
+                    dbc.Tab(label="Rows", tab_id="preview-rows", children=[
+                        # Paged, sorted and filtered on the server over the parsed upload
+                        dash_table.DataTable(
+                            id="preview-table",
+                            columns=[],
+                            data=[],
+                            page_action="custom",
+                            page_current=0,
+                            page_size=PAGE_SIZE,
+                            sort_action="custom",
+                            sort_mode="multi",
+                            sort_by=[],
+                            filter_action="custom",
+                            filter_query="",
+                            style_table={"overflowX": "auto"},
+                            style_cell={"textAlign": "left", "padding": "5px", "fontFamily": "sans-serif"},
+                            style_header={"backgroundColor": "#f1f3f4", "fontWeight": "bold"},
+                        ),
+                    ]),
+                    dbc.Tab(label="Column profile", tab_id="preview-profile", children=[
+                        # Built while the upload was parsed: nulls, min/max, distinct count, inferred type
+                        dash_table.DataTable(
+                            id="profile-table",
+                            columns=[
+                                {"name": "Column", "id": "column"},
+                                {"name": "Type", "id": "type"},
+                                {"name": "Inferred SQL type", "id": "inferred_type"},
+                                {"name": "Nulls", "id": "nulls"},
+                                {"name": "Distinct", "id": "distinct"},
+                                {"name": "Min", "id": "min"},
+                                {"name": "Max", "id": "max"},
+                                {"name": "Key candidate", "id": "key_candidate"},
+                            ],
+                            data=[],
+                            sort_action="native",
+                            style_table={"overflowX": "auto"},
+                            style_cell={"textAlign": "left", "padding": "5px", "fontFamily": "sans-serif"},
+                            style_header={"backgroundColor": "#f1f3f4", "fontWeight": "bold"},
+                        ),
+                    ]),
+                ], active_tab="preview-rows", className="mb-2"),
             ])
         ], className="mb-4 shadow-sm")
 
@@ -153,6 +235,12 @@ toast_notifications = dbc.Toast(
 
 
 
+# Fires the initial catalog lookup once the page is served
+page_location = dcc.Location(id="url", refresh=False)
+
 # Hidden stores
 uploaded_dataframe = dcc.Store(id="uploaded-df", storage_type="memory")
-uploaded_file_path = dcc.Store(id="uploaded-file-path", storage_type="memory")
+upload_meta = dcc.Store(id="upload-meta", storage_type="memory")
+upload_artifacts = dcc.Store(id="upload-artifacts", storage_type="memory")
+write_job = dcc.Store(id="write-job", storage_type="memory")
+preview_source = dcc.Store(id="preview-source", storage_type="memory")
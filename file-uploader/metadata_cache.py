@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# ------------------------------------------------------------------------
+# Default freshness (seconds) for each level of the catalog tree.
+# Catalogs rarely change, columns are the most likely to drift.
+# ------------------------------------------------------------------------
+DEFAULT_TTLS = {
+    "catalogs": 600,
+    "schemas": 300,
+    "tables": 120,
+    "columns": 60,
+    "describe": 60,
+    "not_null": 60,
+}
+
+DEFAULT_MAX_ENTRIES = 2048
+
+# Joins a key's parts into the shared store key; never appears in identifiers
+_SEPARATOR = "\x1f"
+
+
+def _store_key(key):
+    return _SEPARATOR.join(str(part) for part in key)
+
+
+class MetadataCache:
+    """
+    Thread-safe, size-bounded LRU cache for warehouse metadata lookups.
+
+    Entries are keyed by ``(level, *parts)`` — e.g. ``("tables", "main", "sales")`` —
+    and expire after the TTL configured for their level. With a ``store``, entries
+    live in the shared store instead of this process's memory, so a lookup one
+    worker process loaded is a hit in every other worker, and an invalidation
+    reaches all of them at once. The shared entries are bounded by ``max_entries``
+    too, dropping the ones closest to expiry first (the store doesn't track use).
+    """
+
+    def __init__(self, ttls=None, max_entries=DEFAULT_MAX_ENTRIES, store=None):
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_entries = max_entries
+        self.store = store
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, level, parts=()):
+        """Returns the cached value, or None when missing or expired."""
+        key = (level, *parts)
+        if self.store is not None:
+            return self.store.get("metadata", _store_key(key))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, level, parts, value):
+        key = (level, *parts)
+        ttl = self.ttls.get(level, 60)
+        if self.store is not None:
+            self.store.set("metadata", _store_key(key), value, ttl_s=ttl)
+            dropped = self.store.trim("metadata", self.max_entries)
+            with self._lock:
+                self.evictions += dropped
+            return
+        expires_at = time.monotonic() + ttl
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, level, parts, loader):
+        """Returns the cached value for ``(level, *parts)``, calling ``loader()`` on a miss."""
+        value = self.get(level, parts)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return value
+
+        with self._lock:
+            self.misses += 1
+        # Load outside the lock so a slow warehouse call does not block other lookups
+        value = loader()
+        self.set(level, parts, value)
+        return value
+
+    def invalidate(self, level=None, parts=()):
+        """
+        Drops every entry whose key starts with ``(level, *parts)``.
+        With no level, parts are matched against every level.
+        """
+        parts = tuple(parts)
+        if self.store is not None:
+            return self._invalidate_shared(level, parts)
+        with self._lock:
+            stale = [
+                key for key in self._entries
+                if (level is None or key[0] == level) and key[1:1 + len(parts)] == parts
+            ]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def _invalidate_shared(self, level, parts):
+        if level is not None:
+            prefix = _store_key((level, *parts))
+            # The exact key, plus every longer key under it
+            return (self.store.delete_prefix("metadata", prefix + _SEPARATOR)
+                    + self.store.delete("metadata", prefix))
+        stale = [
+            store_key for store_key, _ in self.store.items("metadata")
+            if tuple(store_key.split(_SEPARATOR)[1:1 + len(parts)]) == parts
+        ]
+        for store_key in stale:
+            self.store.delete("metadata", store_key)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.store is not None:
+            self.store.delete_prefix("metadata")
+
+    def stats(self):
+        entries = self.store.count("metadata") if self.store is not None else None
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries) if entries is None else entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
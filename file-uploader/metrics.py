@@ -0,0 +1,175 @@
+import contextvars
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import Response
+
+
+# ------------------------------------------------------------------------
+# Per-stage timing spans and Prometheus-style metrics.
+# Every pipeline stage (chunk receive, parse, stage, PUT, DESCRIBE, write...)
+# runs inside span(); durations feed histograms and bytes/rows feed counters,
+# all tagged with the current request's trace id in the logs.
+# ------------------------------------------------------------------------
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # label value -> [bucket counts..., +Inf count], sum
+        self._series = {}
+
+    def observe(self, label: str, value: float):
+        with self._lock:
+            counts, total = self._series.get(label, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._series[label] = (counts, total + value)
+
+    def render(self, label_name: str):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{{label_name}="{label}",le="{bound}"}} {cumulative}')
+                cumulative += counts[-1]
+                lines.append(f'{self.name}_bucket{{{label_name}="{label}",le="+Inf"}} {cumulative}')
+                lines.append(f'{self.name}_sum{{{label_name}="{label}"}} {total}')
+                lines.append(f'{self.name}_count{{{label_name}="{label}"}} {cumulative}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, label: str, value: float = 1):
+        with self._lock:
+            self._values[label] = self._values.get(label, 0) + value
+
+    def render(self, label_name: str):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{{{label_name}="{label}"}} {value}')
+        return lines
+
+
+stage_seconds = Histogram("uploader_stage_seconds", "Time spent in each upload/write pipeline stage.")
+stage_bytes = Counter("uploader_stage_bytes_total", "Bytes processed by each pipeline stage.")
+stage_rows = Counter("uploader_stage_rows_total", "Rows processed by each pipeline stage.")
+stage_errors = Counter("uploader_stage_errors_total", "Failed executions of each pipeline stage.")
+
+# name -> callable returning {key: number}; rendered as gauges on /metrics
+_gauge_sources = {}
+
+
+def register_gauges(prefix: str, source):
+    """Exposes ``source()`` (a dict of numbers) as ``uploader_<prefix>_<key>`` gauges."""
+    _gauge_sources[prefix] = source
+
+
+# ------------------------------------------------------------------------
+# Tracing
+# ------------------------------------------------------------------------
+def new_trace_id():
+    """Starts a new trace for the current request and returns its id."""
+    trace_id = uuid.uuid4().hex[:16]
+    _trace_id.set(trace_id)
+    return trace_id
+
+
+def current_trace_id():
+    return _trace_id.get()
+
+
+def traced(trace_id: str, fn):
+    """Wraps ``fn`` so it runs under ``trace_id`` — for work handed to another thread."""
+    def run(*args, **kwargs):
+        token = _trace_id.set(trace_id)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _trace_id.reset(token)
+    return run
+
+
+class Span:
+    def __init__(self, stage: str, bytes_: int = None, rows: int = None):
+        self.stage = stage
+        self.bytes = bytes_
+        self.rows = rows
+
+
+@contextmanager
+def span(stage: str, bytes_: int = None, rows: int = None):
+    """
+    Times a pipeline stage. Set ``.bytes`` / ``.rows`` on the yielded span when
+    they are only known at the end.
+    """
+    current = Span(stage, bytes_, rows)
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield current
+    except Exception:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(stage, elapsed)
+        if current.bytes is not None:
+            stage_bytes.inc(stage, current.bytes)
+        if current.rows is not None:
+            stage_rows.inc(stage, current.rows)
+        if failed:
+            stage_errors.inc(stage)
+        size = f" {current.bytes}B" if current.bytes is not None else ""
+        rows_ = f" {current.rows} rows" if current.rows is not None else ""
+        status = " FAILED" if failed else ""
+        print(f"⏱️ [{current_trace_id() or '-'}] {stage} {1000 * elapsed:.1f}ms{size}{rows_}{status}")
+
+
+# ------------------------------------------------------------------------
+# /metrics endpoint
+# ------------------------------------------------------------------------
+def render_metrics():
+    lines = []
+    lines += stage_seconds.render("stage")
+    lines += stage_bytes.render("stage")
+    lines += stage_rows.render("stage")
+    lines += stage_errors.render("stage")
+    for prefix, source in sorted(_gauge_sources.items()):
+        try:
+            values = source()
+        except Exception as e:
+            print(f"⚠️ Could not collect {prefix} metrics: {e}")
+            continue
+        for key, value in sorted(values.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"uploader_{prefix}_{key}"
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def register_metrics_route(server):
+    """Adds a Prometheus text-format ``/metrics`` route to the Dash app's Flask server."""
+
+    @server.route("/metrics", methods=["GET"])
+    def metrics():
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
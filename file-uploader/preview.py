@@ -0,0 +1,153 @@
+import bisect
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from metrics import span
+from upload_artifacts import get_artifact
+
+
+# ------------------------------------------------------------------------
+# Server-side paging, sorting and filtering for the preview table.
+# A page only reads the row groups that hold its rows. Sorting and filtering
+# read just the columns involved to work out which rows belong on the page,
+# and that row order is cached so paging through a sorted view stays cheap.
+# ------------------------------------------------------------------------
+PAGE_SIZE = int(os.getenv("PREVIEW_PAGE_SIZE", "25"))
+MAX_CACHED_VIEWS = 16
+
+# Dash DataTable filter_query operators -> how to evaluate them
+_OPERATORS = {
+    "=": "equal", "eq": "equal",
+    "!=": "not_equal", "ne": "not_equal",
+    "<": "less", "lt": "less",
+    "<=": "less_equal", "le": "less_equal",
+    ">": "greater", "gt": "greater",
+    ">=": "greater_equal", "ge": "greater_equal",
+    "contains": "contains",
+    "datestartswith": "starts_with",
+}
+_FILTER_PART = re.compile(r"^\{(?P<column>[^}]+)\}\s+(?P<op>s?[<>]=?|s?!?=|[a-z]+)\s+(?P<value>.+)$")
+
+_views = OrderedDict()
+_views_lock = threading.Lock()
+
+
+def parse_filter(filter_query: str):
+    """Parses DataTable's ``{col} op value && ...`` syntax into ``[(column, op, value)]``."""
+    conditions = []
+    for part in (filter_query or "").split(" && "):
+        part = part.strip()
+        if not part:
+            continue
+        match = _FILTER_PART.match(part)
+        if not match or match.group("op").lstrip("s") not in _OPERATORS:
+            raise ValueError(f"Unsupported filter: {part}")
+        value = match.group("value").strip()
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'`":
+            value = value[1:-1]
+        conditions.append((match.group("column"), _OPERATORS[match.group("op").lstrip("s")], value))
+    return conditions
+
+
+def _condition_mask(column, op, value):
+    if op in ("contains", "starts_with"):
+        text = pc.cast(column, pa.string())
+        fn = pc.match_substring if op == "contains" else pc.starts_with
+        return fn(text, value)
+    try:
+        scalar = pa.scalar(value).cast(column.type)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+        # Compare as text when the value doesn't fit the column's type
+        column, scalar = pc.cast(column, pa.string()), pa.scalar(value)
+    return getattr(pc, op)(column, scalar)
+
+
+def _filter_mask(table, conditions):
+    mask = None
+    for column, op, value in conditions:
+        condition = pc.fill_null(_condition_mask(table.column(column), op, value), False)
+        mask = condition if mask is None else pc.and_(mask, condition)
+    return mask
+
+
+def _row_order(artifact, sort_by, conditions):
+    """
+    Global row numbers of the filtered, sorted view (None when neither applies).
+    Only the sort and filter columns are read.
+    """
+    if not sort_by and not conditions:
+        return None
+    cache_key = (artifact.content_hash, repr(sort_by), repr(conditions))
+    with _views_lock:
+        if cache_key in _views:
+            _views.move_to_end(cache_key)
+            return _views[cache_key]
+
+    columns = list(dict.fromkeys([c for c, _, _ in conditions] + [s["column_id"] for s in sort_by]))
+    with span("preview_view", rows=artifact.num_rows):
+        table = artifact.read_table(columns=columns)
+        table = table.append_column("__row", pa.array(np.arange(table.num_rows)))
+        if conditions:
+            table = table.filter(_filter_mask(table, conditions))
+        if sort_by:
+            keys = [(s["column_id"], "ascending" if s["direction"] == "asc" else "descending") for s in sort_by]
+            table = table.take(pc.sort_indices(table, sort_keys=keys, null_placement="at_end"))
+        order = table.column("__row").to_numpy()
+
+    with _views_lock:
+        _views[cache_key] = order
+        while len(_views) > MAX_CACHED_VIEWS:
+            _views.popitem(last=False)
+    return order
+
+
+def _read_rows(artifact, rows):
+    """Reads the given global row numbers (in that order), touching only the row groups holding them."""
+    parquet_file = artifact.parquet_file()
+    starts = [0]
+    for i in range(parquet_file.num_row_groups):
+        starts.append(starts[-1] + parquet_file.metadata.row_group(i).num_rows)
+
+    groups = sorted({bisect.bisect_right(starts, row) - 1 for row in rows})
+    if not groups:
+        return parquet_file.schema_arrow.empty_table()
+    table = parquet_file.read_row_groups(groups)
+    # Map each global row number to its position within the row groups just read
+    offsets, position = {}, 0
+    for group in groups:
+        offsets[group] = position - starts[group]
+        position += starts[group + 1] - starts[group]
+    local = [row + offsets[bisect.bisect_right(starts, row) - 1] for row in rows]
+    return table.take(pa.array(local, type=pa.int64()))
+
+
+def read_page(content_hash: str, page: int, page_size: int = PAGE_SIZE, sort_by=None, filter_query: str = ""):
+    """
+    Returns ``(records, page_count, matching_rows)`` for one page of an artifact's
+    filtered and sorted view.
+    """
+    artifact = get_artifact(content_hash)
+    if artifact is None:
+        raise KeyError(f"No parsed artifact for {content_hash}; upload the file again.")
+
+    conditions = parse_filter(filter_query)
+    unknown = {c for c, _, _ in conditions} - set(artifact.column_names)
+    if unknown:
+        raise ValueError(f"Unknown column(s) in filter: {', '.join(sorted(unknown))}")
+
+    order = _row_order(artifact, sort_by or [], conditions)
+    matching = artifact.num_rows if order is None else len(order)
+    start = page * page_size
+    end = min(start + page_size, matching)
+    rows = range(start, end) if order is None else order[start:end].tolist()
+
+    with span("preview_page", rows=max(0, end - start)):
+        table = _read_rows(artifact, list(rows))
+    page_count = max(1, -(-matching // page_size))
+    return table.to_pylist(), page_count, matching
@@ -0,0 +1,249 @@
+import math
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from validation import BOOLEAN_STRINGS, DATE_FORMATS, FLOAT_PATTERN, INT_PATTERN, TIMESTAMP_FORMATS
+
+
+# ------------------------------------------------------------------------
+# Streaming column profiles.
+# Built batch by batch while an upload is parsed: null counts, min/max, an
+# approximate distinct count (HyperLogLog) and the narrowest SQL type the
+# values fit. Every column keeps a fixed-size state, so profiling a multi-GB
+# file uses the same memory as profiling a small one.
+# ------------------------------------------------------------------------
+HLL_PRECISION = int(os.getenv("PROFILE_HLL_PRECISION", "14"))
+# Distinct counts are exact until a column has seen this many distinct values
+EXACT_DISTINCT_LIMIT = int(os.getenv("PROFILE_EXACT_DISTINCT_LIMIT", "65536"))
+DISPLAY_CHARS = 40
+
+# Text values are checked against these, in order of preference
+_TEXT_TYPES = ("bigint", "double", "boolean", "date", "timestamp")
+_INT32_RANGE = (-2 ** 31, 2 ** 31 - 1)
+
+
+class HyperLogLog:
+    """Approximate distinct counter over 64-bit hashes (~1.04 / sqrt(2 ** precision) relative error)."""
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        # The remaining bits must fit exactly in a float64 for the rank computation below
+        if not 4 <= precision <= 18:
+            raise ValueError("HyperLogLog precision must be between 4 and 18.")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, hashes):
+        if not len(hashes):
+            return
+        shift = 64 - self.precision
+        index = (hashes >> np.uint64(shift)).astype(np.int64)
+        rest = (hashes & np.uint64((1 << shift) - 1)).astype(np.float64)
+        # frexp's exponent is the bit length of ``rest``; the rank is the leading-zero count + 1
+        _, bit_length = np.frexp(rest)
+        rank = (shift - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Small-range correction (linear counting)
+            return m * math.log(m / zeros)
+        return float(raw)
+
+    @property
+    def relative_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+
+def _hash_values(array):
+    """64-bit hashes of the non-null values of an Arrow array."""
+    values = array.drop_null()
+    if pa.types.is_dictionary(values.type):
+        values = values.dictionary_decode()
+    if pa.types.is_decimal(values.type) or pa.types.is_nested(values.type):
+        values = pc.cast(values, pa.string())
+    return pd.util.hash_array(values.to_numpy(zero_copy_only=False), categorize=False)
+
+
+def _display(value):
+    if value is None:
+        return None
+    text = str(value)
+    return text if len(text) <= DISPLAY_CHARS else text[:DISPLAY_CHARS - 1] + "…"
+
+
+class ColumnProfile:
+    def __init__(self, name: str, arrow_type):
+        self.name = name
+        self.arrow_type = arrow_type
+        self.rows = 0
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self.hll = HyperLogLog()
+        # Sorted distinct hashes while there are few enough to count exactly
+        self.exact = np.empty(0, dtype=np.uint64)
+        # Types every non-null text value seen so far parses as
+        self.text_types = list(_TEXT_TYPES) if _is_text(arrow_type) else []
+
+    def update(self, array):
+        self.rows += len(array)
+        self.nulls += array.null_count
+        if self.rows == self.nulls or pa.types.is_null(array.type):
+            return
+        self._update_min_max(array)
+        hashes = _hash_values(array)
+        self.hll.add(hashes)
+        if self.exact is not None:
+            self.exact = np.unique(np.concatenate([self.exact, hashes]))
+            if len(self.exact) > EXACT_DISTINCT_LIMIT:
+                self.exact = None
+        if self.text_types:
+            self._narrow_text_types(array)
+
+    def _update_min_max(self, array):
+        if pa.types.is_nested(array.type) or array.null_count == len(array):
+            return
+        try:
+            bounds = pc.min_max(array)
+        except (pa.ArrowNotImplementedError, pa.ArrowTypeError):
+            return
+        low, high = bounds["min"].as_py(), bounds["max"].as_py()
+        try:
+            self.min = low if self.min is None or low < self.min else self.min
+            self.max = high if self.max is None or high > self.max else self.max
+        except TypeError:
+            pass
+
+    def _narrow_text_types(self, array):
+        text = pc.utf8_trim_whitespace(array.drop_null())
+        if not len(text):
+            return
+        remaining = []
+        for sql_type in self.text_types:
+            if sql_type == "bigint":
+                ok = pc.all(pc.match_substring_regex(text, INT_PATTERN))
+            elif sql_type == "double":
+                ok = pc.all(pc.match_substring_regex(text, FLOAT_PATTERN))
+            elif sql_type == "boolean":
+                ok = pc.all(pc.is_in(pc.utf8_lower(text), value_set=BOOLEAN_STRINGS))
+            else:
+                formats = DATE_FORMATS if sql_type == "date" else TIMESTAMP_FORMATS
+                parsed = None
+                for fmt in formats:
+                    valid = pc.is_valid(pc.strptime(text, format=fmt, unit="s", error_is_null=True))
+                    parsed = valid if parsed is None else pc.or_(parsed, valid)
+                ok = pc.all(parsed)
+            if ok.as_py():
+                remaining.append(sql_type)
+        self.text_types = remaining
+
+    # --------------------------------------------------------------------
+    # Results
+    # --------------------------------------------------------------------
+    @property
+    def non_null(self):
+        return self.rows - self.nulls
+
+    @property
+    def distinct(self):
+        if self.exact is not None:
+            return len(self.exact)
+        # The estimate can't exceed the number of values it was built from
+        return min(self.non_null, int(round(self.hll.estimate())))
+
+    @property
+    def distinct_is_exact(self):
+        return self.exact is not None
+
+    @property
+    def unique(self):
+        """True if every value is present and (as far as the sketch can tell) distinct."""
+        if self.nulls or not self.non_null:
+            return False
+        if self.exact is not None:
+            return len(self.exact) == self.non_null
+        return self.distinct >= self.non_null * (1 - 3 * self.hll.relative_error)
+
+    @property
+    def inferred_type(self):
+        """The narrowest Databricks SQL type the column's values fit."""
+        arrow_type = self.arrow_type
+        if _is_text(arrow_type):
+            if not self.non_null:
+                return "string"
+            return self.text_types[0] if self.text_types else "string"
+        if pa.types.is_integer(arrow_type):
+            low, high = _INT32_RANGE
+            fits_int = self.min is None or (self.min >= low and self.max <= high)
+            return "int" if fits_int else "bigint"
+        if pa.types.is_floating(arrow_type):
+            return "double"
+        if pa.types.is_boolean(arrow_type):
+            return "boolean"
+        if pa.types.is_decimal(arrow_type):
+            return f"decimal({arrow_type.precision},{arrow_type.scale})"
+        if pa.types.is_date(arrow_type):
+            return "date"
+        if pa.types.is_timestamp(arrow_type):
+            return "timestamp" if arrow_type.tz else "timestamp_ntz"
+        if pa.types.is_binary(arrow_type) or pa.types.is_large_binary(arrow_type):
+            return "binary"
+        if pa.types.is_null(arrow_type):
+            return "void"
+        return str(arrow_type)
+
+    def to_dict(self):
+        return {
+            "column": self.name,
+            "type": str(self.arrow_type),
+            "inferred_type": self.inferred_type,
+            "nulls": self.nulls,
+            "distinct": self.distinct,
+            "distinct_exact": self.distinct_is_exact,
+            "min": _display(self.min),
+            "max": _display(self.max),
+            "unique": self.unique,
+        }
+
+
+def _is_text(arrow_type):
+    return pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type)
+
+
+class TableProfile:
+    """Per-column profiles of a table, fed one record batch at a time."""
+
+    def __init__(self, schema):
+        self.columns = {field.name: ColumnProfile(field.name, field.type) for field in schema}
+
+    def update(self, batch):
+        for name, column in zip(batch.schema.names, batch.columns):
+            self.columns[name].update(column)
+
+    def get(self, name: str):
+        """Case-insensitive column lookup; None if the upload has no such column."""
+        by_lower = {key.lower(): profile for key, profile in self.columns.items()}
+        return by_lower.get(name.lower())
+
+    def key_candidates(self):
+        """Columns that are fully populated and exactly unique — likely merge keys."""
+        return [name for name, profile in self.columns.items() if profile.unique and profile.distinct_is_exact]
+
+    def to_records(self):
+        return [profile.to_dict() for profile in self.columns.values()]
+
+
+def profile_batches(schema, batches):
+    """Profiles an iterable of record batches in a single pass."""
+    profile = TableProfile(schema)
+    for batch in batches:
+        profile.update(batch)
+    return profile
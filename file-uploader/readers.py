@@ -0,0 +1,367 @@
+import codecs
+import os
+import re
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.json as pj
+import pyarrow.parquet as pq
+
+
+# ------------------------------------------------------------------------
+# Upload readers.
+# Each supported file type maps to a reader that yields Arrow record batches
+# (schema first) so parsing memory is bounded by the batch size, not the file.
+# Parquet needs no reader: it is already in artifact format and is used as-is.
+# ------------------------------------------------------------------------
+BATCH_ROWS = int(os.getenv("READER_BATCH_ROWS", "65536"))
+JSON_BLOCK_BYTES = int(os.getenv("READER_JSON_BLOCK_BYTES", str(16 * 1024 * 1024)))
+# CSV files are parsed in newline-aligned blocks of this size, each one by every core
+CSV_BLOCK_BYTES = int(os.getenv("READER_CSV_BLOCK_BYTES", str(64 * 1024 * 1024)))
+# How much of a file is sniffed to tell UTF-8 from a legacy single-byte encoding
+ENCODING_SAMPLE_BYTES = int(os.getenv("READER_ENCODING_SAMPLE_BYTES", str(4 * 1024 * 1024)))
+# Used when a CSV isn't valid UTF-8; latin-1 is the last resort since every byte decodes
+FALLBACK_ENCODINGS = tuple(os.getenv("READER_FALLBACK_ENCODINGS", "cp1252,latin-1").split(","))
+# Size of Arrow's CPU pool used for parsing (0 keeps Arrow's default of one thread per core)
+READER_THREADS = int(os.getenv("READER_THREADS", "0"))
+
+if READER_THREADS > 0:
+    pa.set_cpu_count(READER_THREADS)
+
+# extension -> (format name, reader)
+_READERS = {}
+PASSTHROUGH_EXTENSIONS = (".parquet",)
+
+
+def register_reader(file_format: str, *extensions):
+    """Registers ``fn(path) -> (schema, batch iterator)`` for the given file extensions."""
+    def decorator(fn):
+        for extension in extensions:
+            _READERS[extension.lower()] = (file_format, fn)
+        return fn
+    return decorator
+
+
+def supported_extensions():
+    return sorted([*_READERS, *PASSTHROUGH_EXTENSIONS])
+
+
+def file_format_for(filename: str):
+    """Returns the format name for ``filename``, or raises ValueError if unsupported."""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in PASSTHROUGH_EXTENSIONS:
+        return "parquet"
+    if extension not in _READERS:
+        raise ValueError(f"Unsupported file type '{extension or filename}'. "
+                         f"Use one of: {', '.join(supported_extensions())}")
+    return _READERS[extension][0]
+
+
+class ColumnTypeError(ValueError):
+    """
+    Raised mid-file when values in ``columns`` don't convert to the type inferred
+    from the start of the file. Reading again with those columns in
+    ``text_columns`` succeeds, and validation then reports the bad rows.
+    """
+
+    def __init__(self, columns, message: str):
+        super().__init__(message)
+        self.columns = list(columns)
+
+
+def open_batches(path: str, filename: str, text_columns=()):
+    """
+    Returns ``(schema, iterator of RecordBatch)`` for an upload, using its extension's reader.
+    ``text_columns`` are read as strings instead of inferring their type (CSV only).
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    file_format_for(filename)
+    if extension in PASSTHROUGH_EXTENSIONS:
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        return parquet_file.schema_arrow, parquet_file.iter_batches(batch_size=BATCH_ROWS)
+    if text_columns:
+        return _READERS[extension][1](path, text_columns=text_columns)
+    return _READERS[extension][1](path)
+
+
+# ------------------------------------------------------------------------
+# CSV — multithreaded parsing of newline-aligned blocks
+# ------------------------------------------------------------------------
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+def detect_encoding(path: str):
+    """
+    Returns ``(encoding, bom_length)`` for a text file: a byte-order mark wins,
+    then UTF-8 if the sample decodes, else the first fallback encoding that does.
+    """
+    with open(path, "rb") as fh:
+        sample = fh.read(ENCODING_SAMPLE_BYTES)
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding, len(bom)
+    try:
+        sample.decode("utf-8")
+        return "utf8", 0
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off by the end of the sample is still UTF-8
+        if e.start >= len(sample) - 3 and e.reason == "unexpected end of data":
+            return "utf8", 0
+    for encoding in FALLBACK_ENCODINGS:
+        try:
+            sample.decode(encoding)
+            return encoding, 0
+        except UnicodeDecodeError:
+            continue
+    return "latin-1", 0
+
+
+def _block_ends(buffer, start: int, block_bytes: int):
+    """Yields ``(start, end)`` byte ranges of about ``block_bytes`` that end just after a newline."""
+    size = buffer.size
+    while start < size:
+        end = min(start + block_bytes, size)
+        while end < size:
+            window = buffer.slice(end, min(64 * 1024, size - end)).to_pybytes()
+            newline = window.find(b"\n")
+            if newline != -1:
+                end += newline + 1
+                break
+            end += len(window)
+        yield start, end
+        start = end
+
+
+# pyarrow prefixes conversion errors with the (0-based) column index
+_FAILED_COLUMN_RE = re.compile(r"In CSV column #(\d+)")
+
+
+def _failed_column(error, names):
+    """The column a CSV conversion error is about, or None if the error isn't a conversion error."""
+    match = _FAILED_COLUMN_RE.search(str(error))
+    if match is None or "conversion error" not in str(error):
+        return None
+    index = int(match.group(1))
+    return names[index] if index < len(names) else None
+
+
+def _read_block(data, read_options, schema):
+    """
+    Parses one block against ``schema``. If some columns don't convert, raises
+    ColumnTypeError naming all of them (found by re-parsing the block with each
+    offending column as text in turn).
+    """
+    types = dict(zip(schema.names, schema.types))
+    failed = []
+    while True:
+        try:
+            table = pv.read_csv(pa.BufferReader(data), read_options=read_options,
+                                convert_options=pv.ConvertOptions(column_types=types))
+        except pa.ArrowInvalid as e:
+            name = _failed_column(e, schema.names)
+            if name is None or pa.types.is_string(types[name]):
+                raise
+            failed.append(name)
+            types[name] = pa.string()
+            continue
+        if failed:
+            raise ColumnTypeError(failed, f"Column(s) {', '.join(failed)} have values that don't match the "
+                                          f"type inferred from the start of the file")
+        return table
+
+
+@register_reader("csv", ".csv")
+def read_csv(path: str, text_columns=()):
+    """
+    Parses the file in CSV_BLOCK_BYTES blocks with pyarrow's multithreaded reader.
+    Column types are inferred from the first block and held for the rest, like
+    the streaming reader does; a later value that doesn't fit raises
+    ColumnTypeError. Like pyarrow's default, quoted values may not contain
+    newlines, which is what makes splitting on newlines safe.
+    """
+    encoding, bom_length = detect_encoding(path)
+    if encoding == "utf-16":
+        # Newlines are two bytes wide, so fall back to the (single-threaded) streaming reader
+        return _read_csv_streaming(path, encoding, text_columns)
+    if encoding != "utf8":
+        print(f"🔤 {os.path.basename(path)} isn't UTF-8; reading it as {encoding}")
+    encoding = "utf8" if encoding == "utf-8-sig" else encoding
+
+    source = pa.memory_map(path)
+    buffer = source.read_buffer()
+    blocks = _block_ends(buffer, bom_length, CSV_BLOCK_BYTES)
+    first_start, first_end = next(blocks, (0, 0))
+    first = pv.read_csv(
+        pa.BufferReader(buffer.slice(first_start, first_end - first_start)),
+        read_options=pv.ReadOptions(use_threads=True, encoding=encoding),
+        convert_options=pv.ConvertOptions(column_types={name: pa.string() for name in text_columns}),
+    )
+    # A column that is empty throughout the first block is read as text from then on
+    schema = pa.schema([
+        field.with_type(pa.string()) if pa.types.is_null(field.type) else field for field in first.schema
+    ])
+    first = first.cast(schema)
+    read_options = pv.ReadOptions(use_threads=True, encoding=encoding, column_names=schema.names)
+
+    def batches():
+        try:
+            for batch in first.to_batches(max_chunksize=BATCH_ROWS):
+                yield _empty_as_null(batch, text_columns)
+            for start, end in blocks:
+                table = _read_block(buffer.slice(start, end - start), read_options, schema)
+                for batch in table.to_batches(max_chunksize=BATCH_ROWS):
+                    yield _empty_as_null(batch, text_columns)
+        finally:
+            source.close()
+    return schema, batches()
+
+
+def _empty_as_null(batch, text_columns):
+    """
+    Empty fields in ``text_columns`` become null, as they were when the column's type
+    was inferred (and as the warehouse reads an empty CSV field).
+    """
+    if not text_columns:
+        return batch
+    columns = list(batch.columns)
+    for name in text_columns:
+        index = batch.schema.get_field_index(name)
+        if index != -1:
+            column = columns[index]
+            columns[index] = pc.if_else(pc.equal(column, ""), pa.scalar(None, column.type), column)
+    return pa.RecordBatch.from_arrays(columns, schema=batch.schema)
+
+
+def _read_csv_streaming(path: str, encoding: str = "utf8", text_columns=()):
+    source = pa.memory_map(path)
+    reader = pv.open_csv(source, read_options=pv.ReadOptions(encoding=encoding),
+                         convert_options=pv.ConvertOptions(column_types={name: pa.string() for name in text_columns}))
+
+    def batches():
+        try:
+            for batch in reader:
+                yield _empty_as_null(batch, text_columns)
+        except pa.ArrowInvalid as e:
+            name = _failed_column(e, reader.schema.names)
+            if name is None:
+                raise
+            raise ColumnTypeError([name], str(e)) from e
+        finally:
+            reader.close()
+            source.close()
+    return reader.schema, batches()
+
+
+# ------------------------------------------------------------------------
+# Excel — streamed row by row from the first sheet in read-only mode
+# ------------------------------------------------------------------------
+def _text(values):
+    return [None if v is None else str(v) for v in values]
+
+
+def _unify(names, rows, schema=None):
+    """Builds a batch from row tuples, holding each column to the type the first batch chose."""
+    columns = list(zip(*rows)) if rows else [()] * len(names)
+    arrays = []
+    for i, (name, values) in enumerate(zip(names, columns)):
+        target = schema.field(i).type if schema is not None else None
+        if target is not None and pa.types.is_string(target):
+            values = _text(values)
+        try:
+            array = pa.array(values, type=target)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+            if target is not None:
+                raise ValueError(f"Column '{name}' changes type part-way through the sheet "
+                                 f"(expected {target}); clean it up or export it as CSV.") from None
+            # Mixed types in the first rows: keep the column as text
+            array = pa.array(_text(values), type=pa.string())
+        if target is None and pa.types.is_null(array.type):
+            # An all-empty first batch says nothing about the type; default to text
+            array = pa.array(_text(values), type=pa.string())
+        arrays.append(array)
+    return pa.RecordBatch.from_arrays(arrays, names=names)
+
+
+@register_reader("xlsx", ".xlsx", ".xlsm")
+def read_xlsx(path: str):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    rows = workbook.worksheets[0].iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        workbook.close()
+        return pa.schema([]), iter(())
+    names = [str(h) if h is not None else f"column_{i + 1}" for i, h in enumerate(header)]
+
+    def chunks():
+        chunk = []
+        for row in rows:
+            if all(v is None for v in row):
+                continue
+            # Short rows are padded, cells past the header are dropped
+            chunk.append(tuple(row[:len(names)]) + (None,) * (len(names) - len(row)))
+            if len(chunk) >= BATCH_ROWS:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    chunk_iter = chunks()
+    first = _unify(names, next(chunk_iter, []))
+    schema = first.schema
+
+    def batches():
+        try:
+            if first.num_rows:
+                yield first
+            for chunk in chunk_iter:
+                yield _unify(names, chunk, schema)
+        finally:
+            workbook.close()
+    return schema, batches()
+
+
+# ------------------------------------------------------------------------
+# Newline-delimited JSON — parsed in line-aligned blocks
+# ------------------------------------------------------------------------
+def _json_blocks(path: str):
+    with open(path, "rb") as fh:
+        rest = b""
+        while True:
+            block = fh.read(JSON_BLOCK_BYTES)
+            if not block:
+                break
+            block = rest + block
+            cut = block.rfind(b"\n")
+            if cut == -1:
+                rest = block
+                continue
+            rest = block[cut + 1:]
+            yield block[:cut + 1]
+        if rest.strip():
+            yield rest
+
+
+@register_reader("json", ".json", ".jsonl", ".ndjson")
+def read_ndjson(path: str):
+    blocks = _json_blocks(path)
+    first = next(blocks, None)
+    if first is None:
+        return pa.schema([]), iter(())
+    first_table = pj.read_json(pa.py_buffer(first))
+    # Later blocks are parsed against the first block's schema so every batch matches;
+    # fields that only show up later are ignored
+    parse_options = pj.ParseOptions(explicit_schema=first_table.schema, unexpected_field_behavior="ignore")
+
+    def batches():
+        yield from first_table.to_batches(max_chunksize=BATCH_ROWS)
+        for block in blocks:
+            table = pj.read_json(pa.py_buffer(block), parse_options=parse_options)
+            yield from table.to_batches(max_chunksize=BATCH_ROWS)
+    return first_table.schema, batches()
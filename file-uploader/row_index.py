@@ -0,0 +1,170 @@
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from metrics import span
+from upload_artifacts import derive_artifact, resolve_columns
+
+
+# ------------------------------------------------------------------------
+# Row-hash index for incremental merges.
+# After each successful incremental merge we keep, per target table and merge
+# key, the key values plus a 64-bit hash of the key and of the whole row. The
+# next upload is hashed the same way and only new or changed rows (plus,
+# optionally, delete markers for keys that disappeared) are staged and merged.
+# Lives outside the temp store so quota eviction never drops it.
+# ------------------------------------------------------------------------
+ROW_INDEX_DIR = os.getenv("ROW_INDEX_DIR", os.path.join(tempfile.gettempdir(), "file-uploader-row-index"))
+DELETE_COLUMN = "__delete"
+
+os.makedirs(ROW_INDEX_DIR, exist_ok=True)
+
+_KEY_HASH = "__key_hash"
+_ROW_HASH = "__row_hash"
+_FINGERPRINT = b"fingerprint"
+
+
+def _table_prefix(target_table: str):
+    return hashlib.sha256(target_table.lower().encode()).hexdigest()[:16]
+
+
+def index_path(target_table: str, merge_keys: list):
+    keys = ",".join(key.lower() for key in merge_keys)
+    return os.path.join(ROW_INDEX_DIR, f"{_table_prefix(target_table)}_{hashlib.sha256(keys.encode()).hexdigest()[:16]}.parquet")
+
+
+def drop_indexes(target_table: str):
+    """Forgets every row index of ``target_table`` — after any write that bypassed them."""
+    prefix = _table_prefix(target_table) + "_"
+    for name in os.listdir(ROW_INDEX_DIR):
+        if name.startswith(prefix):
+            try:
+                os.remove(os.path.join(ROW_INDEX_DIR, name))
+            except OSError:
+                pass
+
+
+def _fingerprint(artifact, key_names):
+    """Identifies the column layout the hashes were computed over; any change invalidates the index."""
+    schema = artifact.parquet_file().schema_arrow
+    fields = sorted(f"{field.name.lower()}:{field.type}" for field in schema)
+    return "|".join([*fields, "keys", *(name.lower() for name in key_names)])
+
+
+def _hash_rows(artifact, key_names):
+    """Returns ``(key_hashes, row_hashes, null_key_mask)`` for every row, batch by batch."""
+    value_names = sorted(artifact.column_names, key=str.lower)
+    key_parts, row_parts, null_parts = [], [], []
+    for batch in artifact.parquet_file().iter_batches():
+        frame = batch.to_pandas()
+        key_parts.append(pd.util.hash_pandas_object(frame[key_names], index=False).to_numpy())
+        row_parts.append(pd.util.hash_pandas_object(frame[value_names], index=False).to_numpy())
+        null_parts.append(frame[key_names].isna().any(axis=1).to_numpy())
+    if not key_parts:
+        empty = np.empty(0, dtype=np.uint64)
+        return empty, empty, np.empty(0, dtype=bool)
+    return np.concatenate(key_parts), np.concatenate(row_parts), np.concatenate(null_parts)
+
+
+def _load_index(path: str, fingerprint: str):
+    """Returns the stored index table, or None if missing or built over a different layout."""
+    if not os.path.exists(path):
+        return None
+    index = pq.read_table(path, memory_map=True)
+    if (index.schema.metadata or {}).get(_FINGERPRINT) != fingerprint.encode():
+        print(f"🔄 Row index {os.path.basename(path)} was built for different columns; ignoring it")
+        return None
+    return index
+
+
+def _lookup(index, key_hashes):
+    """For each key hash, returns ``(found, stored_row_hash)`` from the index."""
+    if index is None or index.num_rows == 0:
+        return np.zeros(len(key_hashes), dtype=bool), np.zeros(len(key_hashes), dtype=np.uint64)
+    stored_keys = index.column(_KEY_HASH).to_numpy()
+    stored_rows = index.column(_ROW_HASH).to_numpy()
+    order = np.argsort(stored_keys)
+    stored_keys, stored_rows = stored_keys[order], stored_rows[order]
+    pos = np.minimum(np.searchsorted(stored_keys, key_hashes), len(stored_keys) - 1)
+    found = stored_keys[pos] == key_hashes
+    return found, stored_rows[pos]
+
+
+def diff_against_index(artifact, target_table: str, merge_keys: list, deletes: bool = False):
+    """
+    Compares a (deduplicated) upload with the row index from the last incremental
+    merge into ``target_table``. Returns ``(artifact, changes, pending_index)`` where
+    ``artifact`` holds only new or changed rows — plus delete markers flagged in
+    DELETE_COLUMN when ``deletes`` is set — and ``pending_index`` must be passed to
+    commit_index() once the merge has succeeded.
+
+    Rows are compared by 64-bit hashes, so a collision could hide a change; at
+    these table sizes that is vanishingly unlikely.
+    """
+    key_names = resolve_columns(artifact, merge_keys)
+    path = index_path(target_table, merge_keys)
+    fingerprint = _fingerprint(artifact, key_names)
+
+    with span("row_hash", rows=artifact.num_rows):
+        key_hashes, row_hashes, null_keys = _hash_rows(artifact, key_names)
+        index = _load_index(path, fingerprint)
+        found, stored_rows = _lookup(index, key_hashes)
+
+    # Rows with a null key never match in a MERGE, so they are always sent
+    unchanged = found & (stored_rows == row_hashes) & ~null_keys
+    new = ~found | null_keys
+    table = artifact.read_table()
+    changed_table = table.filter(pa.array(~unchanged))
+
+    # Keys the index knew about that are missing from this upload
+    if index is not None:
+        stored_keys = index.column(_KEY_HASH).to_numpy()
+        missing = pa.array(~np.isin(stored_keys, key_hashes))
+        carried = index.filter(missing).rename_columns([*key_names, _KEY_HASH, _ROW_HASH])
+    else:
+        carried = None
+
+    changes = {
+        "changed": int((~unchanged).sum()),
+        "new": int(new.sum()),
+        "updated": int((~unchanged & ~new).sum()),
+        "unchanged": int(unchanged.sum()),
+        "deleted": 0,
+    }
+
+    if deletes and carried is not None and carried.num_rows:
+        markers = carried.select(key_names).append_column(DELETE_COLUMN, pa.array([True] * carried.num_rows))
+        changed_table = changed_table.append_column(DELETE_COLUMN, pa.array([False] * changed_table.num_rows))
+        changed_table = pa.concat_tables([changed_table, markers], promote_options="permissive")
+        changes["deleted"] = markers.num_rows
+
+    # The next index: this upload's rows, plus earlier keys this upload didn't mention
+    keyed = pa.array(~null_keys)
+    next_index = (
+        table.select(key_names).filter(keyed)
+        .append_column(_KEY_HASH, pa.array(key_hashes).filter(keyed))
+        .append_column(_ROW_HASH, pa.array(row_hashes).filter(keyed))
+    )
+    if carried is not None and not deletes and carried.num_rows:
+        next_index = pa.concat_tables([next_index, carried], promote_options="permissive")
+    next_index = next_index.replace_schema_metadata({_FINGERPRINT: fingerprint.encode()})
+
+    version = os.stat(path).st_mtime_ns if index is not None else "none"
+    derived = derive_artifact(artifact, f"incremental|{target_table}|{','.join(key_names)}|{deletes}|{version}",
+                              changed_table)
+    print(f"🔍 Incremental merge into {target_table}: {changes['changed']} changed, "
+          f"{changes['unchanged']} unchanged, {changes['deleted']} deleted")
+    return derived, changes, (path, next_index)
+
+
+def commit_index(pending_index):
+    """Atomically replaces the row index after a successful incremental merge."""
+    path, table = pending_index
+    tmp_path = f"{path}.partial"
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
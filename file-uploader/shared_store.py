@@ -0,0 +1,306 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from metrics import register_gauges
+
+
+# ------------------------------------------------------------------------
+# State shared by every server worker process.
+# Under gunicorn each worker is a separate process, so anything a later
+# request may need — upload sessions, parsed artifact records, write-job
+# status, warehouse metadata — is kept here rather than in one worker's
+# memory. It is a single SQLite file in WAL mode: readers never block, and
+# writes are short single-row statements. Values are JSON with an optional
+# expiry. Named locks (leases) serialize work across processes.
+# ------------------------------------------------------------------------
+SHARED_STORE_PATH = os.getenv(
+    "SHARED_STORE_PATH", os.path.join(tempfile.gettempdir(), "file-uploader-state.sqlite3")
+)
+BUSY_TIMEOUT_S = float(os.getenv("SHARED_STORE_BUSY_TIMEOUT_S", "30"))
+LOCK_POLL_S = float(os.getenv("SHARED_STORE_LOCK_POLL_S", "0.2"))
+# Expired rows are swept at most this often, by whichever worker writes next
+PURGE_INTERVAL_S = 60
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS records (
+        namespace TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value TEXT NOT NULL,
+        expires_at REAL,
+        PRIMARY KEY (namespace, key)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS locks (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        pid INTEGER NOT NULL,
+        expires_at REAL
+    ) WITHOUT ROWID
+    """,
+)
+
+
+class LockTimeout(TimeoutError):
+    """Raised when a shared lock couldn't be acquired within the requested time."""
+
+
+def pid_alive(pid: int):
+    """True if a process with ``pid`` is running on this host."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _prefix_clause(prefix: str):
+    # substr() instead of LIKE so names containing % or _ match literally
+    return "substr(key, 1, ?) = ?", (len(prefix), prefix)
+
+
+class SharedStore:
+    """Namespaced JSON records with optional expiry, plus named cross-process locks."""
+
+    def __init__(self, path: str = SHARED_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self._reads = 0
+        self._writes = 0
+        self._lock_waits = 0
+
+    # --------------------------------------------------------------------
+    # Connections
+    # --------------------------------------------------------------------
+    def _conn(self):
+        """One connection per thread, reopened after a fork (gunicorn forks workers from the master)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_S, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction that takes SQLite's write lock up front, so read-modify-write is atomic."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        with self._lock:
+            self._writes += 1
+
+    # --------------------------------------------------------------------
+    # Records
+    # --------------------------------------------------------------------
+    def get(self, namespace: str, key: str):
+        """Returns the stored value, or None when missing or expired."""
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM records WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        with self._lock:
+            self._reads += 1
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return json.loads(row[0])
+
+    def set(self, namespace: str, key: str, value, ttl_s: float = None):
+        text = json.dumps(value, default=str)
+        expires_at = time.time() + ttl_s if ttl_s is not None else None
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO records (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, text, expires_at),
+            )
+        self._maybe_purge()
+
+    def update(self, namespace: str, key: str, fn, ttl_s: float = None):
+        """
+        Atomically replaces the value with ``fn(current)`` (current is None if
+        missing) and returns the new value. Returning None deletes the record.
+        """
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM records WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            live = row is not None and (row[1] is None or row[1] >= time.time())
+            value = fn(json.loads(row[0]) if live else None)
+            if value is None:
+                conn.execute("DELETE FROM records WHERE namespace = ? AND key = ?", (namespace, key))
+            else:
+                expires_at = time.time() + ttl_s if ttl_s is not None else (row[1] if live else None)
+                conn.execute(
+                    "INSERT OR REPLACE INTO records (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (namespace, key, json.dumps(value, default=str), expires_at),
+                )
+        return value
+
+    def delete(self, namespace: str, key: str):
+        """Deletes one record; returns 1 if it existed, else 0."""
+        with self._transaction() as conn:
+            return conn.execute("DELETE FROM records WHERE namespace = ? AND key = ?", (namespace, key)).rowcount
+
+    def delete_prefix(self, namespace: str, prefix: str = ""):
+        """Deletes every record in ``namespace`` whose key starts with ``prefix``; returns the count."""
+        clause, params = _prefix_clause(prefix)
+        with self._transaction() as conn:
+            return conn.execute(
+                f"DELETE FROM records WHERE namespace = ? AND {clause}", (namespace, *params)
+            ).rowcount
+
+    def items(self, namespace: str, prefix: str = ""):
+        """Live ``(key, value)`` pairs in ``namespace`` whose key starts with ``prefix``."""
+        clause, params = _prefix_clause(prefix)
+        rows = self._conn().execute(
+            f"SELECT key, value FROM records WHERE namespace = ? AND {clause}"
+            " AND (expires_at IS NULL OR expires_at >= ?) ORDER BY key",
+            (namespace, *params, time.time()),
+        ).fetchall()
+        with self._lock:
+            self._reads += 1
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def count(self, namespace: str):
+        """Number of live records in ``namespace``."""
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM records WHERE namespace = ? AND (expires_at IS NULL OR expires_at >= ?)",
+            (namespace, time.time()),
+        ).fetchone()[0]
+
+    def trim(self, namespace: str, max_records: int):
+        """
+        Drops expired records in ``namespace``, then the ones closest to expiring
+        until at most ``max_records`` are left; returns how many live ones were dropped.
+        """
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM records WHERE namespace = ? AND expires_at < ?", (namespace, time.time()))
+            excess = conn.execute("SELECT COUNT(*) FROM records WHERE namespace = ?", (namespace,)).fetchone()[0]
+            excess -= max_records
+            if excess <= 0:
+                return 0
+            # Records without an expiry sort last, so they are dropped only after every expiring one
+            return conn.execute(
+                "DELETE FROM records WHERE namespace = ? AND key IN ("
+                " SELECT key FROM records WHERE namespace = ?"
+                " ORDER BY expires_at IS NULL, expires_at LIMIT ?)",
+                (namespace, namespace, excess),
+            ).rowcount
+
+    def _maybe_purge(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_purge < PURGE_INTERVAL_S:
+                return
+            self._last_purge = now
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM records WHERE expires_at < ?", (now,))
+            conn.execute("DELETE FROM locks WHERE expires_at < ?", (now,))
+
+    # --------------------------------------------------------------------
+    # Locks
+    # --------------------------------------------------------------------
+    def try_acquire(self, name: str, ttl_s: float = None):
+        """
+        Takes the named lock if it is free (or its holder's process has exited, or
+        it outlived ``ttl_s``) and returns an owner token for release(); None if held.
+        """
+        owner = uuid.uuid4().hex
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT pid, expires_at FROM locks WHERE name = ?", (name,)).fetchone()
+            if row is not None:
+                pid, expires_at = row
+                expired = expires_at is not None and expires_at < now
+                # A holder whose worker exited (or was killed) can't release it
+                if not expired and pid_alive(pid):
+                    return None
+            conn.execute(
+                "INSERT OR REPLACE INTO locks (name, owner, pid, expires_at) VALUES (?, ?, ?, ?)",
+                (name, owner, os.getpid(), now + ttl_s if ttl_s is not None else None),
+            )
+        return owner
+
+    def release(self, name: str, owner: str):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner))
+
+    @contextmanager
+    def lock(self, name: str, timeout_s: float = None, ttl_s: float = None, on_wait=None):
+        """
+        Holds the named lock across every worker process for the ``with`` block.
+        Waits up to ``timeout_s`` (forever by default), calling ``on_wait()`` once
+        if it has to wait. A holder's lock is freed when its process exits, or
+        after ``ttl_s``.
+        """
+        deadline = time.monotonic() + timeout_s if timeout_s is not None else None
+        waited = False
+        while True:
+            owner = self.try_acquire(name, ttl_s)
+            if owner is not None:
+                break
+            if deadline is not None and time.monotonic() > deadline:
+                raise LockTimeout(f"Timed out waiting for '{name}'.")
+            if not waited:
+                waited = True
+                with self._lock:
+                    self._lock_waits += 1
+                if on_wait is not None:
+                    on_wait()
+            time.sleep(LOCK_POLL_S)
+        try:
+            yield
+        finally:
+            self.release(name, owner)
+
+    # --------------------------------------------------------------------
+    # Lifecycle
+    # --------------------------------------------------------------------
+    def reset(self):
+        """Drops every record and lock — run once by the server before any worker starts."""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM records")
+            conn.execute("DELETE FROM locks")
+
+    def close(self):
+        """Closes this thread's connection, e.g. in the server master before it forks workers."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
+
+    def stats(self):
+        conn = self._conn()
+        counts = dict(conn.execute("SELECT namespace, COUNT(*) FROM records GROUP BY namespace").fetchall())
+        held = conn.execute("SELECT COUNT(*) FROM locks").fetchone()[0]
+        with self._lock:
+            return {
+                "reads": self._reads,
+                "writes": self._writes,
+                "lock_waits": self._lock_waits,
+                "locks_held": held,
+                **{f"records_{namespace}": count for namespace, count in counts.items()},
+            }
+
+
+shared_store = SharedStore()
+register_gauges("shared_store", shared_store.stats)
@@ -0,0 +1,262 @@
+import os
+import re
+import uuid
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+
+from metrics import span
+from temp_store import UPLOAD_DIR, temp_store
+
+
+# ------------------------------------------------------------------------
+# Local staging files.
+# UTF-8 CSV uploads can be staged as-is (anything else is written out as UTF-8 CSV), or converted to compressed Parquet with
+# types already matched to the target table so the warehouse skips text parsing.
+# ------------------------------------------------------------------------
+STAGING_FORMATS = ("csv", "parquet")
+STAGED_DIR = os.path.join(UPLOAD_DIR, "staged")
+PARQUET_COMPRESSION = os.getenv("STAGING_PARQUET_COMPRESSION", "zstd")
+# Uploads larger than the threshold are staged as several parts of about SHARD_TARGET_BYTES
+SHARD_THRESHOLD_BYTES = int(os.getenv("STAGING_SHARD_THRESHOLD_BYTES", str(256 * 1024 * 1024)))
+SHARD_TARGET_BYTES = int(os.getenv("STAGING_SHARD_BYTES", str(128 * 1024 * 1024)))
+
+os.makedirs(STAGED_DIR, exist_ok=True)
+
+_SIMPLE_TYPES = {
+    "string": pa.string(),
+    "tinyint": pa.int8(),
+    "byte": pa.int8(),
+    "smallint": pa.int16(),
+    "short": pa.int16(),
+    "int": pa.int32(),
+    "integer": pa.int32(),
+    "bigint": pa.int64(),
+    "long": pa.int64(),
+    "float": pa.float32(),
+    "real": pa.float32(),
+    "double": pa.float64(),
+    "boolean": pa.bool_(),
+    "date": pa.date32(),
+    "timestamp": pa.timestamp("us", tz="UTC"),
+    "timestamp_ntz": pa.timestamp("us"),
+    "binary": pa.binary(),
+}
+
+_DECIMAL_RE = re.compile(r"decimal\((\d+)\s*,\s*(\d+)\)")
+
+
+def to_arrow_type(dtype: str):
+    """Maps a Databricks SQL type name to an Arrow type, or None for complex types."""
+    dtype = dtype.strip().lower()
+    if dtype in _SIMPLE_TYPES:
+        return _SIMPLE_TYPES[dtype]
+    if dtype.startswith("varchar") or dtype.startswith("char"):
+        return pa.string()
+    match = _DECIMAL_RE.fullmatch(dtype)
+    if match:
+        return pa.decimal128(int(match.group(1)), int(match.group(2)))
+    return None
+
+
+def _target_types(schema_map: dict):
+    target_types = {}
+    for col, dtype in schema_map.items():
+        arrow_type = to_arrow_type(dtype)
+        if arrow_type is not None:
+            target_types[col.lower()] = arrow_type
+    return target_types
+
+
+def _cast_batch(batch, target_types):
+    """Casts each column to its target type, leaving it untouched if the cast fails."""
+    columns = []
+    for name, column in zip(batch.schema.names, batch.columns):
+        target = target_types.get(name.lower())
+        if target is not None and column.type != target:
+            try:
+                column = pc.cast(column, target)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                # Let the warehouse CAST (and report) values we can't convert locally
+                pass
+        columns.append(column)
+    return pa.RecordBatch.from_arrays(columns, names=batch.schema.names)
+
+
+def cast_table(table, schema_map: dict):
+    """Casts each column to its target-table type, leaving a column untouched if any value can't convert."""
+    target_types = _target_types(schema_map)
+    for index, name in enumerate(table.schema.names):
+        target = target_types.get(name.lower())
+        if target is not None and table.schema.field(index).type != target:
+            try:
+                table = table.set_column(index, name, pc.cast(table.column(index), target))
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                pass
+    return table
+
+
+def _local_path(artifact, extension: str):
+    """
+    A staging file name of its own: concurrent jobs may stage the same upload
+    (typed to different tables), and must not write or rename each other's file.
+    """
+    stem = os.path.splitext(artifact.filename)[0]
+    return os.path.join(STAGED_DIR, f"{artifact.content_hash[:16]}_{stem}_{uuid.uuid4().hex[:8]}.{extension}")
+
+
+def write_parquet_staging(artifact, schema_map: dict):
+    """
+    Converts a parsed upload artifact into a compressed Parquet file typed to
+    the target table schema. Returns the local path.
+    """
+    target_types = _target_types(schema_map)
+    local_path = _local_path(artifact, "parquet")
+    tmp_path = f"{local_path}.partial"
+
+    writer = None
+    try:
+        for batch in artifact.parquet_file().iter_batches():
+            batch = _cast_batch(batch, target_types)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, batch.schema, compression=PARQUET_COMPRESSION)
+            writer.write_batch(batch)
+        if writer is None:
+            # Header-only upload — still produce a valid (empty) file
+            pq.write_table(pq.read_schema(artifact.parquet_path, memory_map=True).empty_table(), tmp_path)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    os.replace(tmp_path, local_path)
+    temp_store.track(local_path)
+    return local_path
+
+
+def write_csv_staging(artifact):
+    """Writes a CSV copy of an artifact whose upload wasn't a CSV (Excel, JSON, Parquet)."""
+    local_path = _local_path(artifact, "csv")
+    tmp_path = f"{local_path}.partial"
+
+    parquet_file = artifact.parquet_file()
+    with pv.CSVWriter(tmp_path, parquet_file.schema_arrow) as writer:
+        for batch in parquet_file.iter_batches():
+            writer.write_batch(batch)
+
+    os.replace(tmp_path, local_path)
+    temp_store.track(local_path)
+    return local_path
+
+
+class _ShardWriter:
+    """Streams batches into numbered part files, starting a new part every ``target_bytes``."""
+
+    def __init__(self, directory: str, prefix: str, staging_format: str, target_bytes: int):
+        self.directory = directory
+        self.prefix = prefix
+        self.staging_format = staging_format
+        self.target_bytes = target_bytes
+        self.paths = []
+        self._sink = None
+        self._writer = None
+
+    def write(self, batch):
+        if self._writer is None:
+            self._open(batch.schema)
+        self._writer.write_batch(batch)
+        if self._sink.tell() >= self.target_bytes:
+            self._close()
+
+    def _open(self, schema):
+        path = os.path.join(self.directory, f"{self.prefix}-part-{len(self.paths):05d}.{self.staging_format}")
+        self.paths.append(path)
+        self._sink = pa.OSFile(path, "wb")
+        if self.staging_format == "parquet":
+            self._writer = pq.ParquetWriter(self._sink, schema, compression=PARQUET_COMPRESSION)
+        else:
+            self._writer = pv.CSVWriter(self._sink, schema)
+
+    def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._sink.close()
+            self._writer = self._sink = None
+
+    def close(self, schema):
+        if not self.paths:
+            # Header-only upload — still produce one valid (empty) part
+            self._open(schema)
+        self._close()
+        return self.paths
+
+
+def write_shards(artifact, schema_map: dict, staging_format: str, target_bytes: int = SHARD_TARGET_BYTES):
+    """
+    Streams an artifact into part files of roughly ``target_bytes`` each, in a
+    directory of their own, and returns their local paths in order.
+    """
+    target_types = _target_types(schema_map) if staging_format == "parquet" else {}
+    stem = os.path.splitext(artifact.filename)[0]
+    prefix = f"{artifact.content_hash[:16]}_{stem}"
+    directory = os.path.join(STAGED_DIR, f"{prefix}_{uuid.uuid4().hex[:8]}")
+    os.makedirs(directory, exist_ok=True)
+
+    parquet_file = artifact.parquet_file()
+    shards = _ShardWriter(directory, prefix, staging_format, target_bytes)
+    schema = parquet_file.schema_arrow
+    try:
+        for batch in parquet_file.iter_batches():
+            batch = _cast_batch(batch, target_types)
+            schema = batch.schema
+            shards.write(batch)
+    finally:
+        paths = shards.close(schema)
+
+    for path in paths:
+        temp_store.track(path)
+    return paths
+
+
+def _check_format(staging_format: str):
+    staging_format = (staging_format or "csv").lower()
+    if staging_format not in STAGING_FORMATS:
+        raise ValueError(f"Unsupported staging format '{staging_format}'. Use one of {STAGING_FORMATS}.")
+    return staging_format
+
+
+def stage_shards(artifact, schema_map: dict, staging_format: str = "csv"):
+    """
+    Returns ``(local_paths, file_format)``: one file for normal uploads, or several
+    parts of about SHARD_TARGET_BYTES when the upload is over SHARD_THRESHOLD_BYTES.
+    """
+    staging_format = _check_format(staging_format)
+    if os.path.getsize(artifact.source_path) <= SHARD_THRESHOLD_BYTES:
+        local_path, _ = stage_locally(artifact, schema_map, staging_format)
+        return [local_path], staging_format
+
+    with span(f"local_write_{staging_format}", rows=artifact.num_rows) as sp:
+        paths = write_shards(artifact, schema_map, staging_format)
+        size = sp.bytes = sum(os.path.getsize(path) for path in paths)
+
+    print(f"📦 Staging {artifact.filename} as {len(paths)} {staging_format} part(s): {size} bytes")
+    return paths, staging_format
+
+
+def stage_locally(artifact, schema_map: dict, staging_format: str = "csv"):
+    """Returns ``(local_path, file_format)`` for the file that should be PUT to the Volume."""
+    staging_format = _check_format(staging_format)
+
+    with span(f"local_write_{staging_format}", rows=artifact.num_rows) as sp:
+        if staging_format == "parquet":
+            local_path = write_parquet_staging(artifact, schema_map)
+        elif artifact.source_format != "csv" or artifact.source_encoding != "utf8":
+            # Other formats, and CSVs in other encodings, are written out as UTF-8 CSV
+            local_path = write_csv_staging(artifact)
+        else:
+            local_path = artifact.source_path
+        size = sp.bytes = os.path.getsize(local_path)
+
+    print(f"📦 Staging {artifact.filename} as {staging_format}: {size} bytes")
+    return local_path, staging_format
@@ -0,0 +1,344 @@
+import os
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
+from metrics import register_gauges
+from shared_store import pid_alive, shared_store
+
+
+# ------------------------------------------------------------------------
+# Local temp storage for uploads, parsed artifacts and staged files.
+# Every file the app writes lives under UPLOAD_DIR, uploads go into a
+# per-session directory, and the whole tree is held to a disk quota (plus a
+# per-session quota) by evicting the least recently used files first.
+# With a shared store, each server worker tracks and evicts only the files
+# it wrote, but counts every worker's bytes toward the quota, and a worker
+# using another's file (an adopted artifact) holds it through the store.
+# ------------------------------------------------------------------------
+UPLOAD_DIR = os.getenv("UPLOAD_TMP_DIR", os.path.join(tempfile.gettempdir(), "file-uploader"))
+SESSIONS_DIR = os.path.join(UPLOAD_DIR, "sessions")
+DISK_QUOTA_BYTES = int(os.getenv("UPLOAD_DISK_QUOTA_BYTES", str(20 * 1024 ** 3)))
+SESSION_QUOTA_BYTES = int(os.getenv("UPLOAD_SESSION_QUOTA_BYTES", str(10 * 1024 ** 3)))
+
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+os.makedirs(SESSIONS_DIR, exist_ok=True)
+
+
+class DiskQuotaError(OSError):
+    """Raised when space can't be freed because everything left is in use."""
+
+
+class _TrackedFile:
+    def __init__(self, path, size, session_id):
+        self.path = path
+        self.size = size
+        self.session_id = session_id
+        self.on_evict = []
+        # Files are never evicted while held (an upload in progress, a running write...)
+        self.holds = 0
+
+
+class TempStore:
+    """LRU-tracked files under ``root`` with a total and a per-session byte quota."""
+
+    def __init__(self, root=UPLOAD_DIR, quota=DISK_QUOTA_BYTES, session_quota=SESSION_QUOTA_BYTES, store=None):
+        self.root = root
+        self.quota = quota
+        self.session_quota = session_quota
+        self.store = store
+        self._lock = threading.Lock()
+        self._files = OrderedDict()
+        self._evictions = 0
+        self._evicted_bytes = 0
+
+    # --------------------------------------------------------------------
+    # Sessions
+    # --------------------------------------------------------------------
+    def session_dir(self, session_id: str):
+        """Returns (and creates) the directory for ``session_id``."""
+        if not _SESSION_ID_RE.match(session_id or ""):
+            raise ValueError("Invalid upload session id.")
+        path = os.path.join(SESSIONS_DIR, session_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def session_bytes(self, session_id: str):
+        with self._lock:
+            return sum(f.size for f in self._files.values() if f.session_id == session_id)
+
+    # --------------------------------------------------------------------
+    # Tracking
+    # --------------------------------------------------------------------
+    def track(self, path: str, session_id: str = None, size: int = None, on_evict=None, hold=False):
+        """
+        Starts tracking ``path`` (most recently used) and evicts older files if the
+        quota is now exceeded. ``on_evict(path)`` runs after the file is deleted;
+        tracking a path again adds another callback.
+        """
+        size = os.path.getsize(path) if size is None else size
+        with self._lock:
+            tracked = self._files.get(path)
+            if tracked is None:
+                tracked = self._files[path] = _TrackedFile(path, size, session_id)
+            tracked.size = size
+            if on_evict is not None:
+                tracked.on_evict.append(on_evict)
+            tracked.holds += int(hold)
+            self._files.move_to_end(path)
+        if self.store is not None:
+            # Claimed, so a worker starting later doesn't adopt (and evict) it
+            self.store.set("temp_files", path, os.getpid())
+        self._make_room(0, session_id)
+
+    def touch(self, path: str):
+        """Marks ``path`` as just used."""
+        with self._lock:
+            if path in self._files:
+                self._files.move_to_end(path)
+
+    def forget(self, path: str):
+        """Stops tracking ``path`` without deleting it."""
+        with self._lock:
+            tracked = self._files.pop(path, None)
+        if tracked is not None and self.store is not None:
+            self.store.delete("temp_files", path)
+
+    def remove(self, path: str):
+        """Stops tracking and deletes ``path``."""
+        self.forget(path)
+        _delete(path)
+
+    @contextmanager
+    def hold(self, *paths):
+        """
+        Protects ``paths`` from eviction for the duration of the ``with`` block,
+        including files another worker tracks.
+        """
+        with self._lock:
+            held = [self._files[p] for p in paths if p in self._files]
+            for tracked in held:
+                tracked.holds += 1
+                self._files.move_to_end(tracked.path)
+            foreign = [p for p in paths if p not in self._files]
+        token = uuid.uuid4().hex
+        if foreign and self.store is not None:
+            # Under the eviction guard, so the owner either sees the hold or has already deleted the file
+            with self._guard():
+                for path in foreign:
+                    self.store.set("temp_holds", f"{path}#{token}", os.getpid())
+        try:
+            yield
+        finally:
+            self.release(*[tracked.path for tracked in held])
+            if foreign and self.store is not None:
+                for path in foreign:
+                    self.store.delete("temp_holds", f"{path}#{token}")
+
+    def release(self, *paths):
+        with self._lock:
+            for path in paths:
+                tracked = self._files.get(path)
+                if tracked is not None and tracked.holds:
+                    tracked.holds -= 1
+
+    # --------------------------------------------------------------------
+    # Quota
+    # --------------------------------------------------------------------
+    def reserve(self, nbytes: int, session_id: str = None):
+        """
+        Makes room for ``nbytes`` that are about to be written, evicting the least
+        recently used files. Raises DiskQuotaError if that isn't possible.
+        """
+        if nbytes > self.quota or (session_id and nbytes > self.session_quota):
+            raise DiskQuotaError(f"{nbytes} bytes exceeds the temp storage quota.")
+        if not self._make_room(nbytes, session_id):
+            raise DiskQuotaError("Temp storage is full of files that are still in use; try again later.")
+
+    def _make_room(self, extra: int, session_id: str = None):
+        """Evicts this worker's LRU files until ``extra`` more bytes fit; returns whether they do."""
+        others = self._others_used()
+        with self._lock:
+            fits = not self._over_locked(extra, session_id, others)
+            used = self._used_locked()
+        if fits:
+            self._publish_usage(used)
+            return True
+
+        with self._guard():
+            others, shared_held = self._others_used(), self._shared_holds()
+            with self._lock:
+                evicted = self._evict_locked(extra, session_id, others, shared_held)
+                fits = not self._over_locked(extra, session_id, others)
+                used = self._used_locked()
+            for tracked in evicted:
+                _delete(tracked.path)
+            self._release_claims(evicted)
+            self._publish_usage(used)
+        self._finish_evictions(evicted)
+        return fits
+
+    def _guard(self):
+        """Serializes evictions with other workers' holds."""
+        return self.store.lock("temp_store:evict") if self.store is not None else nullcontext()
+
+    def _others_used(self):
+        """Bytes tracked by every other live worker."""
+        if self.store is None:
+            return 0
+        return sum(size for pid, size in self.store.items("temp_usage")
+                   if int(pid) != os.getpid() and pid_alive(int(pid)))
+
+    def _shared_holds(self):
+        """Paths some live worker holds through the store."""
+        if self.store is None:
+            return set()
+        return {key.rsplit("#", 1)[0] for key, pid in self.store.items("temp_holds") if pid_alive(pid)}
+
+    def _publish_usage(self, used: int):
+        if self.store is not None:
+            self.store.set("temp_usage", str(os.getpid()), used)
+
+    def _release_claims(self, evicted):
+        if self.store is not None:
+            for tracked in evicted:
+                self.store.delete("temp_files", tracked.path)
+
+    def _used_locked(self):
+        return sum(f.size for f in self._files.values())
+
+    def _session_used_locked(self, session_id):
+        return sum(f.size for f in self._files.values() if f.session_id == session_id)
+
+    def _over_locked(self, extra: int, session_id: str, others: int):
+        if self._used_locked() + others + extra > self.quota:
+            return True
+        return bool(session_id) and self._session_used_locked(session_id) + extra > self.session_quota
+
+    def _evict_locked(self, extra: int, session_id: str = None, others: int = 0, shared_held=frozenset()):
+        """Pops LRU files until the quotas hold; returns them for deletion outside the lock."""
+        evicted = []
+        used = self._used_locked() + others
+        session_used = self._session_used_locked(session_id) if session_id else 0
+
+        for path, tracked in list(self._files.items()):
+            over_total = used + extra > self.quota
+            over_session = session_id and session_used + extra > self.session_quota
+            if not over_total and not over_session:
+                break
+            if tracked.holds or path in shared_held:
+                continue
+            # Over only the session quota: evict just that session's files
+            if not over_total and tracked.session_id != session_id:
+                continue
+            del self._files[path]
+            used -= tracked.size
+            if tracked.session_id == session_id:
+                session_used -= tracked.size
+            evicted.append(tracked)
+
+        self._evictions += len(evicted)
+        self._evicted_bytes += sum(t.size for t in evicted)
+        return evicted
+
+    def _finish_evictions(self, evicted):
+        for tracked in evicted:
+            if tracked.session_id:
+                try:
+                    # Drops the session directory once its last file is gone
+                    os.rmdir(os.path.dirname(tracked.path))
+                except OSError:
+                    pass
+            print(f"🗑️ Evicted {tracked.path} ({tracked.size} bytes) to stay under the temp quota")
+            for callback in tracked.on_evict:
+                try:
+                    callback(tracked.path)
+                except Exception as e:
+                    print(f"⚠️ Eviction callback for {tracked.path} failed: {e}")
+
+    def scan(self):
+        """
+        Tracks files left behind by a previous run, oldest first, so they count toward
+        the quota. Files another live worker claimed are left to that worker, and while
+        any other worker is running, so are files nobody has claimed yet (it may be
+        writing them).
+        """
+        owners = dict(self.store.items("temp_files")) if self.store is not None else {}
+        if self.store is not None:
+            # Visible to workers that start later, before this one has tracked anything
+            self._publish_usage(0)
+        siblings = self._others_running()
+        found = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                owner = owners.get(path)
+                if owner is not None and owner != os.getpid() and pid_alive(owner):
+                    continue
+                if owner is None and siblings:
+                    continue
+                if name.endswith(".partial"):
+                    _delete(path)
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                session_id = os.path.basename(dirpath) if os.path.dirname(dirpath) == SESSIONS_DIR else None
+                found.append((stat.st_atime, path, stat.st_size, session_id))
+        for _, path, size, session_id in sorted(found):
+            self.track(path, session_id, size=size)
+        if siblings:
+            return
+        # Empty session directories from earlier runs
+        for session_id in os.listdir(SESSIONS_DIR):
+            session_path = os.path.join(SESSIONS_DIR, session_id)
+            if os.path.isdir(session_path) and not os.listdir(session_path):
+                shutil.rmtree(session_path, ignore_errors=True)
+
+    def _others_running(self):
+        if self.store is None:
+            return False
+        return any(int(pid) != os.getpid() and pid_alive(int(pid)) for pid, _ in self.store.items("temp_usage"))
+
+    def purge(self):
+        """Deletes everything under ``root`` — for a fresh start, when no shared state refers to it."""
+        with self._lock:
+            self._files.clear()
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                _delete(os.path.join(dirpath, name))
+        for session_id in os.listdir(SESSIONS_DIR):
+            shutil.rmtree(os.path.join(SESSIONS_DIR, session_id), ignore_errors=True)
+        print(f"🧹 Cleared leftover files under {self.root}")
+
+    def stats(self):
+        others = self._others_used()
+        with self._lock:
+            return {
+                "files": len(self._files),
+                "bytes": self._used_locked(),
+                "quota_bytes": self.quota,
+                "held_files": sum(1 for f in self._files.values() if f.holds),
+                "others_bytes": others,
+                "sessions": len({f.session_id for f in self._files.values() if f.session_id}),
+                "evictions": self._evictions,
+                "evicted_bytes": self._evicted_bytes,
+            }
+
+
+def _delete(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+temp_store = TempStore(store=shared_store)
+temp_store.scan()
+register_gauges("temp_store", temp_store.stats)
@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+
+# The app uses flat imports (``import validation``), as when run from its own directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Modules create their directories and shared state at import; keep all of it out of the real temp dir
+_TEST_DIR = tempfile.mkdtemp(prefix="file-uploader-tests-")
+os.environ.setdefault("UPLOAD_TMP_DIR", os.path.join(_TEST_DIR, "uploads"))
+os.environ.setdefault("SHARED_STORE_PATH", os.path.join(_TEST_DIR, "state.sqlite3"))
+os.environ.setdefault("ROW_INDEX_DIR", os.path.join(_TEST_DIR, "row-index"))
+os.environ.setdefault("LOCAL_VOLUME_ROOT", os.path.join(_TEST_DIR, "volumes"))
+# End-to-end tests write through the embedded DuckDB backend, never a warehouse
+os.environ.setdefault("UPLOADER_BACKEND", "local")
+os.environ.setdefault("STAGING_GC_INTERVAL_S", "0")
@@ -0,0 +1,49 @@
+import pytest
+
+from backends import SQLBackend
+from connection_pool import ConnectionPool
+
+
+def test_connection_pool_is_a_sql_backend():
+    pool = ConnectionPool(lambda: None)
+    assert isinstance(pool, SQLBackend)
+    pool.close()
+
+
+def test_local_backend_is_a_sql_backend(tmp_path):
+    pytest.importorskip("duckdb")
+    from backends import LocalBackend
+
+    backend = LocalBackend(volume_root=str(tmp_path))
+    assert isinstance(backend, SQLBackend)
+    backend.close()
+
+
+@pytest.mark.parametrize("delete_column", [None, "__delete"])
+def test_local_backend_runs_planned_merge(tmp_path, delete_column):
+    pytest.importorskip("duckdb")
+    from backends import LocalBackend
+    from write_planner import plan_merge
+
+    backend = LocalBackend(volume_root=str(tmp_path))
+    with backend.cursor() as cursor:
+        cursor.execute("CREATE SCHEMA sandbox.s")
+        cursor.execute("CREATE TABLE sandbox.s.t (id BIGINT, v VARCHAR)")
+        cursor.execute("INSERT INTO sandbox.s.t VALUES (1, 'a'), (2, 'b'), (3, 'c')")
+        if delete_column:
+            source = ("(SELECT * FROM (VALUES (1, 'x', true), (2, 'y', false), (4, 'z', false), (5, 'w', true))"
+                      f" AS v(id, v, {delete_column}))")
+        else:
+            source = "(SELECT * FROM (VALUES (1, 'x'), (2, 'y'), (4, 'z'), (5, 'w')) AS v(id, v))"
+        statement, = plan_merge("sandbox.s.t", source, {"id": "bigint", "v": "string"}, ["id"],
+                                delete_column=delete_column)
+        cursor.execute(statement)
+        cursor.execute("SELECT id, v FROM sandbox.s.t ORDER BY id")
+        result = cursor.fetchall()
+    backend.close()
+
+    if delete_column:
+        # 1 deleted, 2 updated, 3 untouched, 4 inserted, 5 flagged but unmatched
+        assert result == [(2, "y"), (3, "c"), (4, "z")]
+    else:
+        assert result == [(1, "x"), (2, "y"), (3, "c"), (4, "z"), (5, "w")]
@@ -0,0 +1,31 @@
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pytest.importorskip("numpy")
+
+import profiler  # noqa: E402
+from profiler import TableProfile  # noqa: E402
+
+
+def profile_of(ids):
+    table = pa.table({"id": ids})
+    profile = TableProfile(table.schema)
+    for batch in table.to_batches(max_chunksize=1000):
+        profile.update(batch)
+    return profile
+
+
+def test_exactly_unique_column_is_a_key_candidate():
+    profile = profile_of(list(range(5000)))
+    assert profile.get("id").distinct_is_exact
+    assert profile.key_candidates() == ["id"]
+
+
+def test_estimated_uniqueness_is_not_a_key_candidate(monkeypatch):
+    monkeypatch.setattr(profiler, "EXACT_DISTINCT_LIMIT", 1000)
+    # About 2% duplicates: within the sketch's tolerance, but not a key
+    ids = list(range(4900)) + list(range(100))
+    column = profile_of(ids).get("id")
+    assert not column.distinct_is_exact
+    assert column.unique
+    assert profile_of(ids).key_candidates() == []
@@ -0,0 +1,71 @@
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+import readers  # noqa: E402
+from readers import ColumnTypeError, read_csv  # noqa: E402
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    # A few rows per block, so a small file crosses several block boundaries
+    monkeypatch.setattr(readers, "CSV_BLOCK_BYTES", 32)
+
+
+def write_csv(tmp_path, lines, name="upload.csv"):
+    path = tmp_path / name
+    path.write_bytes(("\n".join(lines) + "\n").encode())
+    return str(path)
+
+
+def read_all(path, text_columns=()):
+    schema, batches = read_csv(path, text_columns)
+    return schema, pa.Table.from_batches(list(batches), schema)
+
+
+def test_block_ends_split_after_newlines():
+    buffer = pa.py_buffer(b"a,b\n1,2\n33,44\n5,6")
+    ends = list(readers._block_ends(buffer, 0, 5))
+    assert ends == [(0, 8), (8, 14), (14, 17)]
+
+
+def test_rows_spanning_many_blocks_are_read_once(tmp_path, small_blocks):
+    lines = ["id,name"] + [f"{i},name-{i}" for i in range(200)]
+    schema, table = read_all(write_csv(tmp_path, lines))
+    assert schema.field("id").type == pa.int64()
+    assert table.column("id").to_pylist() == list(range(200))
+    assert table.column("name").to_pylist() == [f"name-{i}" for i in range(200)]
+
+
+def test_utf8_bom_is_skipped(tmp_path, small_blocks):
+    path = tmp_path / "bom.csv"
+    path.write_bytes(b"\xef\xbb\xbfid,name\n" + b"".join(f"{i},x\n".encode() for i in range(20)))
+    schema, table = read_all(str(path))
+    assert schema.names == ["id", "name"]
+    assert table.num_rows == 20
+
+
+def test_bad_value_in_a_later_block_names_the_column(tmp_path, small_blocks):
+    lines = ["id,amount"] + [f"{i},{i}" for i in range(50)] + ["50,abc"]
+    path = write_csv(tmp_path, lines)
+    with pytest.raises(ColumnTypeError) as raised:
+        read_all(path)
+    assert raised.value.columns == ["amount"]
+
+    schema, table = read_all(path, text_columns=["amount"])
+    assert schema.field("amount").type == pa.string()
+    assert table.column("amount").to_pylist()[-2:] == ["49", "abc"]
+    assert schema.field("id").type == pa.int64()
+
+
+def test_column_empty_in_the_first_block_is_text(tmp_path, small_blocks):
+    lines = ["id,note"] + [f"{i}," for i in range(10)] + ["10,late"]
+    schema, table = read_all(write_csv(tmp_path, lines))
+    assert schema.field("note").type == pa.string()
+    assert table.column("note").to_pylist()[-1] == "late"
+
+
+def test_text_columns_keep_leading_zeros_and_empty_is_null(tmp_path):
+    schema, table = read_all(write_csv(tmp_path, ["code,note", "00123,", ",x"]), text_columns=["code", "note"])
+    assert table.column("code").to_pylist() == ["00123", None]
+    assert table.column("note").to_pylist() == [None, "x"]
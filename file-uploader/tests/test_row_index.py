@@ -0,0 +1,74 @@
+import pytest
+
+pytest.importorskip("pyarrow")
+pytest.importorskip("pandas")
+pytest.importorskip("flask")
+
+from row_index import DELETE_COLUMN, commit_index, diff_against_index, drop_indexes  # noqa: E402
+from upload_artifacts import build_artifact  # noqa: E402
+
+TABLE = "main.sales.orders"
+
+
+def upload(tmp_path, name, rows):
+    path = tmp_path / name
+    path.write_text("id,amount\n" + "".join(f"{i},{amount}\n" for i, amount in rows))
+    return build_artifact(str(path), name)
+
+
+@pytest.fixture(autouse=True)
+def fresh_index():
+    drop_indexes(TABLE)
+    yield
+    drop_indexes(TABLE)
+
+
+def sent_rows(artifact):
+    return sorted(artifact.read_table().to_pylist(), key=lambda row: row["id"])
+
+
+def test_first_merge_sends_every_row(tmp_path):
+    artifact = upload(tmp_path, "first.csv", [(1, 10), (2, 20)])
+    changed, changes, pending = diff_against_index(artifact, TABLE, ["id"])
+    assert changes == {"changed": 2, "new": 2, "updated": 0, "unchanged": 0, "deleted": 0}
+    assert changed.num_rows == 2
+    commit_index(pending)
+
+
+def test_only_new_and_changed_rows_are_sent(tmp_path):
+    _, _, pending = diff_against_index(upload(tmp_path, "first.csv", [(1, 10), (2, 20), (3, 30)]), TABLE, ["id"])
+    commit_index(pending)
+
+    artifact = upload(tmp_path, "second.csv", [(1, 10), (2, 25), (4, 40)])
+    changed, changes, pending = diff_against_index(artifact, TABLE, ["id"])
+    assert changes == {"changed": 2, "new": 1, "updated": 1, "unchanged": 1, "deleted": 0}
+    assert sent_rows(changed) == [{"id": 2, "amount": 25}, {"id": 4, "amount": 40}]
+    commit_index(pending)
+
+    # Key 3 was left out of the second upload but stays in the index
+    again, changes, _ = diff_against_index(upload(tmp_path, "third.csv", [(3, 30)]), TABLE, ["id"])
+    assert changes["unchanged"] == 1 and again.num_rows == 0
+
+
+def test_missing_keys_become_delete_markers(tmp_path):
+    _, _, pending = diff_against_index(upload(tmp_path, "first.csv", [(1, 10), (2, 20)]), TABLE, ["id"],
+                                       deletes=True)
+    commit_index(pending)
+
+    artifact = upload(tmp_path, "second.csv", [(1, 11)])
+    changed, changes, _ = diff_against_index(artifact, TABLE, ["id"], deletes=True)
+    assert changes["deleted"] == 1
+    assert sent_rows(changed) == [
+        {"id": 1, "amount": 11, DELETE_COLUMN: False},
+        {"id": 2, "amount": None, DELETE_COLUMN: True},
+    ]
+
+
+def test_index_over_other_columns_is_ignored(tmp_path):
+    _, _, pending = diff_against_index(upload(tmp_path, "first.csv", [(1, 10)]), TABLE, ["id"])
+    commit_index(pending)
+
+    path = tmp_path / "wider.csv"
+    path.write_text("id,amount,note\n1,10,x\n")
+    changed, changes, _ = diff_against_index(build_artifact(str(path), "wider.csv"), TABLE, ["id"])
+    assert changes["new"] == 1 and changed.num_rows == 1
@@ -0,0 +1,61 @@
+import multiprocessing
+import time
+
+import pytest
+
+pytest.importorskip("flask")
+
+from shared_store import LockTimeout, SharedStore  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SharedStore(str(tmp_path / "state.sqlite3"))
+    yield store
+    store.close()
+
+
+def _take_and_exit(path, name):
+    # Exits without releasing, as a killed worker would
+    assert SharedStore(path).try_acquire(name) is not None
+
+
+def test_lock_of_an_exited_worker_is_taken_over(store):
+    child = multiprocessing.get_context("fork").Process(target=_take_and_exit, args=(store.path, "write:t"))
+    child.start()
+    child.join()
+    assert child.exitcode == 0
+    assert store.try_acquire("write:t") is not None
+
+
+def test_expired_lock_is_taken_over(store):
+    assert store.try_acquire("write:t", ttl_s=0.05) is not None
+    assert store.try_acquire("write:t") is None
+    time.sleep(0.1)
+    assert store.try_acquire("write:t") is not None
+
+
+def test_live_lock_blocks_until_released(store):
+    owner = store.try_acquire("write:t")
+    assert store.try_acquire("write:t") is None
+    waits = []
+    with pytest.raises(LockTimeout):
+        with store.lock("write:t", timeout_s=0.3, on_wait=lambda: waits.append(1)):
+            pass
+    assert waits == [1]
+
+    # Only the owner's token releases it
+    store.release("write:t", "someone-else")
+    assert store.try_acquire("write:t") is None
+    store.release("write:t", owner)
+    with store.lock("write:t", timeout_s=0.3):
+        assert store.try_acquire("write:t") is None
+    assert store.try_acquire("write:t") is not None
+
+
+def test_trim_drops_the_records_closest_to_expiry(store):
+    store.set("metadata", "forever", 1)
+    for i, ttl in enumerate((30, 10, 20)):
+        store.set("metadata", f"k{i}", i, ttl_s=ttl)
+    assert store.trim("metadata", 2) == 2
+    assert [key for key, _ in store.items("metadata")] == ["forever", "k0"]
@@ -0,0 +1,28 @@
+import pytest
+
+pytest.importorskip("pyarrow")
+pytest.importorskip("flask")
+
+from upload_artifacts import build_artifact, with_text_columns  # noqa: E402
+
+
+def upload(tmp_path, text, name="codes.csv"):
+    path = tmp_path / name
+    path.write_text(text)
+    return build_artifact(str(path), name)
+
+
+def test_string_target_columns_are_reread_as_text(tmp_path):
+    artifact = upload(tmp_path, "code,qty\n00123,1\n04567,\n")
+    assert artifact.read_table().column("code").to_pylist() == [123, 4567]
+
+    text = with_text_columns(artifact, {"CODE": "string", "qty": "bigint"})
+    assert text.read_table().column("code").to_pylist() == ["00123", "04567"]
+    assert text.read_table().column("qty").to_pylist() == [1, None]
+    assert with_text_columns(artifact, {"code": "string"}) is text
+    assert with_text_columns(text, {"code": "string"}) is text
+
+
+def test_artifacts_without_string_targets_are_unchanged(tmp_path):
+    artifact = upload(tmp_path, "code,qty\n1,2\n", "plain.csv")
+    assert with_text_columns(artifact, {"code": "bigint", "qty": "int"}) is artifact
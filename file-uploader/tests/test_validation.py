@@ -0,0 +1,75 @@
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+from validation import validate_artifact  # noqa: E402
+
+
+class ParquetArtifact:
+    """Just enough of an UploadArtifact for validate_artifact."""
+
+    def __init__(self, path, table):
+        pq.write_table(table, path)
+        self.path = path
+        self.column_names = table.schema.names
+        self.num_rows = table.num_rows
+        self.profile = None
+
+    def parquet_file(self):
+        return pq.ParquetFile(self.path)
+
+
+def validate(tmp_path, columns, schema_map, not_null=()):
+    artifact = ParquetArtifact(str(tmp_path / "upload.parquet"), pa.table(columns))
+    return validate_artifact(artifact, schema_map, not_null)
+
+
+def errors(report, column):
+    return report["columns"].get(column, {}).get("errors", {})
+
+
+def test_bigint_column_with_text_is_reported_not_raised(tmp_path):
+    report = validate(tmp_path, {"id": ["1", "x", "3"]}, {"id": "bigint"})
+    assert not report["ok"]
+    assert errors(report, "id") == {"not an integer": 1}
+    assert report["columns"]["id"]["samples"][0] == {"line": 3, "value": "x", "error": "not an integer"}
+
+
+def test_bigint_bounds_are_exact(tmp_path):
+    values = ["9223372036854775807", "-9223372036854775808", "9223372036854775808", "-9223372036854775809",
+              "+0009223372036854775807", " 42 ", None]
+    report = validate(tmp_path, {"id": values}, {"id": "bigint"})
+    assert errors(report, "id") == {"numeric overflow": 2}
+    assert [s["line"] for s in report["columns"]["id"]["samples"]] == [4, 5]
+
+
+def test_int_overflow_from_numeric_column(tmp_path):
+    report = validate(tmp_path, {"n": pa.array([1, 2 ** 31, -2 ** 31], pa.int64())}, {"n": "int"})
+    assert errors(report, "n") == {"numeric overflow": 1}
+
+
+def test_date_column(tmp_path):
+    report = validate(tmp_path, {"d": ["2024-01-31", "2024-13-01", "31/01/2024", None]}, {"d": "date"})
+    assert errors(report, "d") == {"unparsable date": 2}
+
+
+def test_boolean_column(tmp_path):
+    report = validate(tmp_path, {"b": ["true", " No ", "1", "maybe"]}, {"b": "boolean"})
+    assert errors(report, "b") == {"not a boolean": 1}
+
+
+def test_not_null_and_missing_columns(tmp_path):
+    report = validate(tmp_path, {"id": ["1", None], "extra": ["a", "b"]},
+                      {"id": "int", "name": "string"}, not_null=["id"])
+    assert report["missing_columns"] == ["name"]
+    assert report["extra_columns"] == ["extra"]
+    assert errors(report, "id") == {"null in NOT NULL column": 1}
+    assert not report["ok"]
+
+
+def test_clean_upload_passes(tmp_path):
+    report = validate(tmp_path, {"id": ["1", "2"], "amount": ["1.5", "-2e3"]},
+                      {"id": "bigint", "amount": "decimal(10,2)"})
+    assert report["ok"]
+    assert report["rows"] == 2
@@ -0,0 +1,70 @@
+import pytest
+
+from write_planner import plan_write, pruning_predicates, replace_predicate, values_parameters, values_source
+
+SCHEMA = {"id": "bigint", "name": "string", "day": "date"}
+SOURCE = "read_files('/Volumes/main/staging/uploads/abc/*.parquet', format => 'parquet')"
+
+
+def test_append_is_one_cast_insert():
+    statement, = plan_write("append", "main.s.t", SOURCE, SCHEMA)
+    assert statement == (
+        "INSERT INTO main.s.t SELECT CAST(s.`id` AS bigint) AS `id`, CAST(s.`name` AS string) AS `name`, "
+        f"CAST(s.`day` AS date) AS `day` FROM {SOURCE} AS s"
+    )
+
+
+def test_overwrite_is_one_insert_overwrite():
+    statement, = plan_write("overwrite", "main.s.t", SOURCE, SCHEMA)
+    assert statement.startswith("INSERT OVERWRITE main.s.t SELECT CAST(s.`id` AS bigint)")
+
+
+def test_replace_needs_a_predicate():
+    with pytest.raises(ValueError):
+        plan_write("replace", "main.s.t", SOURCE, SCHEMA)
+    predicate = replace_predicate(SCHEMA, column_values={"day": ["2024-01-01"]}, null_columns=["day"])
+    statement, = plan_write("replace", "main.s.t", SOURCE, SCHEMA, replace_where=predicate)
+    assert statement.startswith(
+        "INSERT INTO main.s.t REPLACE WHERE (`day` IN (CAST('2024-01-01' AS date)) OR `day` IS NULL) SELECT"
+    )
+
+
+def test_merge_on_keys_with_pruning():
+    with pytest.raises(ValueError):
+        plan_write("merge", "main.s.t", SOURCE, SCHEMA)
+    statement, = plan_write("merge", "main.s.t", SOURCE, SCHEMA, merge_keys="id",
+                            prune_predicates=["t.`day` IN (CAST('2024-01-01' AS date))"])
+    assert "ON t.`id` = s.`id`\n  AND t.`day` IN (CAST('2024-01-01' AS date))" in statement
+    assert statement.endswith("WHEN MATCHED THEN UPDATE SET *\nWHEN NOT MATCHED THEN INSERT *")
+
+
+def test_merge_with_delete_marker():
+    statement, = plan_write("merge", "main.s.t", SOURCE, SCHEMA, merge_keys=["id"], delete_column="__delete")
+    assert "CAST(s.`__delete` AS boolean) AS `__delete`" in statement
+    assert "WHEN MATCHED AND s.`__delete` THEN DELETE" in statement
+    assert "WHEN MATCHED THEN UPDATE SET t.`id` = s.`id`, t.`name` = s.`name`, t.`day` = s.`day`" in statement
+    assert statement.endswith(
+        "WHEN NOT MATCHED AND NOT s.`__delete` THEN INSERT (`id`, `name`, `day`) VALUES (s.`id`, s.`name`, s.`day`)"
+    )
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        plan_write("upsert", "main.s.t", SOURCE, SCHEMA)
+
+
+def test_inline_values_source():
+    source = values_source(["id", "name"], 2)
+    assert source == "(SELECT * FROM VALUES (:p0_0, :p0_1), (:p1_0, :p1_1) AS v(`id`, `name`))"
+    assert values_parameters([(1, "a"), (2, "b")]) == {"p0_0": 1, "p0_1": "a", "p1_0": 2, "p1_1": "b"}
+
+
+def test_partition_pruning_keeps_null_partitions():
+    predicates = pruning_predicates(SCHEMA, {"id": (1, 9)}, {"day": ["2024-01-01"]}, null_columns=["day"])
+    assert predicates == [
+        "t.`id` BETWEEN CAST('1' AS bigint) AND CAST('9' AS bigint)",
+        "(t.`day` IN (CAST('2024-01-01' AS date)) OR t.`day` IS NULL)",
+    ]
+    assert pruning_predicates(SCHEMA, partition_values={"day": ["2024-01-01"]}) == [
+        "t.`day` IN (CAST('2024-01-01' AS date))"
+    ]
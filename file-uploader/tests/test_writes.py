@@ -0,0 +1,44 @@
+import pytest
+
+pytest.importorskip("duckdb")
+pytest.importorskip("flask")
+pq = pytest.importorskip("pyarrow.parquet")
+
+import databricks_funcs as df  # noqa: E402
+from upload_artifacts import build_artifact  # noqa: E402
+
+TABLE = "sandbox.tests.codes"
+
+
+@pytest.fixture
+def table():
+    with df.backend.cursor() as cursor:
+        cursor.execute("CREATE SCHEMA IF NOT EXISTS sandbox.tests")
+        cursor.execute(f"CREATE OR REPLACE TABLE {TABLE} (code VARCHAR, qty BIGINT)")
+    df.invalidate_table(TABLE)
+    yield TABLE
+    df.invalidate_table(TABLE)
+
+
+def rows():
+    with df.backend.cursor() as cursor:
+        cursor.execute(f"SELECT code, qty FROM {TABLE} ORDER BY qty")
+        return cursor.fetchall()
+
+
+@pytest.mark.parametrize("staging_format, direct", [("csv", True), ("csv", False), ("parquet", False)])
+def test_string_columns_keep_leading_zeros(tmp_path, monkeypatch, table, staging_format, direct):
+    monkeypatch.setattr(df, "DIRECT_WRITE_MAX_ROWS", 500 if direct else 0)
+    path = tmp_path / "codes.csv"
+    path.write_text("code,qty\n00123,1\n04567,2\n")
+    df.stage_and_write(build_artifact(str(path), "codes.csv"), table, "append", staging_format)
+    assert rows() == [("00123", 1), ("04567", 2)]
+
+
+def test_parquet_staging_keeps_string_text(tmp_path, table):
+    path = tmp_path / "staged.csv"
+    path.write_text("code,qty\n00789,3\n")
+    volume_path, file_format = df.stage_artifact(build_artifact(str(path), "staged.csv"), table, "parquet")
+    staged = df.backend.local_path(volume_path.replace("/*.parquet", "/part-00000.parquet"))
+    assert file_format == "parquet"
+    assert pq.read_table(staged).column("code").to_pylist() == ["00789"]
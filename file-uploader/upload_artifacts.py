@@ -0,0 +1,458 @@
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+
+from metrics import span
+from profiler import TableProfile, profile_batches
+from readers import ColumnTypeError, detect_encoding, file_format_for, open_batches
+from shared_store import shared_store
+from staging import cast_table, to_arrow_type
+from temp_store import UPLOAD_DIR, temp_store
+
+
+# ------------------------------------------------------------------------
+# Parse-once upload artifacts.
+# Each uploaded file (CSV, Excel, JSON or Parquet) is parsed a single time into an on-disk Parquet file
+# keyed by its content hash; preview, validation and writes all reuse it,
+# reading it memory-mapped. Artifact files count toward the temp store quota.
+# Artifact records are also published to the shared store, so any server
+# worker can reopen an artifact another worker parsed; its files stay owned
+# (tracked and evicted) by the worker that wrote them, and a write using them
+# elsewhere holds them through the temp store's shared holds.
+# ------------------------------------------------------------------------
+ARTIFACT_DIR = os.path.join(UPLOAD_DIR, "artifacts")
+MAX_ARTIFACTS = int(os.getenv("UPLOAD_MAX_ARTIFACTS", "64"))
+HASH_BLOCK_SIZE = 4 * 1024 * 1024
+
+os.makedirs(ARTIFACT_DIR, exist_ok=True)
+
+_artifacts = OrderedDict()
+_artifacts_lock = threading.Lock()
+# Content hashes of artifacts parsed by another worker; their files aren't ours to delete
+_adopted = set()
+
+
+class UploadArtifact:
+    def __init__(self, content_hash: str, filename: str, source_path: str, parquet_path: str,
+                 num_rows: int, column_names: list, source_format: str = "csv", profile=None,
+                 source_encoding: str = "utf8"):
+        self.content_hash = content_hash
+        self.filename = filename
+        self.source_path = source_path
+        # Format of source_path; CSV staging can only ship the source as-is when this is "csv"
+        self.source_format = source_format
+        # Text encoding of source_path; only UTF-8 can be shipped to the warehouse as-is
+        self.source_encoding = source_encoding
+        self.parquet_path = parquet_path
+        self.num_rows = num_rows
+        self.column_names = column_names
+        # Column profile from the parse pass; derived artifacts build theirs on first use
+        self.profile = profile
+
+    @property
+    def num_columns(self):
+        return len(self.column_names)
+
+    def parquet_file(self):
+        temp_store.touch(self.parquet_path)
+        return pq.ParquetFile(self.parquet_path, memory_map=True)
+
+    def read_table(self, columns=None):
+        temp_store.touch(self.parquet_path)
+        return pq.read_table(self.parquet_path, columns=columns, memory_map=True)
+
+    def get_profile(self):
+        if self.profile is None:
+            parquet_file = self.parquet_file()
+            with span("profile", rows=self.num_rows):
+                self.profile = profile_batches(parquet_file.schema_arrow, parquet_file.iter_batches())
+        return self.profile
+
+    def files(self):
+        """Local files backing the artifact — hold these while a write uses them."""
+        return self.source_path, self.parquet_path
+
+    def to_dict(self):
+        return {
+            "content_hash": self.content_hash,
+            "filename": self.filename,
+            "num_rows": self.num_rows,
+            "num_columns": self.num_columns,
+            "source_format": self.source_format,
+            "source_encoding": self.source_encoding,
+        }
+
+    def to_record(self):
+        return {
+            "content_hash": self.content_hash,
+            "filename": self.filename,
+            "source_path": self.source_path,
+            "parquet_path": self.parquet_path,
+            "num_rows": self.num_rows,
+            "column_names": self.column_names,
+            "source_format": self.source_format,
+            "source_encoding": self.source_encoding,
+        }
+
+    @classmethod
+    def from_record(cls, record):
+        # The profile isn't shared; get_profile() rebuilds it in this worker if needed
+        return cls(record["content_hash"], record["filename"], record["source_path"], record["parquet_path"],
+                   record["num_rows"], record["column_names"], record["source_format"],
+                   source_encoding=record["source_encoding"])
+
+
+def hash_file(path: str):
+    """Streams a file through SHA-256 and returns the hex digest."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _parse_to_parquet(source_path: str, filename: str, parquet_path: str, text_columns=()):
+    """
+    Streams the upload into Parquet batch by batch, profiling each batch on the
+    way, and returns (rows, column names, profile). A column whose values stop
+    matching the type inferred from the start of the file is re-read as text,
+    so validation can report the bad rows instead of the parse failing.
+    """
+    text_columns = list(text_columns)
+    while True:
+        try:
+            return _write_parquet(source_path, filename, parquet_path, text_columns)
+        except ColumnTypeError as e:
+            text_columns += e.columns
+            print(f"🔁 '{filename}': re-reading {', '.join(e.columns)} as text — {e}")
+
+
+def _write_parquet(source_path: str, filename: str, parquet_path: str, text_columns):
+    tmp_path = f"{parquet_path}.partial"
+    num_rows = 0
+    schema, batches = open_batches(source_path, filename, text_columns)
+    profile = TableProfile(schema)
+    with pq.ParquetWriter(tmp_path, schema, compression="zstd") as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            profile.update(batch)
+            num_rows += batch.num_rows
+    os.replace(tmp_path, parquet_path)
+    return num_rows, schema.names, profile
+
+
+def _link_parquet(source_path: str, parquet_path: str):
+    """
+    Uses an uploaded Parquet file as the artifact without re-encoding it; the
+    profile is the only pass over its data.
+    """
+    parquet_file = pq.ParquetFile(source_path, memory_map=True)
+    tmp_path = f"{parquet_path}.partial"
+    try:
+        os.link(source_path, tmp_path)
+    except OSError:
+        # Different filesystem — fall back to a plain copy
+        shutil.copyfile(source_path, tmp_path)
+    os.replace(tmp_path, parquet_path)
+    profile = profile_batches(parquet_file.schema_arrow, parquet_file.iter_batches())
+    return parquet_file.metadata.num_rows, parquet_file.schema_arrow.names, profile
+
+
+def get_artifact(content_hash: str):
+    """Returns the cached artifact for ``content_hash`` (parsed by any worker) or None."""
+    with _artifacts_lock:
+        artifact = _artifacts.get(content_hash)
+        if artifact is not None and content_hash in _adopted and not os.path.exists(artifact.parquet_path):
+            # The owning worker evicted it since
+            del _artifacts[content_hash]
+            _adopted.discard(content_hash)
+            artifact = None
+        if artifact is not None:
+            _artifacts.move_to_end(content_hash)
+    if artifact is not None:
+        temp_store.touch(artifact.parquet_path)
+        return artifact
+    return _adopt(content_hash)
+
+
+def _adopt(content_hash: str):
+    """Reopens an artifact another worker published, if its files are still on disk."""
+    record = shared_store.get("artifacts", content_hash)
+    if record is None:
+        return None
+    artifact = UploadArtifact.from_record(record)
+    if not all(os.path.exists(path) for path in artifact.files()):
+        return None
+    with _artifacts_lock:
+        if content_hash not in _artifacts:
+            _artifacts[content_hash] = artifact
+            _adopted.add(content_hash)
+        artifact = _artifacts[content_hash]
+        _artifacts.move_to_end(content_hash)
+        evicted = _trim_locked()
+    _delete_evicted(evicted)
+    return artifact
+
+
+def build_artifact(source_path: str, filename: str):
+    """Parses ``source_path`` once and caches the result by content hash."""
+    file_format = file_format_for(filename)
+    with span("content_hash", bytes_=os.path.getsize(source_path)):
+        content_hash = hash_file(source_path)
+
+    # Shared across workers, so two requests for the same file only parse it once
+    with shared_store.lock(f"artifact:{content_hash}"):
+        artifact = get_artifact(content_hash)
+        if artifact is not None:
+            print(f"♻️ Reusing parsed artifact for '{filename}' ({content_hash[:12]})")
+            return artifact
+
+        parquet_path = os.path.join(ARTIFACT_DIR, f"{content_hash}.parquet")
+        # The compressed Parquet is smaller than the CSV, so this leaves enough room
+        temp_store.reserve(os.path.getsize(source_path))
+        with span(f"{file_format}_parse", bytes_=os.path.getsize(source_path)) as sp:
+            if file_format == "parquet":
+                num_rows, column_names, profile = _link_parquet(source_path, parquet_path)
+            else:
+                num_rows, column_names, profile = _parse_to_parquet(source_path, filename, parquet_path)
+            sp.rows = num_rows
+        encoding = detect_encoding(source_path)[0] if file_format == "csv" else "utf8"
+        artifact = UploadArtifact(content_hash, filename, source_path, parquet_path, num_rows, column_names,
+                                  file_format, profile, encoding)
+        print(f"🧱 Parsed '{filename}' into {parquet_path} — {num_rows} rows")
+        _register(artifact)
+    return artifact
+
+
+def with_text_columns(artifact, schema_map: dict):
+    """
+    Returns ``artifact`` with every column the target table stores as a string read
+    as text. Inference turns ``00123`` into 123 and no later cast brings the zeros
+    back, so those columns are re-parsed from the CSV source (once — the result is
+    cached like any artifact). Other sources carry their own types and are returned as-is.
+    """
+    if artifact.source_format != "csv":
+        return artifact
+    string_columns = {col.lower() for col, dtype in schema_map.items() if to_arrow_type(dtype) == pa.string()}
+    text_columns = [
+        field.name for field in artifact.parquet_file().schema_arrow
+        if field.name.lower() in string_columns and not pa.types.is_string(field.type)
+    ]
+    if not text_columns:
+        return artifact
+
+    content_hash = hashlib.sha256("|".join([artifact.content_hash, "text", *text_columns]).encode()).hexdigest()
+    with shared_store.lock(f"artifact:{content_hash}"):
+        derived = get_artifact(content_hash)
+        if derived is not None:
+            return derived
+        parquet_path = os.path.join(ARTIFACT_DIR, f"{content_hash}.parquet")
+        temp_store.reserve(os.path.getsize(artifact.source_path))
+        # The source path names the file's real format; a derived artifact's filename is the upload's
+        with span("csv_parse", bytes_=os.path.getsize(artifact.source_path)) as sp:
+            num_rows, column_names, profile = _parse_to_parquet(
+                artifact.source_path, os.path.basename(artifact.source_path), parquet_path, text_columns)
+            sp.rows = num_rows
+        derived = UploadArtifact(content_hash, artifact.filename, artifact.source_path, parquet_path, num_rows,
+                                 column_names, "csv", profile, artifact.source_encoding)
+        print(f"🔤 Re-read {', '.join(text_columns)} of '{artifact.filename}' as text for string columns")
+        _register(derived)
+    return derived
+
+
+def _forget(content_hash: str):
+    with _artifacts_lock:
+        _artifacts.pop(content_hash, None)
+    shared_store.delete("artifacts", content_hash)
+
+
+def _forget_source(source_path: str):
+    """Drops every artifact built from an upload that the temp store evicted."""
+    with _artifacts_lock:
+        doomed = [h for h, a in _artifacts.items() if a.source_path == source_path]
+        for content_hash in doomed:
+            del _artifacts[content_hash]
+    for content_hash in doomed:
+        shared_store.delete("artifacts", content_hash)
+
+
+def _register(artifact):
+    """Adds an artifact to the LRU cache, evicting (and deleting) the oldest ones."""
+    content_hash = artifact.content_hash
+    for path in {artifact.parquet_path, artifact.source_path}:
+        if path.startswith(ARTIFACT_DIR):
+            temp_store.track(path, on_evict=lambda _path: _forget(content_hash))
+        else:
+            temp_store.track(path, on_evict=_forget_source)
+
+    shared_store.set("artifacts", content_hash, artifact.to_record())
+    with _artifacts_lock:
+        _artifacts[content_hash] = artifact
+        _artifacts.move_to_end(content_hash)
+        _adopted.discard(content_hash)
+        evicted = _trim_locked()
+    _delete_evicted(evicted)
+
+
+def _trim_locked():
+    """Pops the least recently used artifacts over MAX_ARTIFACTS; returns the ones whose files are ours."""
+    evicted = []
+    while len(_artifacts) > MAX_ARTIFACTS:
+        content_hash, old = _artifacts.popitem(last=False)
+        if content_hash in _adopted:
+            # Another worker owns the files; just stop holding the artifact here
+            _adopted.discard(content_hash)
+        else:
+            evicted.append(old)
+    return evicted
+
+
+def _delete_evicted(evicted):
+    for old in evicted:
+        shared_store.delete("artifacts", old.content_hash)
+        for path in {old.parquet_path, old.source_path}:
+            # Only files we created — never the user's raw upload
+            if path.startswith(ARTIFACT_DIR):
+                temp_store.remove(path)
+
+
+def _derive(content_hash: str, filename: str, table):
+    """Persists ``table`` as a derived artifact (Parquet plus a CSV copy for CSV staging)."""
+    parquet_path = os.path.join(ARTIFACT_DIR, f"{content_hash}.parquet")
+    csv_path = os.path.join(ARTIFACT_DIR, f"{content_hash}.csv")
+    pq.write_table(table, parquet_path, compression="zstd")
+    pv.write_csv(table, csv_path)
+    artifact = UploadArtifact(content_hash, filename, csv_path, parquet_path, table.num_rows, table.schema.names)
+    _register(artifact)
+    return artifact
+
+
+def derive_artifact(artifact, tag: str, table):
+    """Persists ``table`` as an artifact derived from ``artifact`` (e.g. a filtered subset)."""
+    derived_hash = hashlib.sha256("|".join([artifact.content_hash, tag]).encode()).hexdigest()
+    return _derive(derived_hash, artifact.filename, table)
+
+
+def resolve_columns(artifact, columns):
+    """Maps target column names onto the upload's (case-insensitive) column names."""
+    by_lower = {name.lower(): name for name in artifact.column_names}
+    missing = [col for col in columns if col.lower() not in by_lower]
+    if missing:
+        raise KeyError(f"Column(s) not found in '{artifact.filename}': {', '.join(missing)}")
+    return [by_lower[col.lower()] for col in columns]
+
+
+def dedupe_artifact(artifact, keys: list):
+    """
+    Drops duplicate rows on ``keys``, keeping the last occurrence in the file.
+    Returns ``(artifact, removed_rows)``; the original artifact is returned untouched
+    when there are no duplicates.
+    """
+    with span("dedupe", rows=artifact.num_rows):
+        return _dedupe(artifact, resolve_columns(artifact, keys))
+
+
+def _dedupe(artifact, key_columns):
+    table = artifact.read_table()
+    if table.num_rows == 0:
+        return artifact, 0
+
+    table = table.append_column("__row", pa.array(np.arange(table.num_rows)))
+    # Rows with a null key never match in a MERGE, so they are all kept
+    null_key = pc.is_null(table.column(key_columns[0]))
+    for col in key_columns[1:]:
+        null_key = pc.or_(null_key, pc.is_null(table.column(col)))
+
+    keyed = table.filter(pc.invert(null_key))
+    last_rows = keyed.group_by(key_columns).aggregate([("__row", "max")]).column("__row_max")
+    keep = pa.concat_arrays([last_rows.combine_chunks(), table.filter(null_key).column("__row").combine_chunks()])
+    removed = table.num_rows - len(keep)
+    if removed == 0:
+        return artifact, 0
+
+    # Keep the surviving rows in their original file order
+    deduped = table.take(pc.take(keep, pc.sort_indices(keep))).drop_columns(["__row"])
+    derived_hash = hashlib.sha256("|".join([artifact.content_hash, "dedup", *key_columns]).encode()).hexdigest()
+    derived = _derive(derived_hash, artifact.filename, deduped)
+    print(f"🧹 Removed {removed} duplicate key row(s) from '{artifact.filename}' on {key_columns}")
+    return derived, removed
+
+
+def combine_artifacts(artifacts: list, schema_map: dict = None):
+    """
+    Concatenates several artifacts (matching columns by name) into one derived artifact.
+    Each is cast to the target table's ``schema_map`` first, so files whose columns
+    were parsed as different types (a date in one, a timestamp in another) still line up.
+    """
+    if len(artifacts) == 1:
+        return artifacts[0]
+    schema_map = schema_map or {}
+    tables = _unify_types([cast_table(a.read_table(), schema_map) for a in artifacts])
+    combined = pa.concat_tables(tables, promote_options="permissive")
+    parts = [a.content_hash for a in artifacts] + [f"{col}:{dtype}" for col, dtype in sorted(schema_map.items())]
+    content_hash = hashlib.sha256("|".join(parts).encode()).hexdigest()
+    filename = f"batch_of_{len(artifacts)}.csv"
+    return _derive(content_hash, filename, combined)
+
+
+def _unify_types(tables):
+    """Casts a column to string in every table when its types still can't be promoted to one."""
+    names = {name for table in tables for name in table.schema.names}
+    for name in names:
+        fields = [table.schema.field(name) for table in tables if name in table.schema.names]
+        if len({field.type for field in fields}) < 2:
+            continue
+        try:
+            pa.unify_schemas([pa.schema([field]) for field in fields], promote_options="permissive")
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Left as text, the warehouse's CAST converts (and reports) the values
+            tables = [_column_as_string(table, name) for table in tables]
+    return tables
+
+
+def _column_as_string(table, name):
+    if name not in table.schema.names:
+        return table
+    index = table.schema.get_field_index(name)
+    return table.set_column(index, name, pc.cast(table.column(index), pa.string()))
+
+
+def column_bounds(artifact, columns: list):
+    """Returns ``{column: (min, max)}`` over the whole upload, ignoring nulls."""
+    names = resolve_columns(artifact, columns)
+    table = artifact.read_table(columns=names)
+    bounds = {}
+    for col, name in zip(columns, names):
+        result = pc.min_max(table.column(name))
+        bounds[col] = (result["min"].as_py(), result["max"].as_py())
+    return bounds
+
+
+def distinct_values(artifact, column: str, limit: int):
+    """Returns the distinct non-null values of ``column``, or None if there are more than ``limit``."""
+    name = resolve_columns(artifact, [column])[0]
+    values = pc.unique(artifact.read_table(columns=[name]).column(name))
+    values = values.filter(pc.is_valid(values))
+    if len(values) > limit:
+        return None
+    return values.to_pylist()
+
+
+def read_head(content_hash: str, n: int = 10):
+    """Reads only the first ``n`` rows of an artifact as a pandas DataFrame."""
+    artifact = get_artifact(content_hash)
+    if artifact is None:
+        raise KeyError(f"No parsed artifact for {content_hash}; upload the file again.")
+    batches = artifact.parquet_file().iter_batches(batch_size=n)
+    first = next(batches, None)
+    if first is None:
+        return pq.read_schema(artifact.parquet_path, memory_map=True).empty_table().to_pandas()
+    return first.to_pandas()
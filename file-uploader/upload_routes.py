@@ -0,0 +1,176 @@
+import os
+import time
+import uuid
+
+from flask import jsonify, request
+from werkzeug.utils import secure_filename
+
+from metrics import span
+from shared_store import shared_store
+from temp_store import DiskQuotaError, temp_store
+
+
+# ------------------------------------------------------------------------
+# Chunked, resumable uploads.
+# The browser slices the file and PUTs each chunk; we stream the request
+# body straight into a temp file so memory stays bounded by BLOCK_SIZE.
+# Each browser session writes into its own directory under the temp store.
+# Upload sessions live in the shared store, so consecutive chunks can land
+# on different server workers.
+# ------------------------------------------------------------------------
+CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(5 * 1024 ** 3)))
+BLOCK_SIZE = 1024 * 1024
+# Abandoned upload sessions are forgotten after this long
+UPLOAD_RECORD_TTL_S = float(os.getenv("UPLOAD_RECORD_TTL_S", str(24 * 3600)))
+
+
+class UploadSession:
+    def __init__(self, filename: str, size: int, session_id: str, upload_id: str = None,
+                 received: int = 0, created_at: float = None):
+        self.upload_id = upload_id or uuid.uuid4().hex
+        self.session_id = session_id
+        self.filename = filename
+        self.size = size
+        self.received = received
+        self.path = os.path.join(temp_store.session_dir(session_id), f"{self.upload_id}_{filename}")
+        self.created_at = created_at or time.time()
+        if upload_id is None:
+            # Create the file up front so resumed chunks can always open it in r+b mode
+            open(self.path, "wb").close()
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(record["filename"], record["size"], record["session_id"], record["upload_id"],
+                   record["received"], record["created_at"])
+
+    @property
+    def complete(self):
+        return self.received >= self.size
+
+    def to_dict(self):
+        return {
+            "upload_id": self.upload_id,
+            "session_id": self.session_id,
+            "filename": self.filename,
+            "size": self.size,
+            "received": self.received,
+            "complete": self.complete,
+        }
+
+    def to_record(self):
+        return {**self.to_dict(), "created_at": self.created_at}
+
+
+def _save(session):
+    shared_store.set("uploads", session.upload_id, session.to_record(), ttl_s=UPLOAD_RECORD_TTL_S)
+
+
+def get_upload(upload_id: str):
+    """Returns the UploadSession for ``upload_id`` (started on any worker) or None."""
+    record = shared_store.get("uploads", upload_id)
+    if record is None:
+        return None
+    session = UploadSession.from_record(record)
+    # Evicted by the worker that tracks it
+    if not os.path.exists(session.path):
+        return None
+    return session
+
+
+def open_upload(upload_id: str, mode="rb"):
+    """Opens a completed upload as a file handle for the rest of the pipeline."""
+    session = get_upload(upload_id)
+    if session is None:
+        raise FileNotFoundError(f"Unknown upload id: {upload_id}")
+    if not session.complete:
+        raise ValueError(f"Upload {upload_id} is incomplete ({session.received}/{session.size} bytes)")
+    temp_store.touch(session.path)
+    return open(session.path, mode)
+
+
+def _drop_upload(upload_id: str):
+    """Forgets an upload whose file was evicted from the temp store."""
+    shared_store.delete("uploads", upload_id)
+
+
+def register_upload_routes(server):
+    """Adds the chunked upload endpoints to the Dash app's Flask server."""
+
+    @server.route("/api/uploads", methods=["POST"])
+    def create_upload():
+        body = request.get_json(silent=True) or {}
+        filename = secure_filename(body.get("filename") or "")
+        size = body.get("size")
+        session_id = body.get("session_id") or uuid.uuid4().hex
+
+        if not filename:
+            return jsonify(error="A filename is required."), 400
+        if not isinstance(size, int) or size < 0:
+            return jsonify(error="A non-negative integer size is required."), 400
+        if size > MAX_UPLOAD_BYTES:
+            return jsonify(error=f"File exceeds the {MAX_UPLOAD_BYTES} byte upload limit."), 413
+
+        try:
+            temp_store.reserve(size, session_id)
+            session = UploadSession(filename, size, session_id)
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+        except DiskQuotaError as e:
+            return jsonify(error=str(e)), 507
+
+        # Tracked at its declared size so concurrent uploads can't overcommit the disk
+        temp_store.track(session.path, session_id, size=size,
+                         on_evict=lambda _path, upload_id=session.upload_id: _drop_upload(upload_id))
+        _save(session)
+        print(f"📥 Started upload {session.upload_id} for '{filename}' ({size} bytes, session {session_id})")
+        return jsonify(chunk_size=CHUNK_SIZE, **session.to_dict()), 201
+
+    @server.route("/api/uploads/<upload_id>", methods=["GET"])
+    def upload_status(upload_id):
+        session = get_upload(upload_id)
+        if session is None:
+            return jsonify(error="Unknown upload id."), 404
+        return jsonify(session.to_dict())
+
+    @server.route("/api/uploads/<upload_id>", methods=["PUT"])
+    def upload_chunk(upload_id):
+        offset = request.args.get("offset", type=int)
+        length = request.content_length
+        if length is None or length > CHUNK_SIZE:
+            return jsonify(error=f"Chunks must declare a Content-Length of at most {CHUNK_SIZE} bytes."), 400
+
+        # Held across workers, so a retried chunk can't race the original on another worker
+        with shared_store.lock(f"upload:{upload_id}"):
+            session = get_upload(upload_id)
+            if session is None:
+                return jsonify(error="Unknown upload id."), 404
+            # Out-of-order or repeated chunk — tell the client where to resume from
+            if offset != session.received:
+                return jsonify(**session.to_dict()), 409
+            if session.received + length > session.size:
+                return jsonify(error="Chunk extends past the declared file size."), 400
+
+            # Active uploads stay most recently used, so abandoned ones are evicted first;
+            # held so the worker that tracks the file can't evict it mid-chunk
+            temp_store.touch(session.path)
+            written = 0
+            with temp_store.hold(session.path), span("upload_chunk") as sp, open(session.path, "r+b") as fh:
+                fh.seek(offset)
+                while True:
+                    block = request.stream.read(BLOCK_SIZE)
+                    if not block:
+                        break
+                    fh.write(block)
+                    written += len(block)
+                sp.bytes = written
+
+            if written != length:
+                # Truncated body: keep what we acknowledged before this chunk
+                return jsonify(error="Chunk body was incomplete.", **session.to_dict()), 400
+            session.received += written
+            _save(session)
+
+        if session.complete:
+            print(f"✅ Upload {upload_id} complete → {session.path}")
+        return jsonify(session.to_dict())
@@ -0,0 +1,293 @@
+import re
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+# ------------------------------------------------------------------------
+# Local pre-validation of parsed uploads against the target table schema.
+# Every check runs vectorized over Arrow batches, so a bad file is rejected
+# in milliseconds before anything is PUT or any warehouse compute is used.
+# ------------------------------------------------------------------------
+SAMPLE_ROWS = 5
+
+_INT_RANGES = {
+    "tinyint": (-2 ** 7, 2 ** 7 - 1),
+    "byte": (-2 ** 7, 2 ** 7 - 1),
+    "smallint": (-2 ** 15, 2 ** 15 - 1),
+    "short": (-2 ** 15, 2 ** 15 - 1),
+    "int": (-2 ** 31, 2 ** 31 - 1),
+    "integer": (-2 ** 31, 2 ** 31 - 1),
+    "bigint": (-2 ** 63, 2 ** 63 - 1),
+    "long": (-2 ** 63, 2 ** 63 - 1),
+}
+_FLOAT_TYPES = {"float", "real", "double"}
+_DECIMAL_RE = re.compile(r"decimal\((\d+)\s*,\s*(\d+)\)")
+
+INT_PATTERN = r"^\s*[+-]?\d+\s*$"
+FLOAT_PATTERN = r"^\s*[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?\s*$|^\s*[+-]?(inf|infinity|nan)\s*$"
+# Strings Databricks accepts in CAST(... AS BOOLEAN)
+BOOLEAN_STRINGS = pa.array(["t", "true", "y", "yes", "1", "f", "false", "n", "no", "0"])
+DATE_FORMATS = ("%Y-%m-%d",)
+TIMESTAMP_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d")
+
+
+class ColumnCheck:
+    def __init__(self, name: str, dtype: str, nullable: bool = True):
+        self.name = name
+        self.dtype = dtype
+        self.nullable = nullable
+        self.errors = {}
+        self.samples = []
+
+    def add(self, kind: str, mask, column, row_offset: int):
+        """Counts rows where ``mask`` is true under ``kind`` and keeps a few samples."""
+        count = pc.sum(pc.cast(mask, pa.int64())).as_py() or 0
+        if not count:
+            return
+        self.errors[kind] = self.errors.get(kind, 0) + count
+        if len(self.samples) < SAMPLE_ROWS:
+            indices = pc.indices_nonzero(mask)[:SAMPLE_ROWS - len(self.samples)]
+            for index, value in zip(indices.to_pylist(), pc.take(column, indices).to_pylist()):
+                # +2 turns a 0-based data row into the line number in the file (header is line 1)
+                self.samples.append({"line": row_offset + index + 2, "value": value, "error": kind})
+
+    def to_dict(self):
+        return {
+            "dtype": self.dtype,
+            "error_count": sum(self.errors.values()),
+            "errors": self.errors,
+            "samples": self.samples,
+        }
+
+
+def _non_null(column):
+    return pc.is_valid(column)
+
+
+def _is_text(column):
+    return pa.types.is_string(column.type) or pa.types.is_large_string(column.type)
+
+
+def _is_numeric(column):
+    return pa.types.is_integer(column.type) or pa.types.is_floating(column.type) or pa.types.is_decimal(column.type)
+
+
+def _regex_failures(column, pattern):
+    text = pc.cast(column, pa.string())
+    return pc.and_kleene(_non_null(column), pc.invert(pc.match_substring_regex(text, pattern)))
+
+
+def _parse_numbers(column, bad):
+    """Parses the text values that passed the regex check as float64 (nulls elsewhere)."""
+    text = pc.utf8_ltrim(pc.utf8_trim_whitespace(column), "+")
+    return pc.cast(pc.if_else(bad, pa.scalar(None, pa.string()), text), pa.float64())
+
+
+def _strptime_failures(column, formats):
+    text = pc.utf8_trim_whitespace(pc.cast(column, pa.string()))
+    parsed_any = None
+    for fmt in formats:
+        parsed = pc.is_valid(pc.strptime(text, format=fmt, unit="s", error_is_null=True))
+        parsed_any = parsed if parsed_any is None else pc.or_(parsed_any, parsed)
+    return pc.and_kleene(_non_null(column), pc.invert(parsed_any))
+
+
+def _text_out_of_range(column, bad, low, high):
+    """
+    Exact range check on integer text: compares the digits (sign and leading zeros
+    stripped) against the bound for the value's sign, by length and then by value,
+    so nothing goes through a lossy float.
+    """
+    text = pc.utf8_trim_whitespace(pc.cast(column, pa.string()))
+    negative = pc.starts_with(text, pattern="-")
+    digits = pc.utf8_ltrim(pc.utf8_ltrim(text, characters="+-"), characters="0")
+    bound = pc.if_else(negative, pa.scalar(str(-low)), pa.scalar(str(high)))
+    digits_length, bound_length = pc.utf8_length(digits), pc.utf8_length(bound)
+    overflow = pc.or_(
+        pc.greater(digits_length, bound_length),
+        pc.and_(pc.equal(digits_length, bound_length), pc.greater(digits, bound)),
+    )
+    # Values that aren't integers at all are already reported
+    return pc.and_(pc.invert(bad), overflow)
+
+
+def _numeric_out_of_range(column, low, high):
+    if pa.types.is_unsigned_integer(column.type):
+        return pc.greater(column, pa.scalar(high, column.type))
+    if pa.types.is_integer(column.type):
+        return pc.or_(pc.less(column, pa.scalar(low, pa.int64())), pc.greater(column, pa.scalar(high, pa.int64())))
+    # The bounds are -2**n and 2**n - 1, so -2**n and 2**n are exact as floats
+    numeric = pc.cast(column, pa.float64(), safe=False)
+    return pc.or_(pc.less(numeric, float(low)), pc.greater_equal(numeric, float(high + 1)))
+
+
+def _check_integer(check, column, dtype, row_offset):
+    low, high = _INT_RANGES[dtype]
+    if _is_text(column):
+        bad = _regex_failures(column, INT_PATTERN)
+        check.add("not an integer", bad, column, row_offset)
+        overflow = _text_out_of_range(column, bad, low, high)
+    elif _is_numeric(column):
+        overflow = _numeric_out_of_range(column, low, high)
+    elif pa.types.is_boolean(column.type):
+        return
+    else:
+        check.add("not an integer", _non_null(column), column, row_offset)
+        return
+    check.add("numeric overflow", pc.fill_null(overflow, False), column, row_offset)
+
+
+def _check_float(check, column, row_offset):
+    if _is_text(column):
+        check.add("not a number", _regex_failures(column, FLOAT_PATTERN), column, row_offset)
+    elif not _is_numeric(column):
+        check.add("not a number", _non_null(column), column, row_offset)
+
+
+def _check_decimal(check, column, precision, scale, row_offset):
+    if _is_text(column):
+        bad = _regex_failures(column, FLOAT_PATTERN)
+        check.add("not a number", bad, column, row_offset)
+        numeric = _parse_numbers(column, bad)
+    elif _is_numeric(column):
+        numeric = pc.cast(column, pa.float64(), safe=False)
+    else:
+        check.add("not a number", _non_null(column), column, row_offset)
+        return
+    limit = 10.0 ** (precision - scale)
+    overflow = pc.greater_equal(pc.abs(numeric), limit)
+    check.add("numeric overflow", pc.fill_null(overflow, False), column, row_offset)
+
+
+def _check_boolean(check, column, row_offset):
+    if pa.types.is_boolean(column.type):
+        return
+    text = pc.utf8_lower(pc.utf8_trim_whitespace(pc.cast(column, pa.string())))
+    bad = pc.and_kleene(_non_null(column), pc.invert(pc.is_in(text, value_set=BOOLEAN_STRINGS)))
+    check.add("not a boolean", bad, column, row_offset)
+
+
+def _check_temporal(check, column, dtype, row_offset):
+    if pa.types.is_temporal(column.type):
+        return
+    formats = DATE_FORMATS if dtype == "date" else TIMESTAMP_FORMATS
+    check.add(f"unparsable {dtype}", _strptime_failures(column, formats), column, row_offset)
+
+
+def _check_column(check, column, row_offset):
+    dtype = check.dtype.strip().lower()
+
+    if not check.nullable:
+        check.add("null in NOT NULL column", pc.is_null(column), column, row_offset)
+
+    if dtype in _INT_RANGES:
+        _check_integer(check, column, dtype, row_offset)
+    elif dtype in _FLOAT_TYPES:
+        _check_float(check, column, row_offset)
+    elif dtype == "boolean":
+        _check_boolean(check, column, row_offset)
+    elif dtype in ("date", "timestamp", "timestamp_ntz"):
+        _check_temporal(check, column, dtype, row_offset)
+    else:
+        match = _DECIMAL_RE.fullmatch(dtype)
+        if match:
+            _check_decimal(check, column, int(match.group(1)), int(match.group(2)), row_offset)
+        # Strings, binaries and complex types are left to the warehouse
+
+
+def _proven_clean(check, profile):
+    """
+    True when the upload's column profile already shows ``check`` can't fail,
+    so the column doesn't need to be read at all.
+    """
+    if profile is None:
+        return False
+    if not check.nullable and profile.nulls:
+        return False
+    if not profile.non_null:
+        return True
+
+    dtype = check.dtype.strip().lower()
+    arrow_type = profile.arrow_type
+    text_types = profile.text_types if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type) else []
+    numeric = pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type)
+    if dtype in _INT_RANGES:
+        low, high = _INT_RANGES[dtype]
+        if pa.types.is_boolean(arrow_type):
+            return True
+        return pa.types.is_integer(arrow_type) and low <= profile.min and profile.max <= high
+    if dtype in _FLOAT_TYPES:
+        return numeric or pa.types.is_decimal(arrow_type) or "double" in text_types
+    if dtype == "boolean":
+        return pa.types.is_boolean(arrow_type) or "boolean" in text_types
+    if dtype in ("date", "timestamp", "timestamp_ntz"):
+        return pa.types.is_temporal(arrow_type) or ("date" if dtype == "date" else "timestamp") in text_types
+    match = _DECIMAL_RE.fullmatch(dtype)
+    if match:
+        limit = 10.0 ** (int(match.group(1)) - int(match.group(2)))
+        return numeric and max(abs(profile.min), abs(profile.max)) < limit
+    return True
+
+
+def validate_artifact(artifact, schema_map: dict, not_null_columns=()):
+    """
+    Checks a parsed upload against ``{column: data_type}`` of the target table.
+
+    Returns a report dict with ``ok``, ``missing_columns``, ``extra_columns`` and,
+    under ``columns``, per-column error counts plus sample bad rows for every
+    column that has at least one problem. Columns the upload's profile already
+    proves clean are skipped, and only the remaining columns are read.
+    """
+    upload_columns = {name.lower(): name for name in artifact.column_names}
+    not_null = {c.lower() for c in not_null_columns}
+
+    missing = [col for col in schema_map if col.lower() not in upload_columns]
+    extra = [name for key, name in upload_columns.items() if key not in {c.lower() for c in schema_map}]
+
+    checks = {
+        col: ColumnCheck(col, dtype, nullable=col.lower() not in not_null)
+        for col, dtype in schema_map.items()
+        if col.lower() in upload_columns
+    }
+
+    profile = artifact.profile
+    pending = {
+        col: check for col, check in checks.items()
+        if not _proven_clean(check, profile.get(col) if profile is not None else None)
+    }
+
+    row_offset = 0
+    if pending:
+        read_columns = [upload_columns[col.lower()] for col in pending]
+        for batch in artifact.parquet_file().iter_batches(columns=read_columns):
+            for col, check in pending.items():
+                _check_column(check, batch.column(upload_columns[col.lower()]), row_offset)
+            row_offset += batch.num_rows
+    else:
+        row_offset = artifact.num_rows
+
+    columns = {col: check.to_dict() for col, check in checks.items()}
+    # The write selects every target column by name, so a missing one fails the load
+    ok = not missing and all(c["error_count"] == 0 for c in columns.values())
+
+    return {
+        "ok": ok,
+        "rows": row_offset,
+        "missing_columns": missing,
+        "extra_columns": extra,
+        "columns": {col: info for col, info in columns.items() if info["error_count"]},
+    }
+
+
+def summarize(report: dict, filename: str = None):
+    """One line per problem, suitable for the UI."""
+    prefix = f"'{filename}': " if filename else ""
+    lines = []
+    if report["missing_columns"]:
+        lines.append(f"{prefix}missing column(s): {', '.join(report['missing_columns'])}")
+    for col, info in report["columns"].items():
+        kinds = ", ".join(f"{n} {kind}" for kind, n in info["errors"].items())
+        sample = "; ".join(f"line {s['line']}: {s['value']!r}" for s in info["samples"][:3])
+        lines.append(f"{prefix}{col} ({info['dtype']}): {kinds} — e.g. {sample}")
+    return lines
@@ -0,0 +1,266 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from metrics import span
+from shared_store import pid_alive
+
+
+# ------------------------------------------------------------------------
+# Content-addressed staging Volume.
+# Every staged upload lives in ``<root>/<staging key>/`` where the key is
+# derived from the upload's content hash and how it was staged. A ``_SUCCESS``
+# marker is PUT last, so a LIST that shows it means the directory is complete
+# and the PUT can be skipped. A background collector REMOVEs directories that
+# haven't been used within the retention window, and the oldest ones once the
+# total goes over the size budget. With a shared store, reads in progress
+# and last-use times are visible to the collector in every server worker.
+# ------------------------------------------------------------------------
+SUCCESS_MARKER = "_SUCCESS"
+RETENTION_S = float(os.getenv("STAGING_RETENTION_S", str(24 * 3600)))
+BUDGET_BYTES = int(os.getenv("STAGING_BUDGET_BYTES", str(50 * 1024 ** 3)))
+GC_INTERVAL_S = float(os.getenv("STAGING_GC_INTERVAL_S", "600"))
+
+
+def staging_key(content_hash: str, staging_format: str, schema_map: dict = None, options=()):
+    """Identifies the staged bytes: the same upload staged the same way always gets the same key."""
+    parts = [content_hash, staging_format, *options]
+    parts += [f"{col.lower()}:{dtype}" for col, dtype in sorted((schema_map or {}).items())]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()[:32]
+
+
+class _Entry:
+    def __init__(self, key: str, size: int, last_used: float):
+        self.key = key
+        self.size = size
+        self.last_used = last_used
+        # Writes currently reading this directory; never collected while > 0
+        self.readers = 0
+
+
+class VolumeStore:
+    """Tracks content-addressed staging directories under ``root`` and garbage-collects them."""
+
+    def __init__(self, backend, root: str, retention_s=RETENTION_S, budget_bytes=BUDGET_BYTES,
+                 gc_interval_s=GC_INTERVAL_S, store=None):
+        self.backend = backend
+        self.store = store
+        self.root = root.rstrip("/")
+        self.retention_s = retention_s
+        self.budget_bytes = budget_bytes
+        self.gc_interval_s = gc_interval_s
+        self._lock = threading.Lock()
+        # Without a shared store, serializes registering readers with removing directories
+        self._remove_lock = threading.Lock()
+        self._entries = {}
+        self._gc_thread = None
+        self._adopted = False
+        self._hits = 0
+        self._misses = 0
+        self._collected = 0
+        self._collected_bytes = 0
+
+    def path(self, key: str):
+        return f"{self.root}/{key}"
+
+    # --------------------------------------------------------------------
+    # LIST / REMOVE
+    # --------------------------------------------------------------------
+    def list(self, path: str):
+        """Returns LIST rows as dicts, or [] if the path doesn't exist."""
+        try:
+            with span("volume_list"), self.backend.cursor() as cursor:
+                cursor.execute(f"LIST '{path}'")
+                return cursor.fetchall_arrow().to_pylist()
+        except Exception as e:
+            print(f"⚠️ LIST {path} failed: {e}")
+            return []
+
+    def _remove(self, path: str):
+        with self.backend.cursor() as cursor:
+            cursor.execute(f"REMOVE '{path}'")
+
+    # --------------------------------------------------------------------
+    # Lookup / record
+    # --------------------------------------------------------------------
+    def lookup(self, key: str):
+        """True if ``key`` is fully staged. Checks the Volume, so it also finds earlier runs' files."""
+        self.start_gc()
+        files = self.list(self.path(key))
+        names = {row["name"] for row in files}
+        if SUCCESS_MARKER not in names:
+            with self._lock:
+                self._misses += 1
+            return False
+        size = sum(row["size"] or 0 for row in files)
+        with self._lock:
+            entry = self._entries.setdefault(key, _Entry(key, size, time.time()))
+            entry.last_used = time.time()
+            self._hits += 1
+        self._touch_shared(key)
+        return True
+
+    def record(self, key: str, size: int):
+        """Registers a directory that was just staged (after its _SUCCESS marker)."""
+        with self._lock:
+            self._entries[key] = _Entry(key, size, time.time())
+        self._touch_shared(key)
+
+    @contextmanager
+    def reading(self, *keys):
+        """
+        Protects staged directories from collection while a write reads them. Enter it
+        before lookup(), so a directory found complete can't be removed before the write.
+        """
+        token = uuid.uuid4().hex
+        for key in keys:
+            # Under the key's guard, so the collector either sees this reader or finishes removing first
+            with self._guard(key):
+                with self._lock:
+                    self._entries.setdefault(key, _Entry(key, 0, time.time())).readers += 1
+                if self.store is not None:
+                    self.store.set("staging_readers", f"{key}/{token}", os.getpid(), ttl_s=self.retention_s)
+        try:
+            yield
+        finally:
+            with self._lock:
+                for key in keys:
+                    entry = self._entries.get(key)
+                    if entry is not None:
+                        entry.readers -= 1
+                        entry.last_used = time.time()
+            if self.store is not None:
+                for key in keys:
+                    self.store.delete("staging_readers", f"{key}/{token}")
+                    self._touch_shared(key)
+
+    @contextmanager
+    def _guard(self, key: str):
+        """Held while registering a reader of ``key`` or removing its directory, across every worker."""
+        if self.store is None:
+            with self._remove_lock:
+                yield
+        else:
+            with self.store.lock(f"staging:{key}"):
+                yield
+
+    def _busy(self, key: str):
+        """True if any worker is reading ``key`` right now."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.readers:
+                return True
+        if self.store is None:
+            return False
+        return any(pid_alive(pid) for _, pid in self.store.items("staging_readers", f"{key}/"))
+
+    def _touch_shared(self, key: str):
+        if self.store is not None:
+            self.store.set("staging_used", key, time.time(), ttl_s=self.retention_s)
+
+    def _shared_usage(self):
+        """Keys other workers are reading right now, and when each key was last used by any worker."""
+        if self.store is None:
+            return set(), {}
+        busy = {
+            lease.rsplit("/", 1)[0] for lease, pid in self.store.items("staging_readers") if pid_alive(pid)
+        }
+        return busy, dict(self.store.items("staging_used"))
+
+    # --------------------------------------------------------------------
+    # Garbage collection
+    # --------------------------------------------------------------------
+    def start_gc(self):
+        """Starts the background collector on first use, so importing never touches the warehouse."""
+        with self._lock:
+            if self._gc_thread is not None or self.gc_interval_s <= 0:
+                return
+            self._gc_thread = threading.Thread(target=self._gc_loop, name="staging-gc", daemon=True)
+        self._gc_thread.start()
+
+    def _gc_loop(self):
+        while True:
+            time.sleep(self.gc_interval_s)
+            try:
+                self.collect_garbage()
+            except Exception as e:
+                print(f"⚠️ Staging garbage collection failed: {e}")
+
+    def _adopt_existing(self):
+        """Picks up directories staged by earlier runs, dated by their newest file."""
+        for row in self.list(self.root):
+            if not row["name"].endswith("/"):
+                continue
+            key = row["name"].rstrip("/")
+            with self._lock:
+                if key in self._entries:
+                    continue
+            files = self.list(self.path(key))
+            newest = max((row["modification_time"] or 0 for row in files), default=0) / 1000
+            with self._lock:
+                self._entries.setdefault(key, _Entry(key, sum(r["size"] or 0 for r in files), newest))
+        self._adopted = True
+
+    def collect_garbage(self, now: float = None):
+        """REMOVEs expired directories, then the least recently used until under budget."""
+        if not self._adopted:
+            self._adopt_existing()
+        now = now or time.time()
+        busy, shared_used = self._shared_usage()
+        with self._lock:
+            for entry in self._entries.values():
+                entry.last_used = max(entry.last_used, shared_used.get(entry.key, 0))
+            candidates = sorted((e for e in self._entries.values() if not e.readers and e.key not in busy),
+                                key=lambda e: e.last_used)
+            total = sum(e.size for e in self._entries.values())
+            doomed = []
+            for entry in candidates:
+                if now - entry.last_used > self.retention_s or total > self.budget_bytes:
+                    doomed.append(entry)
+                    total -= entry.size
+                    # Removed from the table first so lookups stop handing it out
+                    del self._entries[entry.key]
+
+        collected = sum(self._remove_directory(entry) for entry in doomed)
+        if collected:
+            print(f"🧹 Collected {collected} staged upload(s) from {self.root}")
+        return collected
+
+    def _remove_directory(self, entry):
+        directory = self.path(entry.key)
+        with self._guard(entry.key):
+            if self._busy(entry.key):
+                # A write started reading it after the collector picked it; keep it
+                with self._lock:
+                    current = self._entries.setdefault(entry.key, entry)
+                    current.size = max(current.size, entry.size)
+                return False
+            files = sorted(self.list(directory), key=lambda row: row["name"] != SUCCESS_MARKER)
+            try:
+                with span("volume_remove", bytes_=entry.size):
+                    # The marker goes first so the directory never looks complete while half-deleted
+                    for row in files:
+                        self._remove(f"{directory}/{row['name']}")
+                    self._remove(directory)
+            except Exception as e:
+                print(f"⚠️ Could not remove {directory}: {e}")
+                return False
+        with self._lock:
+            self._collected += 1
+            self._collected_bytes += entry.size
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(e.size for e in self._entries.values()),
+                "budget_bytes": self.budget_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "collected": self._collected,
+                "collected_bytes": self._collected_bytes,
+            }
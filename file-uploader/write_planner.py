@@ -0,0 +1,197 @@
+import threading
+from collections import defaultdict
+
+
+# ------------------------------------------------------------------------
+# Write planning.
+# Each write mode becomes the smallest list of SQL statements that does the
+# job: read_files(...) — or, for small uploads, a parameterized VALUES table —
+# is inlined straight into INSERT/MERGE, so there is no temp view to create
+# and drop, and the target schema comes from the cache.
+# ------------------------------------------------------------------------
+WRITE_MODES = ("append", "overwrite", "replace", "merge")
+
+
+def quote_ident(name: str):
+    return "`" + name.replace("`", "``") + "`"
+
+
+def cast_select(schema_map: dict, source_sql: str, alias: str = "s"):
+    """``SELECT CAST(s.col AS type) AS col, ... FROM <source> AS s`` aligned to the target schema."""
+    cast_exprs = ", ".join(
+        f"CAST({alias}.{quote_ident(col)} AS {dtype}) AS {quote_ident(col)}"
+        for col, dtype in schema_map.items()
+    )
+    return f"SELECT {cast_exprs} FROM {source_sql} AS {alias}"
+
+
+def values_source(columns: list, num_rows: int):
+    """
+    An inline ``VALUES`` table with one named parameter marker per cell
+    (``:p<row>_<column>``), usable anywhere a read_files(...) source is.
+    Pair it with values_parameters().
+    """
+    rows = ", ".join(
+        "(" + ", ".join(f":p{r}_{c}" for c in range(len(columns))) + ")" for r in range(num_rows)
+    )
+    names = ", ".join(quote_ident(col) for col in columns)
+    return f"(SELECT * FROM VALUES {rows} AS v({names}))"
+
+
+def values_parameters(rows: list):
+    """Named parameters for values_source(): ``{"p<row>_<column>": value}``."""
+    return {f"p{r}_{c}": value for r, row in enumerate(rows) for c, value in enumerate(row)}
+
+
+def plan_append(target_table: str, source_sql: str, schema_map: dict):
+    return [f"INSERT INTO {target_table} {cast_select(schema_map, source_sql)}"]
+
+
+def plan_overwrite(target_table: str, source_sql: str, schema_map: dict):
+    # One atomic statement: readers keep seeing the old rows until the new ones commit,
+    # and a failed load leaves the table as it was
+    return [f"INSERT OVERWRITE {target_table} {cast_select(schema_map, source_sql)}"]
+
+
+def plan_replace(target_table: str, source_sql: str, schema_map: dict, replace_where: str):
+    """Atomically replaces only the rows matching ``replace_where`` (e.g. the upload's partitions)."""
+    return [f"INSERT INTO {target_table} REPLACE WHERE {replace_where} {cast_select(schema_map, source_sql)}"]
+
+
+def sql_literal(value, dtype: str):
+    """Renders a Python value as a literal of the target column type."""
+    text = str(value).replace("\\", "\\\\").replace("'", "\\'")
+    return f"CAST('{text}' AS {dtype})"
+
+
+def pruning_predicates(schema_map: dict, key_bounds: dict = None, partition_values: dict = None, alias: str = "t",
+                       null_columns=()):
+    """
+    Extra ON-clause conditions on the target that let the warehouse skip files:
+    a BETWEEN range per merge key and an IN list per partition column. Partition
+    columns in ``null_columns`` also match NULL, so the upload's rows with a NULL
+    partition still find their target rows.
+    """
+    null_columns = {col.lower() for col in null_columns}
+    predicates = []
+    for col, (low, high) in (key_bounds or {}).items():
+        if low is None or high is None:
+            continue
+        dtype = schema_map[col]
+        predicates.append(
+            f"{alias}.{quote_ident(col)} BETWEEN {sql_literal(low, dtype)} AND {sql_literal(high, dtype)}"
+        )
+    for col, values in (partition_values or {}).items():
+        if not values:
+            continue
+        dtype = schema_map[col]
+        literals = ", ".join(sql_literal(v, dtype) for v in values)
+        predicate = f"{alias}.{quote_ident(col)} IN ({literals})"
+        if col.lower() in null_columns:
+            predicate = f"({predicate} OR {alias}.{quote_ident(col)} IS NULL)"
+        predicates.append(predicate)
+    return predicates
+
+
+def replace_predicate(schema_map: dict, column_values: dict = None, column_bounds: dict = None, null_columns=()):
+    """
+    The REPLACE WHERE predicate covering an upload: an IN list per column from
+    ``column_values``, a BETWEEN range per column from ``column_bounds``. Columns
+    in ``null_columns`` also match NULL, since every inserted row must satisfy it.
+    """
+    null_columns = {col.lower() for col in null_columns}
+    predicates = []
+    for col, values in (column_values or {}).items():
+        literals = ", ".join(sql_literal(v, schema_map[col]) for v in values)
+        predicates.append((col, f"{quote_ident(col)} IN ({literals})" if values else None))
+    for col, (low, high) in (column_bounds or {}).items():
+        dtype = schema_map[col]
+        in_range = f"{quote_ident(col)} BETWEEN {sql_literal(low, dtype)} AND {sql_literal(high, dtype)}"
+        predicates.append((col, in_range if low is not None else None))
+
+    clauses = []
+    for col, predicate in predicates:
+        if col.lower() in null_columns:
+            is_null = f"{quote_ident(col)} IS NULL"
+            predicate = f"({predicate} OR {is_null})" if predicate else is_null
+        if predicate is None:
+            raise ValueError(f"Column '{col}' has no values in the upload to replace by.")
+        clauses.append(predicate)
+    if not clauses:
+        raise ValueError("At least one column is required to build a REPLACE WHERE predicate.")
+    return " AND ".join(clauses)
+
+
+def plan_merge(target_table: str, source_sql: str, schema_map: dict, merge_keys: list, prune_predicates=(),
+               delete_column: str = None):
+    conditions = [f"t.{quote_ident(key)} = s.{quote_ident(key)}" for key in merge_keys]
+    conditions.extend(prune_predicates)
+    on_clause = "\n  AND ".join(conditions)
+    if delete_column:
+        # Source rows flagged in delete_column remove the matching target row
+        flag = f"s.{quote_ident(delete_column)}"
+        columns = ", ".join(quote_ident(col) for col in schema_map)
+        updates = ", ".join(f"t.{quote_ident(col)} = s.{quote_ident(col)}" for col in schema_map)
+        values = ", ".join(f"s.{quote_ident(col)}" for col in schema_map)
+        return [
+            f"""MERGE INTO {target_table} AS t
+USING ({cast_select({**schema_map, delete_column: "boolean"}, source_sql)}) AS s
+ON {on_clause}
+WHEN MATCHED AND {flag} THEN DELETE
+WHEN MATCHED THEN UPDATE SET {updates}
+WHEN NOT MATCHED AND NOT {flag} THEN INSERT ({columns}) VALUES ({values})"""
+        ]
+    return [
+        f"""MERGE INTO {target_table} AS t
+USING ({cast_select(schema_map, source_sql)}) AS s
+ON {on_clause}
+WHEN MATCHED THEN UPDATE SET *
+WHEN NOT MATCHED THEN INSERT *"""
+    ]
+
+
+def plan_write(write_mode: str, target_table: str, source_sql: str, schema_map: dict, merge_keys=None,
+               prune_predicates=(), delete_column: str = None, replace_where: str = None):
+    """Returns the SQL statements for ``write_mode``, in execution order."""
+    if write_mode == "append":
+        return plan_append(target_table, source_sql, schema_map)
+    if write_mode == "overwrite":
+        return plan_overwrite(target_table, source_sql, schema_map)
+    if write_mode == "replace":
+        if not replace_where:
+            raise ValueError("A REPLACE WHERE predicate is required for replace writes.")
+        return plan_replace(target_table, source_sql, schema_map, replace_where)
+    if write_mode == "merge":
+        if not merge_keys:
+            raise ValueError("At least one merge key is required for merge writes.")
+        if isinstance(merge_keys, str):
+            merge_keys = [merge_keys]
+        return plan_merge(target_table, source_sql, schema_map, merge_keys, prune_predicates, delete_column)
+    raise ValueError(f"Unsupported write mode '{write_mode}'. Use one of {WRITE_MODES}.")
+
+
+class WriteStats:
+    """Per-mode counters for how many statements and how much warehouse time each write costs."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._modes = defaultdict(lambda: {"writes": 0, "failures": 0, "statements": 0, "warehouse_s": 0.0})
+
+    def record(self, write_mode: str, statements: int, warehouse_s: float, failed: bool = False):
+        with self._lock:
+            mode = self._modes[write_mode]
+            mode["writes"] += 1
+            mode["failures"] += int(failed)
+            mode["statements"] += statements
+            mode["warehouse_s"] += warehouse_s
+
+    def summary(self):
+        with self._lock:
+            return {
+                name: {
+                    **mode,
+                    "statements_per_write": round(mode["statements"] / mode["writes"], 2),
+                    "avg_latency_ms": round(1000 * mode["warehouse_s"] / mode["writes"], 1),
+                }
+                for name, mode in self._modes.items()
+            }